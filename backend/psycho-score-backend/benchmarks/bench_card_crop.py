@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Measure card detection and cropping on the sample cards
+
+Runs every sample card through the detector twice: as-is (a full-frame card,
+which must be left alone) and as a synthetic phone photo (the card shrunk,
+rotated and placed on a noisy desk). Reports detection + crop time and the
+pixels, upload bytes and estimated image tokens sent to Gemini with and
+without cropping. Upload bytes are lossless WebP, which is what the Gemini
+SDK sends for in-memory images. No API calls are made.
+
+Usage (from the backend directory):
+    python benchmarks/bench_card_crop.py
+    python benchmarks/bench_card_crop.py my_photo.jpg --runs 20
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+
+from services.usage import estimate_image_tokens  # noqa: E402
+from utils.card_detection import crop_to_cards  # noqa: E402
+from utils.image_processing import image_processor  # noqa: E402
+
+SAMPLE_CARDS = [
+    os.path.join(BACKEND_DIR, "Psycho_ScoreRated_by_Bateman.png"),
+    os.path.join(BACKEND_DIR, "Psycho_ScoreRated_by_Bateman_1.png"),
+]
+
+
+def phone_photo(card: Image.Image, seed: int = 0) -> bytes:
+    """JPEG of the card at ~45% width, tilted 6 degrees on a wood-colored desk"""
+    rng = np.random.default_rng(seed)
+    width, height = 4000, 3000
+    desk = np.array([118, 84, 52]) + rng.normal(0, 14, (height // 4, width // 4, 3))
+    photo = Image.fromarray(np.clip(desk, 0, 255).astype(np.uint8))
+    photo = photo.resize((width, height)).filter(ImageFilter.GaussianBlur(2))
+
+    scale = 0.45 * width / card.width
+    tilted = card.convert("RGBA").resize(
+        (int(card.width * scale), int(card.height * scale))
+    )
+    tilted = tilted.rotate(6, expand=True, resample=Image.Resampling.BICUBIC)
+    photo.paste(
+        tilted, ((width - tilted.width) // 2, (height - tilted.height) // 2), tilted
+    )
+
+    output = io.BytesIO()
+    photo.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def upload_bytes(image: Image.Image) -> int:
+    output = io.BytesIO()
+    image.save(output, format="webp", lossless=True)
+    return output.tell()
+
+
+def bench(image_data: bytes, runs: int) -> dict:
+    full = image_processor.prepare_for_analysis(image_data)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        (cropped,), regions = crop_to_cards(full)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "cropped": bool(regions),
+        "crop_ms": statistics.median(timings) * 1000,
+        "pixels": (full.width * full.height, cropped.width * cropped.height),
+        "bytes": (upload_bytes(full), upload_bytes(cropped)),
+        "tokens": (estimate_image_tokens(full.size), estimate_image_tokens(cropped.size)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("images", nargs="*", default=SAMPLE_CARDS)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    cases = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            image_data = f.read()
+        name = os.path.basename(path)
+        cases.append((name, image_data))
+        if path in SAMPLE_CARDS:
+            card = Image.open(io.BytesIO(image_data)).convert("RGB")
+            cases.append((f"{name} (photo)", phone_photo(card)))
+
+    print(f"✂️  Card crop: {len(cases)} images x {args.runs} runs")
+    print("=" * 96)
+    print(
+        f"{'image':<44}{'crop':>6}{'ms':>7}{'Mpx':>13}{'upload KB':>15}{'tokens':>11}"
+    )
+    print("-" * 96)
+
+    for name, image_data in cases:
+        result = bench(image_data, args.runs)
+        pixels_before, pixels_after = result["pixels"]
+        bytes_before, bytes_after = result["bytes"]
+        tokens_before, tokens_after = result["tokens"]
+        print(
+            f"{name:<44}{'yes' if result['cropped'] else 'no':>6}"
+            f"{result['crop_ms']:>7.1f}"
+            f"{pixels_before / 1e6:>6.2f}→{pixels_after / 1e6:<6.2f}"
+            f"{bytes_before / 1024:>7.0f}→{bytes_after / 1024:<7.0f}"
+            f"{tokens_before:>5}→{tokens_after:<5}"
+        )
+        if result["cropped"]:
+            print(
+                f"{'':<44}{'':>13}  -{1 - pixels_after / pixels_before:.0%} pixels, "
+                f"-{1 - bytes_after / bytes_before:.0%} bytes, "
+                f"-{1 - tokens_after / tokens_before:.0%} image tokens"
+            )
+
+
+if __name__ == "__main__":
+    main()
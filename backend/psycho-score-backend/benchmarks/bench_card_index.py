@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Measure near-duplicate lookups in the perceptual hash card index
+
+Builds an index of random 64-bit hashes in a temporary directory, then
+reports rebuild time, mmap load time, and search latency of the multi-index
+hash against a linear Hamming scan, with queries a few bits away from a
+stored hash. No API calls are made.
+
+Usage (from the backend directory):
+    python benchmarks/bench_card_index.py
+    python benchmarks/bench_card_index.py --size 5000000 --distance 6
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+
+from services.card_index import CardIndex, hamming_distances  # noqa: E402
+
+
+def timed(fn, runs):
+    """Median and p99 latency of fn in milliseconds"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--distance", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2**64, args.size, dtype=np.uint64, endpoint=False)
+    rows = [(i + 1, int(h), f"{i:032x}", 5.0) for i, h in enumerate(hashes)]
+
+    # Queries: stored hashes with a few random bits flipped
+    targets = rng.integers(0, args.size, args.queries)
+    queries = []
+    for target in targets:
+        flips = rng.choice(64, rng.integers(1, args.distance + 1), replace=False)
+        queries.append(int(hashes[target]) ^ sum(1 << int(bit) for bit in flips))
+
+    print(f"🗂️  Card index: {args.size:,} hashes, distance <= {args.distance}")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as path:
+        index = CardIndex(path)
+        start = time.perf_counter()
+        index._rebuild(rows)
+        print(f"{'rebuild + save':<28}{time.perf_counter() - start:>10.2f} s")
+
+        start = time.perf_counter()
+        index = CardIndex(path)
+        print(f"{'mmap load':<28}{(time.perf_counter() - start) * 1000:>10.2f} ms")
+
+        found = sum(
+            any(m.history_id == f"{t:032x}" for m in index.search(q, args.distance))
+            for q, t in zip(queries, targets)
+        )
+
+        query = iter(queries * 2)
+        p50, p99 = timed(lambda: index.search(next(query), args.distance), args.queries)
+        print(f"{'multi-index search p50/p99':<28}{p50:>10.3f} / {p99:.3f} ms")
+
+        stored = np.asarray(index._arrays["hashes"])
+        query = iter(queries)
+        p50, p99 = timed(
+            lambda: np.flatnonzero(hamming_distances(stored, next(query)) <= args.distance),
+            min(args.queries, 50),
+        )
+        print(f"{'linear scan p50/p99':<28}{p50:>10.3f} / {p99:.3f} ms")
+        print(f"{'recall':<28}{found / len(queries):>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Measure conditional image enhancement against the old unconditional passes
+
+Runs every sample card as-is and as degraded copies (dim, noisy, and a
+low-light phone shot that is both) through the quality assessment, the old
+enhancement (contrast, sharpness and a 3x3 median filter on every image) and
+the conditional one. Reports CPU time per image, whether enhancement was
+applied, and how far the provisional score and design features of each copy
+land from the clean card with and without enhancement. With --gemini N every
+copy is also scored N times by the live Gemini API (GEMINI_API_KEY from .env),
+with and without enhancement, reporting parse rate and psycho score spread.
+
+Usage (from the backend directory):
+    python benchmarks/bench_enhancement.py
+    python benchmarks/bench_enhancement.py my_card.jpg --runs 20 --gemini 3
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+
+from models.schemas import BusinessCardAnalysis  # noqa: E402
+from utils.image_processing import (  # noqa: E402
+    extract_design_features,
+    image_processor,
+    provisional_psycho_score,
+)
+
+SAMPLE_CARDS = [
+    os.path.join(BACKEND_DIR, "Psycho_ScoreRated_by_Bateman.png"),
+    os.path.join(BACKEND_DIR, "Psycho_ScoreRated_by_Bateman_1.png"),
+]
+
+
+def dim(image: Image.Image) -> Image.Image:
+    """Underexposed and washed out, as under a desk lamp"""
+    image = ImageEnhance.Contrast(image).enhance(0.4)
+    return ImageEnhance.Brightness(image).enhance(0.7)
+
+
+def noisy(image: Image.Image, sigma: float = 12, seed: int = 0) -> Image.Image:
+    """Sensor noise of a high-ISO shot"""
+    rng = np.random.default_rng(seed)
+    pixels = np.asarray(image, dtype=np.float32) + rng.normal(0, sigma, (image.height, image.width, 1))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+VARIANTS = {
+    "clean": lambda image: image,
+    "dim": dim,
+    "noisy": noisy,
+    "low_light": lambda image: noisy(dim(image)),
+}
+
+
+def legacy_enhance(image: Image.Image) -> Image.Image:
+    """The enhancement previously applied to every image"""
+    image = ImageEnhance.Contrast(image).enhance(1.2)
+    image = ImageEnhance.Sharpness(image).enhance(1.1)
+    return image.filter(ImageFilter.MedianFilter(size=3))
+
+
+def median_ms(fn, image: Image.Image, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(image)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def feature_drift(features: dict, reference: dict) -> float:
+    """Largest absolute difference of the 0-1 design features (all but palette_size)"""
+    return max(
+        abs(features[name] - reference[name]) for name in reference if name != "palette_size"
+    )
+
+
+def bench(image: Image.Image, reference: dict, runs: int) -> dict:
+    quality = image_processor.assess_image_quality(image)
+    enhanced = image_processor.enhance_image_for_analysis(image, quality)
+    raw_features = extract_design_features(image)
+    enhanced_features = extract_design_features(enhanced)
+    reference_score = provisional_psycho_score(reference)
+
+    return {
+        "range": quality.dynamic_range,
+        "noise": quality.noise,
+        "applied": quality.needs_enhancement,
+        "assess_ms": median_ms(image_processor.assess_image_quality, image, runs),
+        "legacy_ms": median_ms(legacy_enhance, image, runs),
+        "enhance_ms": median_ms(image_processor.enhance_image_for_analysis, image, runs),
+        "score_shift": (
+            provisional_psycho_score(raw_features) - reference_score,
+            provisional_psycho_score(enhanced_features) - reference_score,
+        ),
+        "feature_drift": (
+            feature_drift(raw_features, reference),
+            feature_drift(enhanced_features, reference),
+        ),
+    }
+
+
+async def bench_gemini(image: Image.Image, runs: int) -> dict:
+    """Score one image `runs` times with the live API"""
+    from services.gemini_service import gemini_service
+
+    scores, parsed = [], 0
+    for _ in range(runs):
+        response = await gemini_service._generate("analysis", "full", [image])
+        data = gemini_service._parse_json_response(response.text)
+        try:
+            scores.append(BusinessCardAnalysis(**data).psycho_score)
+            parsed += 1
+        except Exception:
+            pass
+
+    return {
+        "parse_rate": parsed / runs,
+        "mean": statistics.mean(scores) if scores else float("nan"),
+        "stdev": statistics.pstdev(scores) if scores else float("nan"),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("images", nargs="*", default=SAMPLE_CARDS)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--gemini", type=int, default=0, metavar="N",
+                        help="Also score every copy N times with the live Gemini API")
+    args = parser.parse_args()
+
+    print(f"📊 Image enhancement: {len(args.images)} cards x {len(VARIANTS)} variants, {args.runs} runs")
+    print("=" * 100)
+    print(
+        f"{'card':<36}{'variant':<11}{'range':>7}{'noise':>8}{'applied':>9}"
+        f"{'assess':>8}{'old':>8}{'new':>8}{'score Δ raw/enh':>18}{'drift raw/enh':>16}"
+    )
+    print("-" * 100)
+
+    degraded = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            card = image_processor.prepare_for_analysis(f.read())
+        reference = extract_design_features(card)
+        for name, degrade in VARIANTS.items():
+            image = degrade(card)
+            degraded.append((os.path.basename(path), name, image))
+            result = bench(image, reference, args.runs)
+            print(
+                f"{os.path.basename(path)[:35]:<36}{name:<11}{result['range']:>7.2f}"
+                f"{result['noise']:>8.3f}{'yes' if result['applied'] else 'no':>9}"
+                f"{result['assess_ms']:>6.1f}ms{result['legacy_ms']:>6.0f}ms{result['enhance_ms']:>6.1f}ms"
+                f"{result['score_shift'][0]:>+9.1f}/{result['score_shift'][1]:<+8.1f}"
+                f"{result['feature_drift'][0]:>8.3f}/{result['feature_drift'][1]:<7.3f}"
+            )
+
+    if not args.gemini:
+        return
+
+    print()
+    print(f"🤖 Gemini psycho score, {args.gemini} runs per copy")
+    print("-" * 100)
+    print(f"{'card':<36}{'variant':<11}{'parsed raw/enh':>16}{'mean raw/enh':>16}{'stdev raw/enh':>16}")
+    for card_name, name, image in degraded:
+        enhanced = image_processor.enhance_image_for_analysis(image)
+        raw = await bench_gemini(image, args.gemini)
+        enh = raw if enhanced is image else await bench_gemini(enhanced, args.gemini)
+        print(
+            f"{card_name[:35]:<36}{name:<11}"
+            f"{raw['parse_rate']:>8.0%}/{enh['parse_rate']:<7.0%}"
+            f"{raw['mean']:>8.1f}/{enh['mean']:<7.1f}"
+            f"{raw['stdev']:>8.2f}/{enh['stdev']:<7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
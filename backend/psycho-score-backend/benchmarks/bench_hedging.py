@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Measure how request hedging trims the latency tail of a slow upstream
+
+Simulates an upstream whose latency is mostly fast with an occasional long
+stall (a mixture like the Gemini and ElevenLabs tails), then runs the same
+sequence of calls with hedging off and on. Reports p50/p90/p99 latency and
+the extra request rate the hedges cost. No API calls are made.
+
+Usage (from the backend directory):
+    python benchmarks/bench_hedging.py
+    python benchmarks/bench_hedging.py --percentile 95 --budget 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+
+from config.settings import settings  # noqa: E402
+from services.hedging import Hedger  # noqa: E402
+from utils.metrics import metrics  # noqa: E402
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def run(args, hedging: bool) -> dict:
+    settings.HEDGING_ENABLED = hedging
+    settings.HEDGE_BUDGET_RATIO = args.budget
+    settings.HEDGE_PERCENTILE = args.percentile
+    metrics.histograms.clear()
+    metrics.counters.clear()
+    hedger = Hedger()
+    rng = random.Random(0)
+    attempts = 0
+
+    async def upstream():
+        nonlocal attempts
+        attempts += 1
+        # Latency in ms: lognormal around --median, with rare long stalls
+        latency = rng.lognormvariate(0, 0.25) * args.median
+        if rng.random() < args.stall_rate:
+            latency *= args.stall_factor
+        await asyncio.sleep(latency / 1000)
+
+    async def client(count):
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            await hedger.call("bench", upstream)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    # A few concurrent clients, like overlapping requests on one worker
+    per_client = args.calls // args.concurrency
+    results = await asyncio.gather(*(client(per_client) for _ in range(args.concurrency)))
+    latencies = [latency for result in results for latency in result]
+
+    return {
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+        "extra": attempts / len(latencies) - 1,
+        "fired": metrics.counters.get("hedge.bench.fired", 0),
+        "won": metrics.counters.get("hedge.bench.won", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--median", type=float, default=20.0, help="ms")
+    parser.add_argument("--stall-rate", type=float, default=0.03)
+    parser.add_argument("--stall-factor", type=float, default=10.0)
+    parser.add_argument("--budget", type=float, default=settings.HEDGE_BUDGET_RATIO)
+    parser.add_argument("--percentile", type=float, default=settings.HEDGE_PERCENTILE)
+    args = parser.parse_args()
+
+    print(
+        f"🪝 Hedging: {args.calls} calls, {args.stall_rate:.0%} stall x{args.stall_factor:g}, "
+        f"hedge at p{args.percentile:g}, budget {args.budget:.0%}"
+    )
+    print("=" * 72)
+    print(f"{'':<12}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'extra':>10}{'fired/won':>14}")
+    print("-" * 72)
+    for label, hedging in (("unhedged", False), ("hedged", True)):
+        result = asyncio.run(run(args, hedging))
+        print(
+            f"{label:<12}{result['p50']:>10.1f}{result['p90']:>10.1f}{result['p99']:>10.1f}"
+            f"{result['extra']:>10.1%}{result['fired']:>8.0f}/{result['won']:<5.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Compare the full and compact Gemini prompt variants
+
+Sends each sample card through every prompt variant several times and reports
+prompt size, input tokens, latency and JSON parse success rate.
+Calls the live Gemini API (GEMINI_API_KEY from .env).
+
+Usage (from the backend directory):
+    python benchmarks/bench_prompt_variants.py
+    python benchmarks/bench_prompt_variants.py my_card.jpg --runs 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+
+from models.schemas import BusinessCardAnalysis  # noqa: E402
+from services.gemini_service import gemini_service  # noqa: E402
+from services.prompts import PROMPTS, PROMPT_VARIANTS  # noqa: E402
+from utils.image_processing import image_processor  # noqa: E402
+
+SAMPLE_CARDS = [
+    os.path.join(BACKEND_DIR, "Psycho_ScoreRated_by_Bateman.png"),
+    os.path.join(BACKEND_DIR, "Psycho_ScoreRated_by_Bateman_1.png"),
+]
+
+
+async def bench_variant(variant, images, runs):
+    """Run every image `runs` times through one prompt variant"""
+    input_tokens, latencies, parsed = [], [], 0
+
+    for image in images:
+        for _ in range(runs):
+            start = time.perf_counter()
+            response = await gemini_service._generate("analysis", variant, [image])
+            latencies.append(time.perf_counter() - start)
+            input_tokens.append(response.usage_metadata.prompt_token_count)
+
+            data = gemini_service._parse_json_response(response.text)
+            try:
+                BusinessCardAnalysis(**data)
+                parsed += 1
+            except Exception:
+                pass
+
+    prompt_tokens = gemini_service.models["strong"].count_tokens(
+        PROMPTS["analysis"][variant]
+    ).total_tokens
+
+    return {
+        "prompt_chars": len(PROMPTS["analysis"][variant]),
+        "prompt_tokens": prompt_tokens,
+        "input_tokens": statistics.mean(input_tokens),
+        "latency_p50": statistics.median(latencies),
+        "latency_max": max(latencies),
+        "parse_rate": parsed / len(latencies),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("images", nargs="*", default=SAMPLE_CARDS)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    images = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            images.append(image_processor.prepare_for_analysis(f.read()))
+
+    print(f"📊 Prompt variants: {len(images)} cards x {args.runs} runs")
+    print("=" * 80)
+    print(
+        f"{'variant':<10}{'chars':>8}{'prompt tok':>12}{'input tok':>12}"
+        f"{'p50 (s)':>10}{'max (s)':>10}{'parsed':>10}"
+    )
+    print("-" * 80)
+
+    for variant in PROMPT_VARIANTS:
+        result = await bench_variant(variant, images, args.runs)
+        print(
+            f"{variant:<10}{result['prompt_chars']:>8}{result['prompt_tokens']:>12}"
+            f"{result['input_tokens']:>12.0f}{result['latency_p50']:>10.2f}"
+            f"{result['latency_max']:>10.2f}{result['parse_rate']:>10.0%}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Measure response serialization time and payload size, before and after orjson
+
+Builds realistic /api/analyze responses from a sample card (single card with
+its cardImage, a six-card photo, a battle) and serializes each the way
+FastAPI does for a returned dict (jsonable_encoder, then JSONResponse) and
+the way the routes do now (ORJSONResponse), plus sparse ?fields= selections.
+Sparse rows include the cardImage JPEG encode that the pipeline now skips
+when the field is not requested. No API calls are made.
+
+Usage (from the backend directory):
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --runs 500
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+
+from utils.image_processing import encode_data_url, image_processor  # noqa: E402
+from utils.serialization import select_fields  # noqa: E402
+
+SAMPLE_CARD = os.path.join(BACKEND_DIR, "Psycho_ScoreRated_by_Bateman.png")
+
+ANALYSIS = {
+    "card_quality": "Bone-colored stock with a subtle eggshell finish. Impressive.",
+    "design_elements": {"layout": "Centered, generous margins", "whitespace": "Masterful"},
+    "typography": {"font_family": "Silian Rail", "hierarchy": "Name, then title"},
+    "color_scheme": {"palette": "Off-white and black", "contrast": "Restrained"},
+    "layout_quality": "Balanced and quiet, nothing fights for attention.",
+    "material_impression": "Heavy stock, possibly letterpress.",
+    "patrick_critique": "Look at that subtle off-white coloring. The tasteful thickness "
+    "of it. Oh my God, it even has a watermark.",
+    "psycho_score": 8.7,
+}
+FEATURES = {
+    "palette_size": 3, "colorfulness": 0.0348, "mean_brightness": 0.8379,
+    "rms_contrast": 0.1305, "dynamic_range": 0.5969, "whitespace_ratio": 0.829,
+    "margin_ratio": 0.3074, "edge_density": 0.076, "symmetry_horizontal": 0.9668,
+    "symmetry_vertical": 0.9394,
+}
+
+
+def card_response(card_image) -> dict:
+    return {
+        **ANALYSIS,
+        "audio_url": "/audio/psycho_analysis_5de526444242f77f4d8073e4b8a90c94.mp3",
+        "audio_duration": 14.837,
+        "provisional_score": 8.2,
+        "design_features": FEATURES,
+        "near_duplicate": None,
+        "model_tier": {"tier": "strong", "escalations": []},
+        "analysis_details": {
+            key: ANALYSIS[key]
+            for key in ("typography", "color_scheme", "design_elements", "material_impression")
+        },
+        "cardImage": encode_data_url(card_image),
+    }
+
+
+def multi_card_response(card_image, count: int = 6) -> dict:
+    region = {"corners": [[10.0, 10.0], [410.0, 12.0], [408.0, 260.0], [9.0, 258.0]],
+              "area_ratio": 0.12, "fill_ratio": 0.97}
+    card = {**ANALYSIS, "provisional_score": 8.2, "design_features": FEATURES,
+            "card_region": region, "near_duplicate": None}
+    return {**card_response(card_image), "cards": [card] * count, "best_card": 0}
+
+
+def battle_response() -> dict:
+    card = {"strengths": "Raised lettering, pale nimbus", "weaknesses": "None", "psycho_score": 9.1}
+    return {
+        "battle_result": {
+            "verdict": "ALPHA", "winner": "original",
+            "announcement": "ALPHA! The challenger card dominates with superior sophistication.",
+            "audio_url": "/audio/psycho_analysis_6a63c645cd5f811f50b76d95650b02b8.mp3",
+            "audio_duration": 6.2,
+        },
+        "detailed_analysis": {"original_card": card, "contender_card": card,
+                              "patrick_comparison": "Look at that subtle off-white coloring.",
+                              "winner_reasoning": "Superior design execution"},
+        "scores": {"original_score": 9.1, "contender_score": 7.4},
+        "model_tier": {"tier": "strong", "escalations": ["close_battle"]},
+    }
+
+
+def before(response: dict) -> bytes:
+    """FastAPI's path for a route returning a dict with the default response class"""
+    return JSONResponse(jsonable_encoder(response)).body
+
+
+def after(response: dict) -> bytes:
+    return ORJSONResponse(response).body
+
+
+def timed(fn, runs: int):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1_000_000, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(SAMPLE_CARD, "rb") as f:
+        card_image = image_processor.prepare_for_analysis(f.read())
+    single, multi, battle = card_response(card_image), multi_card_response(card_image), battle_response()
+
+    def sparse(fields):
+        # What the pipeline does now: never encode cardImage, then select
+        def build():
+            response = {key: value for key, value in single.items() if key != "cardImage"}
+            return ORJSONResponse(select_fields(response, fields)).body
+        return build
+
+    rows = [
+        ("psycho-score", "before", lambda: before(single)),
+        ("psycho-score", "after", lambda: after(single)),
+        ("psycho-score", "before, incl. cardImage encode",
+         lambda: before({**single, "cardImage": encode_data_url(card_image)})),
+        ("psycho-score", "?fields=psycho_score,audio_url",
+         sparse(("psycho_score", "audio_url"))),
+        ("six-card photo", "before", lambda: before(multi)),
+        ("six-card photo", "after", lambda: after(multi)),
+        ("alpha-vs-beta", "before", lambda: before(battle)),
+        ("alpha-vs-beta", "after", lambda: after(battle)),
+        ("alpha-vs-beta", "?fields=scores,battle_result.verdict",
+         lambda: after(select_fields(battle, ("scores", "battle_result.verdict")))),
+    ]
+
+    print(f"{'response':<16}{'serializer':<40}{'median us':>12}{'bytes':>10}")
+    print("-" * 78)
+    for name, label, fn in rows:
+        runs = max(args.runs // 20, 5) if "encode" in label else args.runs
+        micros, size = timed(fn, runs)
+        print(f"{name:<16}{label:<40}{micros:>12.1f}{size:>10}")
+
+
+if __name__ == "__main__":
+    main()
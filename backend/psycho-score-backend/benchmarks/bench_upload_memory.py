@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Measure peak memory of many large uploads going through the prepare stage at once
+
+Builds a JPEG just under MAX_FILE_SIZE, spools one copy per request into a
+SpooledTemporaryFile the way Starlette's multipart parser does (on disk above
+1 MB), then prepares all of them concurrently: hash, decode, crop. Each mode
+runs in its own process so the peak RSS of one does not hide the other:
+
+    read     the old path: the upload is read into bytes, decoded from a
+             BytesIO copy and the bytes are held for the rest of the request
+    handle   the current path: hashed and decoded straight from the file
+
+No API calls are made. Usage (from the backend directory):
+    python benchmarks/bench_upload_memory.py
+    python benchmarks/bench_upload_memory.py --uploads 100 --size-mb 5
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+
+for name in ("GEMINI_API_KEY", "ELEVENLABS_API_KEY", "PATRICK_VOICE_ID"):
+    os.environ.setdefault(name, "benchmark")
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+from fastapi import UploadFile  # noqa: E402
+
+from config.settings import settings  # noqa: E402
+from services.pipeline import analysis_pipeline  # noqa: E402
+from utils.image_processing import compute_image_hash, image_processor  # noqa: E402
+
+SPOOL_MAX_SIZE = 1024 * 1024  # Starlette's multipart spool threshold
+MODES = ("read", "handle")
+FULL_SIZE = (2048, 2048)  # What the pipeline decodes at when not degraded
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def make_jpeg(target_bytes: int) -> bytes:
+    """A noisy card-sized JPEG close to (and not over) target_bytes"""
+    rng = np.random.default_rng(0)
+    side = 1000
+    while True:
+        pixels = rng.integers(0, 256, (side, int(side * 1.75), 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, "JPEG", quality=95)
+        if buffer.tell() > target_bytes:
+            return previous
+        previous = buffer.getvalue()
+        side += 100
+
+
+def spool(path: str, count: int) -> list:
+    """One spooled upload per request, written in chunks like the parser does"""
+    uploads = []
+    for index in range(count):
+        file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        with open(path, "rb") as source:
+            for chunk in iter(lambda: source.read(64 * 1024), b""):
+                file.write(chunk)
+        size = file.tell()
+        file.seek(0)
+        uploads.append(UploadFile(file, size=size, filename=f"card-{index}.jpg"))
+    return uploads
+
+
+async def prepare_by_reading(upload: UploadFile):
+    """The pre-streaming prepare_upload: read, decode from bytes, keep the bytes"""
+    image_data = await upload.read()
+    async with analysis_pipeline._prepare_slots:
+        cards, _ = await asyncio.to_thread(
+            image_processor.prepare_cards, image_data, FULL_SIZE
+        )
+    return image_data, compute_image_hash(image_data), cards
+
+
+async def prepare_from_handle(upload: UploadFile):
+    return await analysis_pipeline.prepare_upload(upload, FULL_SIZE)
+
+
+async def measure(mode: str, uploads: list) -> list:
+    prepare = prepare_by_reading if mode == "read" else prepare_from_handle
+    # Keep every result alive until all are done, as concurrent requests would
+    return await asyncio.gather(*(prepare(upload) for upload in uploads))
+
+
+def child(args) -> None:
+    uploads = spool(args.image, args.uploads)
+    before = peak_rss_mb()
+    asyncio.run(measure(args.mode, uploads))
+    after = peak_rss_mb()
+    for upload in uploads:
+        upload.file.close()
+    print(json.dumps({"before": before, "peak": after}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=50, help="Concurrent uploads")
+    parser.add_argument(
+        "--size-mb", type=float, default=settings.MAX_FILE_SIZE / (1024 * 1024) - 0.1,
+        help="Size of each upload (default just under MAX_FILE_SIZE)",
+    )
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--image", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        child(args)
+        return
+
+    # Made here so building it does not count towards either child's peak
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f:
+        f.write(make_jpeg(int(args.size_mb * 1024 * 1024)))
+        image_path = f.name
+    size_mb = os.path.getsize(image_path) / (1024 * 1024)
+    print(f"📦 {args.uploads} concurrent uploads of {size_mb:.1f} MB")
+    print(f"{'mode':<10}{'baseline MB':>14}{'peak MB':>12}{'added MB':>12}{'per upload MB':>16}")
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode,
+             "--uploads", str(args.uploads), "--image", image_path],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        added = result["peak"] - result["before"]
+        print(
+            f"{mode:<10}{result['before']:>14.0f}{result['peak']:>12.0f}"
+            f"{added:>12.0f}{added / args.uploads:>16.1f}"
+        )
+    os.remove(image_path)
+
+
+if __name__ == "__main__":
+    main()
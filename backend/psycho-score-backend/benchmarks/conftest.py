@@ -0,0 +1,229 @@
+"""
+Fixtures for the replay benchmarks (see test_pipeline_replay.py)
+
+Gemini and ElevenLabs are served from a recorded cassette, so the timings
+measure our own code. Run from the backend directory:
+
+    python -m pytest benchmarks -q                    # replay, compare with baselines
+    python -m pytest benchmarks -q --update-baseline  # accept the current timings
+    python -m pytest benchmarks -q --record           # re-record (real API keys)
+
+Without a recorded cassette, one is recorded from the synthetic upstream in
+synthetic_upstream.py at the start of the session and replayed instead.
+
+Anything that blocks the event loop for longer than --block-threshold ms
+while a benchmark runs fails it, with the stack of the blocking call.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASSETTE_PATH = os.path.join(BACKEND_DIR, "benchmarks", "cassettes", "pipeline.json")
+BASELINE_PATH = os.path.join(BACKEND_DIR, "benchmarks", "baselines.json")
+
+SAMPLE_CARDS = [
+    os.path.join(BACKEND_DIR, "Psycho_ScoreRated_by_Bateman.png"),
+    os.path.join(BACKEND_DIR, "Psycho_ScoreRated_by_Bateman_1.png"),
+]
+
+# name -> (route, {form field: sample card index})
+CASES = {
+    "psycho_score": ("/api/analyze/psycho-score", {"file": 0}),
+    "quick_analysis": ("/api/analyze/quick-analysis", {"file": 1}),
+    "alpha_vs_beta": ("/api/analyze/alpha-vs-beta", {"original": 0, "contender": 1}),
+}
+
+RESULTS = {}
+
+
+def upload(fields):
+    files = {}
+    for field, index in fields.items():
+        with open(SAMPLE_CARDS[index], "rb") as f:
+            files[field] = (os.path.basename(SAMPLE_CARDS[index]), f.read(), "image/png")
+    return files
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("replay benchmarks")
+    group.addoption("--record", action="store_true", help="Call the real APIs and re-record the cassette")
+    group.addoption("--update-baseline", action="store_true", help="Save the current timings as the baseline")
+    group.addoption("--runs", type=int, default=20, help="Timed runs per benchmark")
+    group.addoption("--latency-scale", type=float, default=0.0, help="Replayed upstream latency multiplier")
+    group.addoption("--tolerance", type=float, default=0.25, help="Allowed slowdown over the baseline")
+    group.addoption("--block-threshold", type=float, default=100.0, help="Longest allowed event-loop block (ms)")
+
+
+def option(config, name, default):
+    # Options are only registered when pytest is started on this directory
+    return config.getoption(name, default)
+
+
+def pytest_configure(config):
+    recording = option(config, "--record", False)
+    os.environ.setdefault("GEMINI_API_KEY", "replay")
+    os.environ.setdefault("ELEVENLABS_API_KEY", "replay")
+    os.environ.setdefault("PATRICK_VOICE_ID", "replay")
+    # Nothing a run writes outlives it, or is picked up from an earlier one
+    outputs = tempfile.mkdtemp(prefix="psycho-score-replay-")
+    os.environ.update(
+        IMAGE_UPLOAD_PATH=os.path.join(outputs, "images"),
+        AUDIO_OUTPUT_PATH=os.path.join(outputs, "audio"),
+        STATE_DB_PATH=os.path.join(outputs, "state.db"),
+        HISTORY_DB_PATH=os.path.join(outputs, "history.db"),
+        JOBS_DB_PATH=os.path.join(outputs, "jobs.db"),
+        JOBS_IMAGE_PATH=os.path.join(outputs, "jobs"),
+        CARD_INDEX_PATH=os.path.join(outputs, "card_index"),
+    )
+    config.add_cleanup(lambda: shutil.rmtree(outputs, ignore_errors=True))
+    os.environ.update(
+        CASSETTE_MODE="record" if recording else "replay",
+        CASSETTE_PATH=CASSETTE_PATH,
+        CASSETTE_LATENCY_SCALE=str(option(config, "--latency-scale", 0.0)),
+        # Every run must take the full path: no caches, reuse, budgets or history
+        STATE_BACKEND="memory",
+        NEAR_DUPLICATE_DISTANCE="-1",
+        HISTORY_ENABLED="false",
+        JOBS_ENABLED="false",
+        CLIENT_DAILY_BUDGET="0",
+        GLOBAL_DAILY_BUDGET="0",
+        GEMINI_CONTEXT_CACHE="false",
+        HEDGING_ENABLED="false",
+        TTS_PREWARM_ENABLED="false",
+        LOOP_BLOCK_DEBUG="true",
+        LOOP_BLOCK_THRESHOLD_MS=str(option(config, "--block-threshold", 100.0)),
+    )
+    if not recording:
+        os.environ.update(GEMINI_RATE_LIMIT="1000000", ELEVENLABS_RATE_LIMIT="1000000")
+    sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+    sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+
+
+@pytest.fixture(scope="session")
+def recording(request):
+    return option(request.config, "--record", False)
+
+
+def reset_state():
+    """Forget cached analyses and audio so the next request goes 'upstream' again"""
+    from config.settings import settings
+    from services.card_index import card_index
+    from services.state_store import state_store
+
+    state_store._data.clear()
+    card_index._recent.clear()
+    # Audio files are named by content and reused from disk
+    for name in os.listdir(settings.AUDIO_OUTPUT_PATH):
+        os.remove(os.path.join(settings.AUDIO_OUTPUT_PATH, name))
+
+
+def record_synthetic(client, path: str) -> None:
+    """Record every case once against the synthetic upstream, then replay that"""
+    from services.cassette import cassette
+    from synthetic_upstream import SyntheticModel, synthesize
+
+    cassette.use(path, "record")
+    gemini, http = cassette.gemini, cassette.http
+    with pytest.MonkeyPatch.context() as patch:
+        # Same fingerprints as the real calls; only the upstream is swapped
+        patch.setattr(
+            cassette,
+            "gemini",
+            lambda model, contents, generation_config=None: gemini(
+                SyntheticModel(model.model_name), contents, generation_config
+            ),
+        )
+        patch.setattr(cassette, "http", lambda service, request, send: http(service, request, synthesize))
+        for route, fields in CASES.values():
+            reset_state()
+            response = client.post(route, files=upload(fields))
+            assert response.status_code == 200, response.text
+    cassette.use(path, "replay")
+
+
+@pytest.fixture(scope="session")
+def synthetic(recording):
+    """Whether this session replays the synthetic upstream rather than the real APIs"""
+    return not recording and not os.path.exists(CASSETTE_PATH)
+
+
+@pytest.fixture(scope="session")
+def client(recording, synthetic, tmp_path_factory):
+    if recording and os.path.exists(CASSETTE_PATH):
+        os.remove(CASSETTE_PATH)
+
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        if synthetic:
+            record_synthetic(client, str(tmp_path_factory.mktemp("cassettes") / "synthetic.json"))
+        yield client
+
+
+@pytest.fixture
+def fresh_state():
+    return reset_state
+
+
+@pytest.fixture
+def no_blocking(client):
+    """Fail the test if synchronous work held up the event loop while it ran"""
+    from utils.loop_monitor import loop_monitor
+
+    seen = loop_monitor.blocked_count
+    yield
+    blocks = loop_monitor.blocks_since(seen)
+    assert not blocks, "Event loop blocked:\n" + "\n".join(map(repr, blocks))
+
+
+@pytest.fixture(scope="session")
+def baseline(request, recording):
+    """Median timings from baselines.json, checked (or updated) per benchmark"""
+    try:
+        with open(BASELINE_PATH) as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        saved = {}
+    update = option(request.config, "--update-baseline", False)
+    tolerance = option(request.config, "--tolerance", 0.25)
+    # Timings with replayed upstream latency are only comparable at the same scale
+    scale = option(request.config, "--latency-scale", 0.0)
+    suffix = f"@latency{scale:g}" if scale else ""
+
+    def check(name: str, median_ms: float) -> None:
+        name += suffix
+        RESULTS[name] = (median_ms, saved.get(name, {}).get("median_ms"))
+        if recording:
+            return
+        if update or name not in saved:
+            saved[name] = {"median_ms": round(median_ms, 3)}
+            return
+        limit = saved[name]["median_ms"] * (1 + tolerance)
+        assert median_ms <= limit, (
+            f"{name}: median {median_ms:.1f} ms exceeds baseline "
+            f"{saved[name]['median_ms']:.1f} ms by more than {tolerance:.0%}"
+        )
+
+    yield check
+
+    if not recording:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(saved, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+    terminalreporter.section("replay benchmarks")
+    for name, (median_ms, baseline_ms) in RESULTS.items():
+        change = f"{median_ms / baseline_ms - 1:+.0%}" if baseline_ms else "new"
+        terminalreporter.write_line(f"{name:<28}{median_ms:>9.1f} ms   {change}")
@@ -0,0 +1,66 @@
+"""
+A deterministic stand-in for Gemini and ElevenLabs, recorded into a cassette
+
+When no cassette recorded from the real APIs is present, conftest.py runs
+every benchmark case once against this upstream in record mode, then replays
+the recording. The answers are fixed, so tests can assert on the pipeline's
+output; the fingerprints are the real ones, so replay takes the same path as
+with a recorded cassette.
+"""
+
+import json
+from types import SimpleNamespace
+
+import httpx
+from PIL import Image
+
+from services.prompts import PROMPTS
+
+ANALYSIS = {
+    "card_quality": "Bone-colored stock, raised lettering",
+    "design_elements": {"layout": "centered", "whitespace": "generous", "composition": "balanced"},
+    "typography": {"font_family": "Silian Rail", "hierarchy": "clear", "readability": "high"},
+    "color_scheme": {"palette": "eggshell", "contrast": "subtle", "sophistication": "high"},
+    "layout_quality": "Impeccable",
+    "material_impression": "Heavy",
+    "patrick_critique": "Look at that subtle off-white coloring. The tasteful thickness of it.",
+    "psycho_score": 8.5,
+}
+
+COMPARISON = {
+    "card1_analysis": {"strengths": "Watermark", "weaknesses": "None", "psycho_score": 9.0},
+    "card2_analysis": {"strengths": "Raised type", "weaknesses": "Font", "psycho_score": 6.0},
+    "comparison_critique": "Oh my God. It even has a watermark.",
+    "winner": "ALPHA",
+    "winner_reasoning": "The original card's stock and lettering",
+    "final_verdict": "ALPHA",
+}
+
+TASKS = {prompt: task for task, variants in PROMPTS.items() for prompt in variants.values()}
+
+USAGE = {"prompt_token_count": 1200, "candidates_token_count": 300, "total_token_count": 1500}
+
+# One silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz, 417 bytes); 100 last 2.6 s
+MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+
+class SyntheticModel:
+    """Answers a GenerativeModel call with the fixed reply for its task"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, generation_config=None):
+        task = TASKS.get(contents[0] if isinstance(contents[0], str) else None)
+        if task == "comparison":
+            reply = COMPARISON
+        elif task == "multi_analysis":
+            reply = [ANALYSIS] * sum(isinstance(part, Image.Image) for part in contents)
+        else:
+            reply = ANALYSIS
+        return SimpleNamespace(text=json.dumps(reply), usage_metadata=SimpleNamespace(**USAGE))
+
+
+async def synthesize() -> httpx.Response:
+    """An ElevenLabs text-to-speech reply"""
+    return httpx.Response(200, content=MP3_FRAME * 100, headers={"content-type": "audio/mpeg"})
@@ -0,0 +1,35 @@
+"""
+Queued requests hand back exactly the slots they were given
+
+A client can go away at any moment while its request waits in the admission
+queue, including right after the queue was shed for a shutdown.
+"""
+
+import asyncio
+
+import pytest
+
+
+def test_cancelled_after_shed_keeps_in_flight(monkeypatch):
+    from config.settings import settings
+    from services.admission import AdmissionController
+
+    monkeypatch.setattr(settings, "ADMISSION_MAX_CONCURRENT", 1)
+    controller = AdmissionController()
+
+    async def run():
+        running = await controller.acquire("standard", 30.0)
+        queued = asyncio.create_task(controller.acquire("standard", 30.0))
+        await asyncio.sleep(0.01)
+
+        # Its client disconnects, and draining sheds it before it sees that
+        queued.cancel()
+        controller.close()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+
+        assert controller.in_flight == 1
+        controller.release(running)
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+"""
+Workers sharing one card index directory never move it backwards
+
+Each worker rebuilds from the same history, at its own pace; a slow one
+must neither replace a newer manifest nor delete the files it points to.
+"""
+
+import asyncio
+import os
+
+import numpy as np
+
+
+def history(count: int, start: int = 1):
+    rng = np.random.default_rng(start)
+    return [
+        (rowid, int(rng.integers(0, 2**63)), f"{rowid:032x}", 5.0)
+        for rowid in range(start, start + count)
+    ]
+
+
+def test_stale_worker_keeps_newer_version(tmp_path):
+    from services.card_index import CardIndex
+
+    rows = history(20)
+    fast, slow = CardIndex(str(tmp_path)), CardIndex(str(tmp_path))
+    fast._rebuild(rows)
+
+    # The slow worker fetched only the first half before the other saved
+    slow._rebuild(rows[:10])
+
+    assert slow.watermark == fast.watermark == 20
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["lock", "manifest.json"] + [f"v20.{name}.npy" for name in
+         ("hashes", "history_ids", "scores", "chunk_keys", "chunk_rows")]
+    )
+    reloaded = CardIndex(str(tmp_path))
+    assert len(reloaded) == 20
+    assert reloaded.nearest(rows[-1][1], 0).history_id == rows[-1][2]
+
+
+def test_refresh_rebuilds_only_past_growth_threshold(tmp_path, monkeypatch):
+    from config.settings import settings
+    from services.card_index import CardIndex
+    from services.history_store import history_store
+
+    rows = history(60)
+    available = []
+
+    async def card_hashes_since(after_rowid, limit=10000):
+        return [row for row in available if row[0] > after_rowid][:limit]
+
+    monkeypatch.setattr(history_store, "card_hashes_since", card_hashes_since)
+    monkeypatch.setattr(settings, "CARD_INDEX_REBUILD_MIN_ROWS", 10)
+    monkeypatch.setattr(settings, "CARD_INDEX_REBUILD_RATIO", 0.5)
+    index = CardIndex(str(tmp_path))
+
+    def refresh_with(count):
+        available[:] = rows[:count]
+        asyncio.run(index.refresh())
+
+    refresh_with(5)  # Below the minimum: searched linearly, nothing written
+    assert index.watermark == 0 and not os.path.exists(tmp_path / "manifest.json")
+    assert index.nearest(rows[4][1], 0).history_id == rows[4][2]
+
+    refresh_with(10)
+    assert index.watermark == 10 and not index._pending
+
+    refresh_with(14)  # 4 pending, under half of the 10 in the tables
+    assert index.watermark == 10 and len(index) == 14
+    assert index.nearest(rows[13][1], 0).history_id == rows[13][2]
+
+    refresh_with(60)
+    assert index.watermark == 60 and len(index) == 60
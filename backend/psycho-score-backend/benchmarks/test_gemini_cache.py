@@ -0,0 +1,30 @@
+"""
+Cached Gemini replies are only reused for the same prompt
+
+A compact prompt, or one carrying design feature hints, gets a different
+reply than the full prompt for the same image, so each is cached apart.
+"""
+
+
+def test_cache_key_follows_prompt_and_hints():
+    from services.gemini_service import gemini_service
+    from services.model_router import model_router
+
+    def key(prompt_variant="full", hints=None, route=None):
+        base = gemini_service._prompt_cache_key("analysis:abc", prompt_variant, hints)
+        return gemini_service._tier_cache_key(base, route)
+
+    # Keys of the plain full prompt are unchanged
+    assert key() == "analysis:abc"
+    assert key(hints=[None, None]) == "analysis:abc"
+
+    keys = {
+        key(),
+        key("compact"),
+        key(hints="Dominant color: bone"),
+        key(hints="Dominant color: eggshell"),
+        key("compact", hints="Dominant color: bone"),
+        key(route=model_router.route("fast")),
+    }
+    assert len(keys) == 6
+    assert key(hints="Dominant color: bone") == key(hints="Dominant color: bone")
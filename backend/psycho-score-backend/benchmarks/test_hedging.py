@@ -0,0 +1,76 @@
+"""
+A hedge is a real upstream call
+
+It takes a slot of the upstream's shared rate limit like the first attempt,
+and when both attempts come back the loser's billed usage is still recorded.
+"""
+
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def hedger(monkeypatch):
+    from config.settings import settings
+    from services.hedging import Hedger
+    from utils.metrics import metrics
+
+    monkeypatch.setattr(settings, "HEDGING_ENABLED", True)
+    metrics.histograms.pop("hedge.test.latency", None)
+    # Usual latency of 10 ms, so a call still running after that is hedged
+    for _ in range(settings.HEDGE_MIN_SAMPLES):
+        metrics.observe("hedge.test.latency", 0.01)
+    return Hedger()
+
+
+def test_loser_usage_is_recorded(hedger, fresh_state):
+    from utils.metrics import metrics
+
+    fresh_state()
+    attempts, discarded = [], []
+
+    async def run():
+        both_sent = asyncio.Event()
+
+        async def call():
+            attempts.append(len(attempts))
+            attempt = len(attempts)
+            if attempt == 2:
+                both_sent.set()
+            await both_sent.wait()
+            return f"response {attempt}"
+
+        return await hedger.call(
+            "test", call, rate_limit=("test", 10), on_discarded=discarded.append
+        )
+
+    won = metrics.counters.get("hedge.test.won", 0)
+    # Both finish together: the primary wins, whatever order the set yields
+    assert asyncio.run(run()) == "response 1"
+    assert len(attempts) == 2
+    assert discarded == ["response 2"]
+    assert metrics.counters.get("hedge.test.won", 0) == won
+
+
+def test_hedge_needs_a_rate_limit_slot(hedger, fresh_state):
+    from services.state_store import state_store
+
+    fresh_state()
+    attempts = []
+
+    async def run():
+        async def call():
+            attempts.append(len(attempts))
+            await asyncio.sleep(0.05)
+            return "response"
+
+        # The first attempt took the only slot of this window
+        await state_store.wait_for_slot("test", 1)
+        return await hedger.call("test", call, rate_limit=("test", 1))
+
+    tokens = hedger._budget("test").tokens
+    assert asyncio.run(run()) == "response"
+    assert attempts == [0]
+    # The skipped hedge gave its budget token back
+    assert hedger._budget("test").tokens >= tokens
@@ -0,0 +1,73 @@
+"""
+The leaderboard has one entry per card, not per uploaded photo
+
+Cards cut from one multi-card upload share its image_hash; each keeps its
+own entry, while repeat analyses of the same card collapse to the best one.
+"""
+
+import asyncio
+
+from synthetic_upstream import ANALYSIS
+
+
+def test_top_analyses_one_per_card(tmp_path, monkeypatch):
+    from config.settings import settings
+    from services.history_store import HistoryStore
+
+    monkeypatch.setattr(settings, "HISTORY_ENABLED", True)
+    store = HistoryStore(str(tmp_path / "history.db"))
+
+    async def record_and_rank():
+        # Three cards on the table, photographed twice, plus a single card
+        for score in (7.0, 9.0):
+            for index in range(3):
+                store.record_analysis(
+                    "table",
+                    "psycho-score",
+                    {**ANALYSIS, "psycho_score": score + index / 10},
+                    card_hash=f"table:{index}",
+                )
+        store.record_analysis("single", "psycho-score", {**ANALYSIS, "psycho_score": 8.0})
+        await store.stop()
+        return await store.top_analyses(n=10), await store.top_analyses(n=10, distinct=False)
+
+    top, every = asyncio.run(record_and_rank())
+
+    assert [(row["card_hash"], row["psycho_score"]) for row in top] == [
+        ("table:2", 9.2), ("table:1", 9.1), ("table:0", 9.0), (None, 8.0)
+    ]
+    assert {row["image_hash"] for row in top} == {"table", "single"}
+    assert len(every) == 7
+
+
+def test_top_analyses_walks_the_score_index(tmp_path, monkeypatch):
+    from config.settings import settings
+    from services.history_store import HistoryStore, TOP_PAGE_SQL
+
+    monkeypatch.setattr(settings, "HISTORY_ENABLED", True)
+    store = HistoryStore(str(tmp_path / "history.db"))
+
+    async def record_and_rank():
+        # One card scored again and again outranks the rest for several pages
+        for attempt in range(130):
+            store.record_analysis(
+                "bateman", "psycho-score", {**ANALYSIS, "psycho_score": 9.5 + (attempt % 3) / 10}
+            )
+        for index in range(12):
+            store.record_analysis(
+                f"card{index}", "psycho-score", {**ANALYSIS, "psycho_score": 9.0 - index / 10}
+            )
+        await store.stop()
+        return await store.top_analyses(n=5)
+
+    top = asyncio.run(record_and_rank())
+    assert [(row["image_hash"], row["psycho_score"]) for row in top] == [
+        ("bateman", 9.7), ("card0", 9.0), ("card1", 8.9), ("card2", 8.8), ("card3", 8.7)
+    ]
+    assert "rowid" not in top[0]
+
+    plan = store._connect().execute(
+        f"EXPLAIN QUERY PLAN {TOP_PAGE_SQL}", (9.0, 9.0, 1, 20)
+    ).fetchall()
+    details = " ".join(row[-1] for row in plan)
+    assert "analyses_psycho_score" in details and "TEMP B-TREE" not in details
@@ -0,0 +1,58 @@
+"""
+A live battle session analyzes each card once
+
+Battles and rematches are judged from the scores the cards already got, so
+the only Gemini calls are one per uploaded card.
+"""
+
+import json
+
+from conftest import SAMPLE_CARDS
+from synthetic_upstream import ANALYSIS, SyntheticModel, synthesize
+
+
+def events_until(ws, last: str) -> list:
+    events = []
+    while True:
+        message = ws.receive()
+        if message.get("text") is not None:
+            events.append(json.loads(message["text"]))
+            if events[-1]["event"] == last:
+                return events
+
+
+def test_battles_reuse_card_analyses(client, fresh_state, monkeypatch):
+    from services.cassette import cassette
+
+    fresh_state()
+    tasks = []
+
+    async def gemini(model, contents, generation_config=None):
+        tasks.append(contents[0])
+        return await SyntheticModel(model.model_name).generate_content_async(
+            contents, generation_config
+        )
+
+    async def http(service, request, send):
+        return await synthesize()
+
+    monkeypatch.setattr(cassette, "gemini", gemini)
+    monkeypatch.setattr(cassette, "http", http)
+    original, contender = (open(path, "rb").read() for path in SAMPLE_CARDS)
+
+    with client.websocket_connect("/api/analyze/alpha-vs-beta/live") as ws:
+        ws.send_bytes(original)
+        ws.send_bytes(contender)
+        events = events_until(ws, "audio_end")
+        ws.send_text(json.dumps({"type": "battle", "original": 1, "contender": 0}))
+        events += events_until(ws, "audio_end")
+
+    scored = [event for event in events if event["event"] == "card_scored"]
+    verdicts = [event for event in events if event["event"] == "verdict"]
+    assert len(scored) == 2 and len(verdicts) == 2
+    assert len(tasks) == 2  # One analysis per card, none per battle
+
+    score = ANALYSIS["psycho_score"]
+    for verdict in verdicts:
+        assert verdict["scores"] == {"original_score": score, "contender_score": score}
+        assert verdict["battle_result"]["verdict"] == "ALPHA"  # A tie keeps the original
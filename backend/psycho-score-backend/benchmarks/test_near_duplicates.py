@@ -0,0 +1,124 @@
+"""
+Near-duplicate reuse only returns an analysis of the same card
+
+Plain cards with the same layout share a perceptual hash whatever their
+names say, so a match must also agree on the inked region, and the stored
+analysis must come from a tier at least as strong as the request's (strong
+when the client asks for ?detail=true).
+"""
+
+import asyncio
+import io
+import itertools
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+NAMES = [
+    "Patrick Bateman", "Paul Allen", "Timothy Price", "David Van Patten",
+    "Luis Carruthers", "Craig McDermott", "Marcus Halberstram", "Evelyn Williams",
+    "Courtney Rhodes", "Harold Carnes", "Donald Kimball", "Jean Lawrence",
+]
+
+BONE = (245, 243, 236)
+
+
+@pytest.fixture(autouse=True)
+def near_duplicates(monkeypatch):
+    """The replay benchmarks turn reuse off; these tests need the default distance"""
+    from config.settings import Settings, settings
+
+    monkeypatch.setattr(
+        settings, "NEAR_DUPLICATE_DISTANCE", Settings.model_fields["NEAR_DUPLICATE_DISTANCE"].default
+    )
+
+
+def plain_card(name: str) -> Image.Image:
+    """Bone stock, a name and a title in the top left corner"""
+    card = Image.new("RGB", (1050, 600), BONE)
+    draw = ImageDraw.Draw(card)
+    draw.text((40, 60), name, fill=(20, 20, 20), font=ImageFont.load_default(size=48))
+    draw.text((40, 128), "Vice President", fill=(60, 60, 60), font=ImageFont.load_default(size=24))
+    return card
+
+
+def reuploaded(card: Image.Image) -> Image.Image:
+    """Rescaled and recompressed, as after a round trip through a chat app"""
+    data = io.BytesIO()
+    card.resize((700, 400)).save(data, format="JPEG", quality=70)
+    return Image.open(io.BytesIO(data.getvalue())).convert("RGB")
+
+
+def hashes(card: Image.Image):
+    from utils.image_processing import content_hash, perceptual_hash
+
+    return perceptual_hash(card), content_hash(card)
+
+
+def matches(a, b) -> bool:
+    from config.settings import settings
+    from services.card_index import same_content
+
+    layout = bin(a[0] ^ b[0]).count("1") <= settings.NEAR_DUPLICATE_DISTANCE
+    return layout and same_content(a[1], b[1])
+
+
+def test_different_plain_cards_do_not_match():
+    from config.settings import settings
+
+    cards = {name: hashes(plain_card(name)) for name in NAMES}
+    pairs = list(itertools.combinations(NAMES, 2))
+
+    # The layout hash alone confuses some of them...
+    assert any(
+        bin(cards[a][0] ^ cards[b][0]).count("1") <= settings.NEAR_DUPLICATE_DISTANCE
+        for a, b in pairs
+    )
+    # ...but no two different cards are near-duplicates
+    assert [(a, b) for a, b in pairs if matches(cards[a], cards[b])] == []
+
+
+def test_reuploaded_card_matches():
+    # A miss only costs a Gemini call, a false match someone else's score
+    matched = [
+        name
+        for name in NAMES
+        if matches(hashes(plain_card(name)), hashes(reuploaded(plain_card(name))))
+    ]
+    assert len(matched) >= 0.75 * len(NAMES), matched
+
+
+def test_reuse_respects_detail_and_tier(monkeypatch):
+    from services.card_index import CardMatch
+    from services.gemini_service import gemini_service
+    from services.history_store import history_store
+    from services.model_router import model_router
+    from synthetic_upstream import ANALYSIS
+
+    _, ink = hashes(plain_card(NAMES[0]))
+    stored = {"analysis": ANALYSIS, "content_hash": ink, "model_tier": "fast"}
+
+    async def get_analysis(row_id):
+        return stored
+
+    monkeypatch.setattr(history_store, "get_analysis", get_analysis)
+    match = CardMatch("row", distance=1, psycho_score=ANALYSIS["psycho_score"])
+
+    def reused(route, content=ink):
+        return asyncio.run(gemini_service.reuse_analysis(match, content, route)) is not None
+
+    assert reused(model_router.route("fast"))
+    assert not reused(model_router.route("strong"))  # Stored from a weaker tier
+    assert not reused(model_router.route("fast", detail=True))  # Escalated to strong
+    assert not reused(model_router.route("fast"), content=ink ^ 0b1111)  # Different text
+
+    stored["model_tier"] = "strong"
+    assert reused(model_router.route("strong"))
+    assert reused(model_router.route("fast", detail=True))
+    # Reported with the tier that produced it, not the one asked for
+    reuse = gemini_service.reuse_analysis(match, ink, model_router.route("fast"))
+    assert asyncio.run(reuse)[1] == "strong"
+
+    stored["model_tier"] = None  # Stored before tiers were recorded
+    assert reused(model_router.route("fast"))
+    assert not reused(model_router.route("strong"))
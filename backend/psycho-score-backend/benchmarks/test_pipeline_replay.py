@@ -0,0 +1,73 @@
+"""
+End-to-end timings of every analysis route with upstream calls replayed
+
+Each route is run against the sample cards with Gemini and ElevenLabs served
+from benchmarks/cassettes/pipeline.json (or, without one, from a recording of
+synthetic_upstream.py). With the default latency scale of 0 the median
+measures only our own work (decoding, cropping, features, prompting, parsing,
+audio files, JSON), and a slowdown beyond the tolerance over baselines.json
+fails the test, as does any synchronous call that blocks the event loop or a
+response that does not carry the replayed analysis. See conftest.py for options.
+"""
+
+import os
+import statistics
+import time
+
+import pytest
+
+from conftest import CASES, upload
+from synthetic_upstream import ANALYSIS, COMPARISON
+
+
+def check_audio(result: dict) -> None:
+    from config.settings import settings
+
+    path = os.path.join(settings.AUDIO_OUTPUT_PATH, os.path.basename(result["audio_url"]))
+    assert os.path.getsize(path) > 0
+    assert result["audio_duration"] > 0
+
+
+def check_output(name: str, body: dict, synthetic: bool) -> None:
+    """The response carries the replayed analysis, whatever the cassette"""
+    if name == "alpha_vs_beta":
+        battle = body["battle_result"]
+        assert battle["winner"] == ("original" if battle["verdict"] == "ALPHA" else "contender")
+        check_audio(battle)
+        if synthetic:
+            assert battle["verdict"] == COMPARISON["final_verdict"]
+            assert body["scores"] == {
+                "original_score": COMPARISON["card1_analysis"]["psycho_score"],
+                "contender_score": COMPARISON["card2_analysis"]["psycho_score"],
+            }
+        return
+
+    assert 0 <= body["psycho_score"] <= 10
+    assert body["patrick_critique"]
+    if synthetic:
+        assert body["psycho_score"] == ANALYSIS["psycho_score"]
+        assert body["patrick_critique"] == ANALYSIS["patrick_critique"]
+    if name == "psycho_score":
+        assert 0 <= body["provisional_score"] <= 10
+        check_audio(body)
+        if synthetic:
+            # Every synthesized clip is 100 MP3 frames of 1152 samples at 44.1 kHz
+            assert body["audio_duration"] == pytest.approx(100 * 1152 / 44100)
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_route(name, request, client, fresh_state, baseline, recording, synthetic, no_blocking):
+    route, fields = CASES[name]
+    files = upload(fields)
+    runs = 1 if recording else request.config.getoption("--runs", 20)
+
+    timings = []
+    for _ in range(runs):
+        fresh_state()
+        start = time.perf_counter()
+        response = client.post(route, files=files)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+        check_output(name, response.json(), synthetic)
+
+    baseline(name, statistics.median(timings))
@@ -0,0 +1,97 @@
+"""
+single_flight shares one computation between callers in a worker
+
+Cancelling the caller that runs the computation (a client disconnecting, a
+request deadline) must not cancel the callers that joined it. Across workers,
+the lock is only released by its owner and the call runs once.
+"""
+
+import asyncio
+
+import pytest
+
+
+def test_joiners_survive_leader_cancellation():
+    from services.state_store import MemoryStateStore
+
+    store = MemoryStateStore()
+    calls = []
+
+    async def factory():
+        calls.append(len(calls))
+        await asyncio.sleep(0.05)
+        return f"value {len(calls)}"
+
+    async def run():
+        leader = asyncio.create_task(store.single_flight("key", factory))
+        await asyncio.sleep(0.01)
+        joiners = [asyncio.create_task(store.single_flight("key", factory)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*joiners)
+
+    # One joiner takes over the computation and the others share its result
+    assert asyncio.run(run()) == ["value 2"] * 3
+    assert len(calls) == 2
+
+
+def test_state_store_is_abstract():
+    from services.state_store import StateStore
+
+    with pytest.raises(TypeError):
+        StateStore()
+
+
+def stores(tmp_path):
+    from services.state_store import MemoryStateStore, SQLiteStateStore
+
+    path = str(tmp_path / "state.db")
+    memory = MemoryStateStore()
+    return [(memory, memory), (SQLiteStateStore(path), SQLiteStateStore(path))]
+
+
+def test_expired_lock_is_not_released_by_its_old_owner(tmp_path):
+    async def run(first, second):
+        stale = await first.acquire_lock("lock:key", 0.05)
+        assert stale is not None
+        await asyncio.sleep(0.1)
+        # The lock expired and the other worker took it over
+        token = await second.acquire_lock("lock:key", 60)
+        assert token is not None
+        await first.release_lock("lock:key", stale)
+        assert await first.acquire_lock("lock:key", 60) is None
+        await second.release_lock("lock:key", token)
+        assert await first.acquire_lock("lock:key", 60) is not None
+
+    for first, second in stores(tmp_path):
+        asyncio.run(run(first, second))
+
+
+def test_uncacheable_result_is_shared_with_other_workers(tmp_path):
+    calls = []
+
+    async def factory():
+        calls.append(len(calls))
+        await asyncio.sleep(0.2)
+        return {"raw_response": "not JSON"}
+
+    async def run(first, second):
+        flights = [
+            store.single_flight(
+                "key",
+                factory,
+                lock_ttl=5,
+                should_cache=lambda data: "raw_response" not in data,
+                poll_interval=0.01,
+            )
+            for store in (first, second)
+        ]
+        return await asyncio.gather(*flights)
+
+    # Two workers (the memory store stands in for one with two local callers)
+    for first, second in stores(tmp_path):
+        calls.clear()
+        assert asyncio.run(run(first, second)) == [{"raw_response": "not JSON"}] * 2
+        assert len(calls) == 1
@@ -0,0 +1,63 @@
+"""
+Streamed analyses are charged like any other request
+
+The NDJSON stream of /psycho-score?stream=true runs the Gemini analysis and
+the speech synthesis while the body is sent, after the response headers.
+Budgets are kept per X-Client-ID only when the header is signed.
+"""
+
+import json
+
+from conftest import CASES, upload
+
+
+def spent(client, client_id: str) -> float:
+    from services.usage import usage_tracker
+
+    return client.portal.call(usage_tracker.spent, f"client:{client_id}")
+
+
+def test_streamed_request_is_charged(client, fresh_state, monkeypatch):
+    from config.settings import settings
+    from services.usage import sign_client_id
+
+    monkeypatch.setattr(settings, "CLIENT_ID_SECRET", "test secret")
+    route, fields = CASES["psycho_score"]
+
+    fresh_state()
+    plain = client.post(route, files=upload(fields))
+    assert plain.status_code == 200, plain.text
+    header = dict(item.split("=") for item in plain.headers["X-Usage"].split(", "))
+
+    fresh_state()
+    streamed = client.post(
+        f"{route}?stream=true",
+        files=upload(fields),
+        headers={"X-Client-ID": sign_client_id("streamed")},
+    )
+    assert streamed.status_code == 200, streamed.text
+    assert "X-Usage" not in streamed.headers
+    events = [json.loads(line) for line in streamed.text.splitlines()]
+    assert [event["event"] for event in events] == ["provisional", "result"]
+
+    # The same Gemini call and synthesis as the plain request, charged to the client
+    usage = events[-1]["usage"]
+    assert usage["input_tokens"] == int(header["input_tokens"]) > 0
+    assert usage["tts_chars"] == int(header["tts_chars"]) > 0
+    assert usage["cost_usd"] == float(header["cost_usd"])
+    assert spent(client, "streamed") == round(usage["cost_usd"], 6) > 0
+
+
+def test_only_signed_client_ids_are_trusted(monkeypatch):
+    from config.settings import settings
+    from services.usage import client_id_for, sign_client_id
+
+    monkeypatch.setattr(settings, "CLIENT_ID_SECRET", "")
+    assert client_id_for("bateman", "10.0.0.1") == "10.0.0.1"
+
+    monkeypatch.setattr(settings, "CLIENT_ID_SECRET", "test secret")
+    signed = sign_client_id("bateman")
+    assert client_id_for(signed, "10.0.0.1") == "bateman"
+    assert client_id_for("bateman", "10.0.0.1") == "10.0.0.1"
+    assert client_id_for(f"allen.{signed.rpartition('.')[2]}", "10.0.0.1") == "10.0.0.1"
+    assert client_id_for(None, None) == "anonymous"
@@ -17,10 +17,139 @@ class Settings(BaseSettings):
     # ElevenLabs configuration
     ELEVENLABS_BASE_URL: str = "https://api.elevenlabs.io/v1"
     PATRICK_VOICE_ID: str
+    TTS_OUTPUT_FORMAT: str = "mp3_44100_128"  # Default output_format, see AUDIO_FORMATS
+    AUDIO_CACHE_MAX_AGE: int = 365 * 24 * 60 * 60  # Client cache lifetime of generated audio
+    TTS_PREWARM_ENABLED: bool = True  # Synthesize fixed phrases at startup
+    TTS_PREWARM_PHRASES: list = []  # In addition to the built-in prefixes and fallback
+    TTS_PREWARM_FORMATS: list = []  # Empty: just TTS_OUTPUT_FORMAT
+    TTS_PREFIX_COMPOSITION: bool = True  # Synthesize only what follows a fixed prefix (MP3)
 
     # Application settings
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_IMAGE_TYPES: list = ["image/jpeg", "image/png", "image/jpg"]
+    IMAGE_PREPARE_CONCURRENCY: int = 4  # Images decoded/resized in threads at once
+    CARD_CROP_ENABLED: bool = True  # Crop photos to the detected card before analysis
+    MAX_CARDS_PER_PHOTO: int = 6  # Cards scored from one psycho-score upload (1 disables)
+
+    # Conditional enhancement of dim or noisy cards before analysis (bench_enhancement.py)
+    ENHANCE_ENABLED: bool = False
+    ENHANCE_MIN_DYNAMIC_RANGE: float = 0.45  # Luma 1st-99th percentile spread below this is stretched
+    ENHANCE_NOISE_LEVEL: float = 0.015  # Estimated luma noise sigma above this is smoothed
+    ENHANCE_MAX_GAIN: float = 2.5  # Strongest contrast stretch
+    ENHANCE_MIN_SIDE: int = 768  # Denoising never reduces a card below this
+
+    # Admission control: priority classes, bounded queues and deadlines per worker
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENT: int = 8  # Admitted requests running at once
+    ADMISSION_ROUTES: dict = {
+        "/api/analyze/quick-analysis": "interactive",
+        "/api/analyze/psycho-score": "standard",
+        "/api/analyze/alpha-vs-beta": "batch",
+        "/api/analyze/alpha-vs-beta/live": "batch",  # Per card and per battle of a session
+        "/api/audio/generate": "batch",
+        "/api/audio/patrick-critique": "batch",
+    }
+    ADMISSION_QUEUE_LIMITS: dict = {"interactive": 64, "standard": 32, "batch": 16}
+    ADMISSION_DEADLINES: dict = {"interactive": 10.0, "standard": 30.0, "batch": 45.0}
+
+    # Shared state (caches, single-flight, rate limits) across worker processes
+    STATE_BACKEND: str = "memory"  # memory | sqlite | redis
+    STATE_DB_PATH: str = "outputs/state.db"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    ANALYSIS_CACHE_TTL: int = 24 * 60 * 60  # 1 day
+    TTS_CACHE_TTL: int = 7 * 24 * 60 * 60  # 1 week
+    GEMINI_RATE_LIMIT: int = 60  # Calls per minute, summed over all workers
+    ELEVENLABS_RATE_LIMIT: int = 30  # Calls per minute, summed over all workers
+
+    # Hedged upstream calls: duplicate a call still running at the usual latency
+    HEDGING_ENABLED: bool = False
+    HEDGE_PERCENTILE: float = 90.0  # Of the endpoint's rolling latency histogram
+    HEDGE_MIN_SAMPLES: int = 20  # Calls observed before an endpoint is hedged
+    HEDGE_BUDGET_RATIO: float = 0.10  # Max extra calls, as a fraction of all calls
+    HEDGE_BUDGET_BURST: float = 5.0  # Hedges that may fire back to back
+
+    # Record/replay of Gemini and ElevenLabs calls, for offline benchmarks
+    CASSETTE_MODE: str = "off"  # off | record | replay
+    CASSETTE_PATH: str = "benchmarks/cassettes/default.json"
+    CASSETTE_LATENCY_SCALE: float = 1.0  # Replayed latency multiplier, 0 for none
+
+    # Structured logging, written by a background thread
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # json | text
+    LOG_QUEUE_SIZE: int = 10000  # Records waiting for the writer before new ones are dropped
+    LOG_SAMPLE_RATES: dict = {  # Share of requests per route that log below WARNING
+        "/api/analyze/quick-analysis": 0.1,
+        "/health": 0.0,
+        "/metrics": 0.0,
+    }
+
+    # Event-loop lag monitor, and a blocking-call detector for debugging and benchmarks
+    LOOP_LAG_INTERVAL: float = 0.1  # Seconds between lag samples (0 disables the monitor)
+    LOOP_BLOCK_DEBUG: bool = False  # Log the stack of anything that blocks the loop
+    LOOP_BLOCK_THRESHOLD_MS: float = 100.0
+
+    # Graceful shutdown: drain in-flight pipelines, suspend the rest as resumable jobs
+    SHUTDOWN_DRAIN_TIMEOUT: float = 20.0  # Seconds running pipelines get to finish after SIGTERM
+    SHUTDOWN_RETRY_AFTER: int = 5  # Retry-After of work refused or suspended while draining
+    JOBS_ENABLED: bool = True  # Save suspended pipelines and resume them on the next start
+    JOBS_DB_PATH: str = "outputs/jobs.db"
+    JOBS_IMAGE_PATH: str = "outputs/jobs"  # Decoded cards of suspended jobs
+    JOB_RESULT_TTL: int = 24 * 60 * 60  # Finished jobs kept for clients retrying the upload
+    JOB_MAX_ATTEMPTS: int = 3  # Resumes before a job is given up
+
+    # Live ALPHA vs BETA sessions over WebSocket
+    LIVE_BATTLE_MAX_CARDS: int = 20  # Cards kept per session
+    LIVE_BATTLE_IDLE_TIMEOUT: float = 300.0  # Seconds without a message before closing
+    LIVE_BATTLE_AUDIO_CHUNK: int = 32 * 1024  # Bytes per binary audio message
+
+    # Admin diagnostics (CPU profile, tracemalloc, asyncio tasks) under /admin
+    ADMIN_ENABLED: bool = False
+    ADMIN_TOKEN: str = ""  # X-Admin-Token; every admin request is refused while empty
+    ADMIN_PROFILE_MAX_SECONDS: float = 60.0
+
+    # Analysis history (SQLite, written in batches off the request path)
+    HISTORY_ENABLED: bool = True
+    HISTORY_DB_PATH: str = "outputs/history.db"
+    HISTORY_BATCH_SIZE: int = 100
+    HISTORY_FLUSH_INTERVAL: float = 1.0  # Seconds to gather a batch
+    HISTORY_QUEUE_SIZE: int = 10000
+
+    # Near-duplicate cards (perceptual hash index rebuilt from history, mmapped)
+    CARD_INDEX_PATH: str = "outputs/card_index"
+    NEAR_DUPLICATE_DISTANCE: int = 4  # Max differing pHash bits; -1 disables reuse
+    NEAR_DUPLICATE_CONTENT_DISTANCE: int = 2  # Max differing bits of the inked region's hash
+    CARD_INDEX_REFRESH_INTERVAL: float = 60.0  # Seconds between pulls from history
+    CARD_INDEX_REBUILD_MIN_ROWS: int = 1000  # New rows searched linearly before a rebuild
+    CARD_INDEX_REBUILD_RATIO: float = 0.1  # ...or this fraction of the tables, if larger
+
+    # Model routing: start on the endpoint's tier, escalate to strong when needed
+    GEMINI_FAST_MODEL: str = "gemini-2.5-flash-lite"
+    GEMINI_STRONG_MODEL: str = "gemini-2.5-flash"
+    MODEL_TIER_PSYCHO_SCORE: str = "strong"  # fast | strong
+    MODEL_TIER_QUICK_ANALYSIS: str = "fast"
+    MODEL_TIER_ALPHA_VS_BETA: str = "fast"  # First-pass screen, see margin below
+    BATTLE_ESCALATION_MARGIN: float = 0.5  # Re-judge on strong if scores are closer
+
+    # Gemini prompts: "full" or "compact" per endpoint, optional server-side caching
+    PROMPT_VARIANT_PSYCHO_SCORE: str = "full"
+    PROMPT_VARIANT_QUICK_ANALYSIS: str = "compact"
+    PROMPT_VARIANT_ALPHA_VS_BETA: str = "full"
+    GEMINI_CONTEXT_CACHE: bool = False
+    DESIGN_FEATURES_IN_PROMPT: bool = True  # Send measured NumPy features as hints
+    GEMINI_CONTEXT_CACHE_TTL: int = 60 * 60  # 1 hour
+
+    # Usage accounting (USD) and daily budgets; a budget of 0 disables it
+    GEMINI_INPUT_COST_PER_MTOK: float = 0.30
+    GEMINI_OUTPUT_COST_PER_MTOK: float = 2.50
+    GEMINI_FAST_INPUT_COST_PER_MTOK: float = 0.10
+    GEMINI_FAST_OUTPUT_COST_PER_MTOK: float = 0.40
+    ELEVENLABS_COST_PER_1K_CHARS: float = 0.30
+    CLIENT_DAILY_BUDGET: float = 0.0  # Per signed X-Client-ID, else per client IP
+    GLOBAL_DAILY_BUDGET: float = 0.0
+    CLIENT_ID_SECRET: str = ""  # HMAC key of X-Client-ID; the header is ignored while empty
+    BUDGET_REDUCED_IMAGE_AT: float = 0.70  # Fraction spent before shrinking images
+    BUDGET_NO_AUDIO_AT: float = 0.85  # Fraction spent before skipping audio
+    REDUCED_IMAGE_MAX_SIZE: int = 1024
 
     class Config:
         env_file = ".env"
@@ -1,17 +1,66 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
-from http import HTTPStatus
+from fastapi.responses import HTMLResponse, ORJSONResponse
+import asyncio
+import logging
 import os
-from PIL import Image
-import io
-import base64
+import time
+import uuid
+from contextlib import asynccontextmanager
 
 # Import your existing routers and services
-from routers import analyze, audio
+from routers import admin, analyze, audio, history
 from config.settings import settings
-from services.gemini_service import gemini_service  # YOUR GEMINI SERVICE
+from models.schemas import ApiInfoResponse, HealthResponse, MetricsResponse
+from services.admission import admission_controller, RequestShed
+from services.card_index import card_index
+from services.drain import drain_controller
+from services.elevenlabs_service import elevenlabs_service
+from services.history_store import history_store
+from services.pipeline import analysis_pipeline
+from services.usage import UsageRecord, client_id_for, current_usage, usage_tracker
+from utils.logs import log_writer, log_sampled, request_id, sample
+from utils.loop_monitor import loop_monitor
+from utils.profiling import task_tracker
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.ADMIN_ENABLED:
+        task_tracker.install(asyncio.get_running_loop())
+    drain_controller.install(asyncio.get_running_loop())
+    log_writer.start()
+    await loop_monitor.start()
+    logger.info(
+        "🎭 Psycho Score API starting up...",
+        extra={
+            "routes": [
+                f"{' '.join(sorted(route.methods)) if hasattr(route, 'methods') else 'MOUNT'} {route.path}"
+                for route in app.routes
+            ]
+        },
+    )
+    history_store.start()
+    await card_index.start()
+    elevenlabs_service.start()
+    analysis_pipeline.start()
+    logger.info("API is ready for business card analysis!")
+
+    yield
+
+    # Finish (or suspend as jobs) the pipelines still running, before anything stops
+    await drain_controller.wait()
+    # Flush queued history rows before the process exits
+    await card_index.stop()
+    await elevenlabs_service.stop()
+    await history_store.stop()
+    await loop_monitor.stop()
+    log_writer.stop()
+
 
 # Create FastAPI app with American Psycho themed metadata
 app = FastAPI(
@@ -20,19 +69,53 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 
-# Add startup event to verify routes
-@app.on_event("startup")
-async def startup_event():
-    print("🎭 Psycho Score API starting up...")
-    print("Available routes:")
-    for route in app.routes:
-        print(
-            f"   {route.methods if hasattr(route, 'methods') else 'MOUNT'} {route.path}"
+# Registered before CORS so that shed responses still carry CORS headers
+@app.middleware("http")
+async def admit(request: Request, call_next):
+    """Queue expensive routes by priority and shed those that would miss their deadline"""
+    priority = admission_controller.priority_for(request.url.path)
+    if not settings.ADMISSION_ENABLED or priority is None:
+        return await call_next(request)
+
+    deadline = settings.ADMISSION_DEADLINES[priority]
+    # Clients may ask for a tighter (never a looser) deadline
+    try:
+        deadline = min(deadline, float(request.headers["X-Request-Timeout"]))
+    except (KeyError, ValueError):
+        pass
+
+    try:
+        ticket = await admission_controller.acquire(priority, deadline)
+    except RequestShed as e:
+        return ORJSONResponse(
+            status_code=503,
+            content={"detail": "Patrick is busy. Try again shortly.", "reason": e.reason},
+            headers={"Retry-After": str(e.retry_after)},
         )
-    print("API is ready for business card analysis!")
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        admission_controller.release(ticket)
+        raise
+
+    # Hold the slot until the body (e.g. an NDJSON stream) has been sent
+    body = response.body_iterator
+
+    async def release_after_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            admission_controller.release(ticket)
+
+    response.body_iterator = release_after_body()
+    return response
 
 
 # Configure CORS for frontend
@@ -42,8 +125,81 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Usage", "Server-Timing", "Retry-After", "ETag", "Accept-Ranges", "Content-Range",
+        "X-Request-ID",
+    ],
 )
 
+
+@app.middleware("http")
+async def track_usage(request: Request, call_next):
+    """Attribute upstream tokens and characters to each request and charge budgets"""
+    record = UsageRecord(
+        client_id=client_id_for(
+            request.headers.get("X-Client-ID"), request.client.host if request.client else None
+        )
+    )
+    # The route (and a streamed body) runs in a task that copied this context
+    token = current_usage.set(record)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        await usage_tracker.finish(record)
+        raise
+    finally:
+        current_usage.reset(token)
+
+    # An NDJSON stream is analyzed while its body is sent, after the headers;
+    # its usage is in the last event instead
+    if not response.headers.get("content-type", "").startswith("application/x-ndjson"):
+        response.headers["X-Usage"] = record.header_value()
+
+    # Charge once the body has been sent, whatever it cost
+    body = response.body_iterator
+
+    async def finish_after_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            await usage_tracker.finish(record)
+
+    response.body_iterator = finish_after_body()
+    return response
+
+
+# Registered last, so it is outermost and every other middleware logs with the ID
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Tag everything logged for a request with its ID, and log one line per request"""
+    rid = (request.headers.get("X-Request-ID") or uuid.uuid4().hex)[:64]
+    id_token = request_id.set(rid)
+    sampled_token = log_sampled.set(sample(request.url.path))
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        # Time to the response headers; streamed bodies may take longer
+        logger.info(
+            "request",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            },
+        )
+        response.headers["X-Request-ID"] = rid
+        return response
+    except Exception:
+        logger.exception(
+            "request failed", extra={"method": request.method, "path": request.url.path}
+        )
+        raise
+    finally:
+        log_sampled.reset(sampled_token)
+        request_id.reset(id_token)
+
 # Mount static file directories
 os.makedirs(settings.AUDIO_OUTPUT_PATH, exist_ok=True)
 os.makedirs(settings.IMAGE_UPLOAD_PATH, exist_ok=True)
@@ -53,9 +209,12 @@ app.include_router(
     analyze.router, prefix="/api/analyze", tags=["Business Card Analysis"]
 )
 app.include_router(audio.router, prefix="/api/audio", tags=["Text-to-Speech"])
+app.include_router(history.router, prefix="/api/history", tags=["History"])
+app.include_router(audio.files_router, prefix="/audio")
+if settings.ADMIN_ENABLED:
+    app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 
 # Mount static files after API routes
-app.mount("/audio", StaticFiles(directory=settings.AUDIO_OUTPUT_PATH), name="audio")
 app.mount("/images", StaticFiles(directory=settings.IMAGE_UPLOAD_PATH), name="images")
 
 
@@ -74,9 +233,15 @@ def root():
     return HTMLResponse(content=html_content)
 
 
-@app.get("/health")
+@app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Comprehensive health check"""
+    """Comprehensive health check (503 while draining, so load balancers move on)"""
+    if drain_controller.draining:
+        return ORJSONResponse(
+            status_code=503,
+            content={"status": "draining", "service": "Psycho Score API", "version": "1.0.0"},
+            headers={"Retry-After": str(settings.SHUTDOWN_RETRY_AFTER)},
+        )
     return {
         "status": "healthy",
         "service": "Psycho Score API",
@@ -88,73 +253,18 @@ async def health_check():
             "battle": "/api/analyze/alpha-vs-beta",
             "audio": "/api/audio/generate",
             "docs": "/docs",
+            "metrics": "/metrics",
         },
     }
 
 
-# DIRECT ENDPOINT WITH REAL GEMINI INTEGRATION
-@app.post("/api/analyze/psycho-score")
-async def quick_analysis_endpoint(file: UploadFile = File(...)):
-    """
-    Quick business card analysis using Gemini AI
-    Accept image file, analyze with Gemini, return Patrick's critique with audio
-    """
-    try:
-        # Read the uploaded file
-        content = await file.read()
-
-        # Validate it's an image
-        if not file.content_type.startswith("image/"):
-            raise HTTPException(
-                status_code=400, detail="Only image files are supported"
-            )
-
-        # Open image for base64 encoding
-        image = Image.open(io.BytesIO(content))
-
-        # Convert image to base64 for returning to frontend
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode()
-
-        # Reset file pointer for Gemini service
-        file.file = io.BytesIO(content)
-
-        # CALL YOUR ACTUAL GEMINI SERVICE
-        analysis = await gemini_service.analyze_business_card(file)
-
-        # Clean up the Patrick critique text for more natural speech
-        critique_text = analysis.patrick_critique
-        # Remove any potential JSON artifacts or formatting
-        critique_text = critique_text.replace('"', "").replace("\\n", " ").strip()
-
-        # Generate audio from Patrick's critique using ElevenLabs
-        from services.elevenlabs_service import elevenlabs_service
-
-        audio_response = await elevenlabs_service.generate_audio(
-            text=critique_text,
-            voice_id=None,  # Use default Patrick voice
-        )
-
-        # Convert Pydantic model to dict and add the card image and audio
-        analysis_dict = analysis.dict()
-        analysis_dict["cardImage"] = f"data:image/jpeg;base64,{img_base64}"
-        analysis_dict["audio_url"] = audio_response.audio_url
-
-        # Return JSONResponse with explicit status code
-        return JSONResponse(
-            content=analysis_dict,
-            status_code=HTTPStatus.OK,  # 200
-        )
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Error processing image: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+@app.get("/metrics", response_model=MetricsResponse)
+async def get_metrics():
+    """Pipeline stage timings, request counts and errors for this worker"""
+    return ORJSONResponse(metrics.snapshot())
 
 
-@app.get("/api")
+@app.get("/api", response_model=ApiInfoResponse)
 async def api_info():
     """API information endpoint"""
     return {
@@ -173,5 +283,7 @@ async def api_info():
             "POST /api/analyze/alpha-vs-beta": "🥊 BATTLE: Upload two cards → Patrick decides ALPHA vs BETA + audio verdict",
             "POST /api/audio/generate": "🎵 Generate audio from text",
             "GET /api/audio/voices": "🎤 List available voices",
+            "GET /api/history/analyses": "📜 Page through past analyses",
+            "GET /api/history/top": "🏆 Top cards by psycho_score, no model calls",
         },
     }
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 
 
@@ -71,3 +71,130 @@ class ErrorResponse(BaseModel):
     error: str = Field(..., description="Error message")
     detail: Optional[str] = Field(None, description="Detailed error information")
     error_code: Optional[str] = Field(None, description="Error code")
+
+
+# Response models: the shape of every JSON route, used for the OpenAPI schema
+# and to check ?fields= selections. Routes send the pipeline's dicts through
+# ORJSONResponse directly rather than re-validating them on every request.
+
+
+class ModelTier(BaseModel):
+    """Gemini model tier that served a request"""
+
+    tier: str = Field(..., description="fast or strong")
+    escalations: List[str] = Field(default_factory=list, description="Why it moved to strong")
+
+
+class NearDuplicate(BaseModel):
+    """A previously scored card that looks the same"""
+
+    history_id: str
+    distance: int = Field(..., description="Differing perceptual hash bits")
+    psycho_score: float
+    message: str
+
+
+class CardRegionInfo(BaseModel):
+    corners: List[Tuple[float, float]]
+    area_ratio: float
+    fill_ratio: float
+
+
+class AnalysisDetails(BaseModel):
+    typography: Dict[str, Any]
+    color_scheme: Dict[str, Any]
+    design_elements: Dict[str, Any]
+    material_impression: str
+
+
+class ScoredCardResponse(BusinessCardAnalysis):
+    """One card of a multi-card photo"""
+
+    provisional_score: Optional[float] = None
+    design_features: Optional[Dict[str, float]] = None
+    card_region: CardRegionInfo
+    near_duplicate: Optional[NearDuplicate] = None
+
+
+class PsychoScoreResponse(BusinessCardAnalysis):
+    """Response of /api/analyze/psycho-score"""
+
+    audio_url: Optional[str] = None
+    audio_duration: Optional[float] = Field(None, description="Duration in seconds")
+    provisional_score: Optional[float] = Field(None, description="Instant local estimate")
+    design_features: Optional[Dict[str, float]] = None
+    near_duplicate: Optional[NearDuplicate] = None
+    model_tier: ModelTier
+    analysis_details: AnalysisDetails
+    cardImage: Optional[str] = Field(None, description="The analysed card as a JPEG data URL")
+    cards: Optional[List[ScoredCardResponse]] = Field(None, description="Every card in the photo")
+    best_card: Optional[int] = Field(None, description="Index into cards of the top-level card")
+
+
+class QuickAnalysisResponse(BaseModel):
+    """Response of /api/analyze/quick-analysis"""
+
+    psycho_score: float
+    patrick_critique: str
+    model_tier: ModelTier
+
+
+class BattleResult(BaseModel):
+    verdict: str = Field(..., description="ALPHA if the original card wins, BETA if the contender wins")
+    winner: str = Field(..., description="original (verdict ALPHA) or contender (verdict BETA)")
+    announcement: Optional[str] = None
+    audio_url: Optional[str] = None
+    audio_duration: Optional[float] = None
+
+
+class BattleDetails(BaseModel):
+    original_card: Dict[str, Any]
+    contender_card: Dict[str, Any]
+    patrick_comparison: str
+    winner_reasoning: str
+
+
+class BattleScores(BaseModel):
+    original_score: float
+    contender_score: float
+
+
+class BattleResponse(BaseModel):
+    """Response of /api/analyze/alpha-vs-beta"""
+
+    battle_result: BattleResult
+    detailed_analysis: BattleDetails
+    scores: BattleScores
+    model_tier: ModelTier
+
+
+class VoicesResponse(BaseModel):
+    """ElevenLabs voice list, passed through as returned"""
+
+    model_config = ConfigDict(extra="allow")
+
+    voices: List[Dict[str, Any]]
+
+
+class HealthResponse(BaseModel):
+    status: str
+    service: str
+    version: Optional[str] = None
+    patrick_says: Optional[str] = None
+    endpoints: Optional[Dict[str, str]] = None
+
+
+class ApiInfoResponse(BaseModel):
+    title: str
+    description: str
+    version: str
+    features: List[str]
+    endpoints: Dict[str, str]
+
+
+class MetricsResponse(BaseModel):
+    """Counters, gauges and histogram summaries of this worker"""
+
+    counters: Dict[str, float]
+    gauges: Dict[str, float]
+    histograms: Dict[str, Dict[str, float]]
@@ -0,0 +1,75 @@
+import asyncio
+import secrets
+import time
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from config.settings import settings
+from utils.profiling import memory_tracer, sample_stacks, task_tracker
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Only requests carrying ADMIN_TOKEN get through"""
+    if not settings.ADMIN_TOKEN or not secrets.compare_digest(
+        x_admin_token or "", settings.ADMIN_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+# One profile at a time; two samplers would mostly profile each other
+_profile_lock = asyncio.Lock()
+
+
+@router.get("/profile/cpu", response_class=PlainTextResponse)
+async def cpu_profile(
+    seconds: float = Query(10.0, gt=0, le=settings.ADMIN_PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5.0, ge=1, le=1000, description="Time between samples"),
+):
+    """🔥 Sample every thread's stack for N seconds; returns collapsed stacks for a flamegraph"""
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with _profile_lock:
+        stacks = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000)
+    filename = f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"
+    return PlainTextResponse(
+        stacks, headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/memory/start")
+async def start_memory_trace(frames: int = Query(25, ge=1, le=100)):
+    """Start tracemalloc (if needed) and take the baseline snapshot"""
+    await asyncio.to_thread(memory_tracer.start, frames)
+    return memory_tracer.status()
+
+
+@router.get("/memory/diff")
+async def memory_diff(
+    limit: int = Query(20, ge=1, le=200),
+    key_type: Literal["lineno", "traceback", "filename"] = Query("traceback"),
+    match: Optional[str] = Query(None, description="Only allocations with a frame in a matching file, e.g. image_processing"),
+    reset: bool = Query(False, description="Make this snapshot the new baseline"),
+):
+    """📈 Where memory grew since the baseline snapshot, largest first"""
+    if memory_tracer.baseline is None:
+        raise HTTPException(status_code=409, detail="Not tracing; POST /admin/memory/start first")
+    top = await asyncio.to_thread(memory_tracer.diff, key_type, limit, match)
+    if reset:
+        await asyncio.to_thread(memory_tracer.reset)
+    return {**memory_tracer.status(), "top": top}
+
+
+@router.post("/memory/stop")
+async def stop_memory_trace():
+    """Stop tracemalloc and drop the baseline (tracing slows allocation down)"""
+    memory_tracer.stop()
+    return memory_tracer.status()
+
+
+@router.get("/tasks")
+async def list_tasks(stack_depth: int = Query(8, ge=1, le=50)):
+    """🧵 Pending asyncio tasks with their ages and what they are awaiting, oldest first"""
+    tasks = task_tracker.describe(stack_depth)
+    return {"count": len(tasks), "tasks": tasks}
@@ -1,13 +1,66 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from services.gemini_service import gemini_service
-from services.elevenlabs_service import elevenlabs_service
-from utils.image_processing import image_processor
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query, WebSocket
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import AsyncIterator, Optional
+from models.schemas import (
+    BattleResponse,
+    HealthResponse,
+    PsychoScoreResponse,
+    QuickAnalysisResponse,
+)
+from services.live_battle import LiveBattleSession
+from services.pipeline import (
+    analysis_pipeline,
+    PSYCHO_SCORE,
+    QUICK_ANALYSIS,
+    ALPHA_VS_BETA,
+)
+from services.usage import current_usage
+from utils.serialization import dumps, parse_fields
 
 router = APIRouter()
 
 
-@router.post("/psycho-score")
-async def psycho_score_analysis(file: UploadFile = File(...)):
+async def _ndjson_events(first: dict, events: AsyncIterator[dict]):
+    """Serialize pipeline events as newline-delimited JSON
+
+    Each event is held until the next one arrives, so the last (the result
+    or an error) can carry the request's usage: the X-Usage header went out
+    before the analysis ran.
+    """
+    last = first
+    try:
+        async for event in events:
+            yield dumps(last) + b"\n"
+            last = event
+    except HTTPException as e:
+        yield dumps(last) + b"\n"
+        last = {"event": "error", "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        yield dumps(last) + b"\n"
+        last = {"event": "error", "status_code": 500, "detail": f"Error: {str(e)}"}
+
+    record = current_usage.get()
+    if record is not None:
+        last = {**last, "usage": record.summary()}
+    yield dumps(last) + b"\n"
+
+
+@router.post("/psycho-score", response_model=PsychoScoreResponse)
+async def psycho_score_analysis(
+    file: UploadFile = File(...),
+    stream: bool = Query(
+        False, description="Stream the provisional score first, then the full result"
+    ),
+    detail: bool = Query(
+        False, description="Always use the strong Gemini model instead of the endpoint's default tier"
+    ),
+    output_format: Optional[str] = Query(
+        None, description="Audio format, e.g. mp3_22050_32 or opus_48000_32 for smaller files"
+    ),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated fields to return, e.g. psycho_score,audio_url"
+    ),
+):
     """
     🎭 PSYCHO SCORE - The main endpoint that does exactly what you described:
 
@@ -16,59 +69,78 @@ async def psycho_score_analysis(file: UploadFile = File(...)):
     3. Generates Patrick Bateman-style description
     4. Sends to ElevenLabs for TTS in Patrick's voice
     5. Returns complete result to user
+
+    With ?stream=true the response is NDJSON: a "provisional" event with an
+    instant local score and design features, then the "result" event.
+    With ?detail=true the strong model tier is used from the start.
+    With ?fields=psycho_score,audio_url only those fields are returned.
     """
     try:
-        # Step 1: Validate uploaded business card image
-        image_processor.validate_image(file)
-
-        # Step 2: Send to Gemini for analysis (shape, color, font, details)
-        analysis = await gemini_service.analyze_business_card(file)
-
-        # Step 3: Take Patrick's description and send to ElevenLabs with your custom voice
-        audio_response = await elevenlabs_service.generate_audio(
-            text=analysis.patrick_critique,
-            voice_id=None,  # This will use your custom voice from settings
+        selected = parse_fields(fields, PsychoScoreResponse)
+        if stream:
+            events = analysis_pipeline.stream(
+                file, PSYCHO_SCORE, detail, output_format, selected
+            )
+            # Run up to the provisional score here so bad uploads still get a 4xx
+            first = await events.__anext__()
+            return StreamingResponse(
+                _ndjson_events(first, events), media_type="application/x-ndjson"
+            )
+
+        context = await analysis_pipeline.run(
+            file, PSYCHO_SCORE, detail, output_format, selected
+        )
+        return ORJSONResponse(
+            context.response, headers={"Server-Timing": context.server_timing()}
         )
 
-        # Step 4: Return complete result to user
-        return {
-            "psycho_score": analysis.psycho_score,
-            "patrick_critique": analysis.patrick_critique,
-            "audio_url": audio_response.audio_url,
-            "analysis_details": {
-                "typography": analysis.typography,
-                "color_scheme": analysis.color_scheme,
-                "design_elements": analysis.design_elements,
-                "material_impression": analysis.material_impression,
-            },
-        }
-
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
-@router.post("/quick-analysis")
-async def quick_business_card_analysis(file: UploadFile = File(...)):
+@router.post("/quick-analysis", response_model=QuickAnalysisResponse)
+async def quick_business_card_analysis(
+    file: UploadFile = File(...),
+    detail: bool = Query(
+        False, description="Always use the strong Gemini model instead of the endpoint's default tier"
+    ),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated fields to return, e.g. psycho_score,patrick_critique"
+    ),
+):
     """
     Quick analysis without audio - just Patrick's written critique
     """
     try:
-        image_processor.validate_image(file)
-        analysis = await gemini_service.analyze_business_card(file)
-
-        return {
-            "psycho_score": analysis.psycho_score,
-            "patrick_critique": analysis.patrick_critique,
-        }
+        selected = parse_fields(fields, QuickAnalysisResponse)
+        context = await analysis_pipeline.run(
+            file, QUICK_ANALYSIS, detail, fields=selected
+        )
+        return ORJSONResponse(
+            context.response, headers={"Server-Timing": context.server_timing()}
+        )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
-@router.post("/alpha-vs-beta")
+@router.post("/alpha-vs-beta", response_model=BattleResponse)
 async def alpha_vs_beta_battle(
     original: UploadFile = File(..., description="The original business card"),
     contender: UploadFile = File(..., description="The contender's business card"),
+    detail: bool = Query(
+        False, description="Always use the strong Gemini model instead of the endpoint's default tier"
+    ),
+    output_format: Optional[str] = Query(
+        None, description="Audio format, e.g. mp3_22050_32 or opus_48000_32 for smaller files"
+    ),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated fields to return, e.g. scores,battle_result.verdict"
+    ),
 ):
     """
     🥊 ALPHA VS BETA BATTLE - Patrick Bateman decides who dominates!
@@ -81,60 +153,41 @@ async def alpha_vs_beta_battle(
     with a dramatic audio announcement of the verdict!
     """
     try:
-        # Step 1: Validate both uploaded images
-        image_processor.validate_image(original)
-        image_processor.validate_image(contender)
-
-        # Step 2: Send both cards to Gemini for competitive analysis
-        comparison = await gemini_service.compare_business_cards(original, contender)
-
-        # Step 3: Determine the verdict and create announcement
-        verdict = comparison.get("final_verdict", "BETA")
-        winner_reasoning = comparison.get(
-            "winner_reasoning", "Superior design execution"
+        selected = parse_fields(fields, BattleResponse)
+        context = await analysis_pipeline.run_battle(
+            original, contender, ALPHA_VS_BETA, detail, output_format, selected
         )
-
-        # Create dramatic announcement text
-        if verdict == "ALPHA":
-            announcement_text = f"ALPHA! The challenger card dominates with superior sophistication. {winner_reasoning}"
-        else:
-            announcement_text = f"BETA! The challenger card has been defeated by inferior execution. {winner_reasoning}"
-
-        # Step 4: Generate audio announcement with your custom voice
-        audio_response = await elevenlabs_service.generate_audio(
-            text=announcement_text,
-            voice_id=None,  # Uses your custom voice from settings
+        return ORJSONResponse(
+            context.response, headers={"Server-Timing": context.server_timing()}
         )
 
-        # Step 5: Return complete battle results
-        return {
-            "battle_result": {
-                "verdict": verdict,
-                "winner": "original" if verdict == "ALPHA" else "contender",
-                "announcement": announcement_text,
-                "audio_url": audio_response.audio_url,
-            },
-            "detailed_analysis": {
-                "original_card": comparison.get("card1_analysis", {}),
-                "contender_card": comparison.get("card2_analysis", {}),
-                "patrick_comparison": comparison.get("comparison_critique", ""),
-                "winner_reasoning": winner_reasoning,
-            },
-            "scores": {
-                "original_score": comparison.get("card1_analysis", {}).get(
-                    "psycho_score", 0
-                ),
-                "contender_score": comparison.get("card2_analysis", {}).get(
-                    "psycho_score", 0
-                ),
-            },
-        }
-
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Battle analysis error: {str(e)}")
 
 
-@router.get("/health")
+@router.websocket("/alpha-vs-beta/live")
+async def alpha_vs_beta_live(
+    websocket: WebSocket,
+    detail: bool = Query(False),
+    output_format: Optional[str] = Query(None),
+):
+    """
+    🥊 LIVE ALPHA VS BETA - one session, many contenders
+
+    Send the original card as a binary message and it is scored right away;
+    every later card battles it as soon as it arrives. Events are pushed as
+    JSON text messages: card_received, card_prepared (provisional score),
+    card_scored, verdict, result, then the audio as binary chunks between
+    audio and audio_end. Cards stay in the session, so
+    {"type": "battle", "original": 0, "contender": 2} replays a pairing
+    without uploading either card again.
+    """
+    await LiveBattleSession(websocket, detail, output_format).run()
+
+
+@router.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "Psycho Score API"}
@@ -1,19 +1,35 @@
-from fastapi import APIRouter, HTTPException, Form
-from fastapi.responses import FileResponse
-from typing import Optional
+from fastapi import APIRouter, HTTPException, Form, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import AsyncIterator, Optional, Tuple
+from email.utils import formatdate
+import aiofiles
 import os
-from services.elevenlabs_service import elevenlabs_service
+import re
+from services.elevenlabs_service import elevenlabs_service, AUDIO_MEDIA_TYPES
+from services.prompts import CRITIQUE_PREFIX
 from config.settings import settings
+from models.schemas import AudioResponse, HealthResponse, VoicesResponse
+from utils.metrics import metrics
 
 router = APIRouter()
+# Mounted at /audio, where generated audio_urls point
+files_router = APIRouter()
 
+# Named after a hash of text, voice, model and format, so a name never changes content
+CONTENT_ADDRESSED = re.compile(r"^psycho_analysis_(?P<digest>[0-9a-f]{32})\.\w+$")
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
 
-@router.post("/generate")
+
+@router.post("/generate", response_model=AudioResponse)
 async def generate_audio_from_text(
     text: str = Form(..., description="Text to convert to speech"),
     voice_id: Optional[str] = Form(
         default=None, description="ElevenLabs voice ID override"
     ),
+    output_format: Optional[str] = Form(
+        default=None, description="e.g. mp3_22050_32 or opus_48000_32 for smaller files"
+    ),
 ):
     """Generate audio from text using ElevenLabs TTS"""
     try:
@@ -26,9 +42,9 @@ async def generate_audio_from_text(
             )
 
         audio_response = await elevenlabs_service.generate_audio(
-            text=text, voice_id=voice_id
+            text=text, voice_id=voice_id, output_format=output_format
         )
-        return audio_response
+        return ORJSONResponse(audio_response.model_dump())
 
     except HTTPException:
         raise
@@ -36,8 +52,10 @@ async def generate_audio_from_text(
         raise HTTPException(status_code=500, detail=f"Error generating audio: {str(e)}")
 
 
-@router.post("/patrick-critique")
-async def generate_patrick_audio(text: str = Form(...)):
+@router.post("/patrick-critique", response_model=AudioResponse)
+async def generate_patrick_audio(
+    text: str = Form(...), output_format: Optional[str] = Form(default=None)
+):
     """Generate Patrick Bateman style audio critique"""
     try:
         # Add Patrick Bateman style flair if not already present
@@ -46,39 +64,148 @@ async def generate_patrick_audio(text: str = Form(...)):
             phrase in enhanced_text.lower()
             for phrase in ["look at that", "subtle", "tasteful", "elegant"]
         ):
-            enhanced_text = f"Look at that subtle off-white coloring... {enhanced_text}"
+            enhanced_text = f"{CRITIQUE_PREFIX} {enhanced_text}"
 
-        audio_response = await elevenlabs_service.generate_audio(text=enhanced_text)
-        return audio_response
+        audio_response = await elevenlabs_service.generate_audio(
+            text=enhanced_text, output_format=output_format, prefix=CRITIQUE_PREFIX
+        )
+        return ORJSONResponse(audio_response.model_dump())
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error generating Patrick audio: {str(e)}"
         )
 
 
-@router.get("/voices")
+@router.get("/voices", response_model=VoicesResponse)
 async def get_available_voices():
     """Get list of available ElevenLabs voices"""
     try:
         voices = await elevenlabs_service.get_available_voices()
-        return voices
+        return ORJSONResponse(voices)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching voices: {str(e)}")
 
 
-@router.get("/file/{filename}")
-async def get_audio_file(filename: str):
-    """Serve audio files"""
-    file_path = os.path.join(settings.AUDIO_OUTPUT_PATH, filename)
+def _cache_headers(filename: str, stat: os.stat_result) -> dict:
+    """ETag and Cache-Control: generated files never change, anything else is revalidated"""
+    match = CONTENT_ADDRESSED.match(filename)
+    if match:
+        return {
+            "ETag": f'"{match.group("digest")}"',
+            "Cache-Control": f"public, max-age={settings.AUDIO_CACHE_MAX_AGE}, immutable",
+        }
+    return {
+        "ETag": f'W/"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+        "Cache-Control": "no-cache",
+    }
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires"""
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in header.split(","))
+
+
+def _byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single-range Range header, None to send it all
+
+    Raises 416 for a range that starts past the end of the file.
+    """
+    match = RANGE_HEADER.match(header.replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        return None  # Multiple or malformed ranges: the whole file is a valid reply
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1  # The final N bytes
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+async def _read_range(path: str, start: int, length: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
 
-    if not os.path.exists(file_path):
+
+async def serve_audio(request: Request, filename: str) -> Response:
+    """Send a generated audio file with Range, ETag/304 and cache headers"""
+    file_path = os.path.join(settings.AUDIO_OUTPUT_PATH, os.path.basename(filename))
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in AUDIO_MEDIA_TYPES or not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="Audio file not found")
 
-    return FileResponse(path=file_path, media_type="audio/mpeg", filename=filename)
+    stat = os.stat(file_path)
+    headers = {
+        **_cache_headers(filename, stat),
+        "Accept-Ranges": "bytes",
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Content-Disposition": f'inline; filename="{filename}"',
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, headers["ETag"]):
+        metrics.incr("audio.not_modified")
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # A stale If-Range means the client's partial copy is of another version
+    if range_header and (not if_range or if_range == headers["ETag"]):
+        byte_range = _byte_range(range_header, stat.st_size)
+
+    status_code = 200
+    start, end = 0, stat.st_size - 1
+    if byte_range:
+        status_code = 206
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+
+    metrics.incr(f"audio.responses.{status_code}")
+    media_type = AUDIO_MEDIA_TYPES[extension]
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    metrics.incr("audio.bytes_sent", length)
+    return StreamingResponse(
+        _read_range(file_path, start, length),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
+
+
+@router.api_route("/file/{filename}", methods=["GET", "HEAD"])
+async def get_audio_file(request: Request, filename: str):
+    """Serve audio files"""
+    return await serve_audio(request, filename)
+
+
+@files_router.api_route("/{filename}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_generated_audio(request: Request, filename: str):
+    """The audio_url of every generated file"""
+    return await serve_audio(request, filename)
 
 
-@router.get("/health")
+@router.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "Psycho Score Audio API"}
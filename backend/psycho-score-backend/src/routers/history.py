@@ -0,0 +1,45 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from services.history_store import history_store
+
+router = APIRouter()
+
+
+@router.get("/analyses")
+async def list_analyses(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+):
+    """Page through past analyses, newest first"""
+    try:
+        return await history_store.list_analyses(limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/comparisons")
+async def list_comparisons(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+):
+    """Page through past ALPHA vs BETA battles, newest first"""
+    try:
+        return await history_store.list_comparisons(limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/top")
+async def top_cards(
+    n: int = Query(10, ge=1, le=100),
+    distinct: bool = Query(True, description="Only the best analysis of each card"),
+):
+    """🏆 Leaderboard: highest psycho_score cards, straight from history"""
+    return {"items": await history_store.top_analyses(n=n, distinct=distinct)}
+
+
+@router.get("/cards/{image_hash}")
+async def card_history(image_hash: str, limit: int = Query(20, ge=1, le=100)):
+    """Has this exact card been scored before?"""
+    items = await history_store.find_by_hash(image_hash, limit=limit)
+    return {"seen_before": bool(items), "items": items}
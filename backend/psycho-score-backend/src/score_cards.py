@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Score a directory or archive of business cards offline, no server needed
+
+Runs every image through the same analysis pipeline as the API, with bounded
+concurrency, skipping byte-identical duplicates. Each result is appended to a
+checkpoint (.jsonl, or .db/.sqlite for SQLite) as soon as it is scored, so an
+interrupted run picks up where it left off when started again with the same
+checkpoint. Prints a leaderboard of every card in the checkpoint at the end.
+
+Usage (from the src directory, like the API):
+    python score_cards.py ~/scans
+    python score_cards.py scans.zip --concurrency 16 --checkpoint nightly.db
+    python score_cards.py ~/scans --output leaderboard.csv --top 50
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+import tarfile
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+
+from services.card_index import card_index
+from services.history_store import history_store
+from services.pipeline import analysis_pipeline, BATCH_SCORE
+from utils.image_processing import compute_image_hash
+
+CONTENT_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+
+
+@dataclass
+class CardFile:
+    """An image in the input directory or archive, read only when its turn comes"""
+
+    name: str
+    read: Callable[[], bytes]
+
+    @property
+    def content_type(self) -> str:
+        return CONTENT_TYPES[os.path.splitext(self.name)[1].lower()]
+
+
+def is_image(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in CONTENT_TYPES
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def find_cards(source: str) -> List[CardFile]:
+    """Every image in a directory tree, .zip or .tar(.gz) archive, in name order"""
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names
+            if is_image(name)
+        )
+        return [CardFile(path, lambda path=path: read_file(path)) for path in paths]
+
+    if zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        return [
+            CardFile(name, lambda name=name: archive.read(name))
+            for name in sorted(archive.namelist())
+            if is_image(name)
+        ]
+
+    if tarfile.is_tarfile(source):
+        archive = tarfile.open(source)
+        return [
+            CardFile(member.name, lambda member=member: archive.extractfile(member).read())
+            for member in sorted(archive.getmembers(), key=lambda member: member.name)
+            if member.isfile() and is_image(member.name)
+        ]
+
+    raise SystemExit(f"❌ Not a directory, .zip or .tar archive: {source}")
+
+
+class JsonlCheckpoint:
+    """One JSON line per scored card; a later line for a hash replaces an earlier one"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a+", encoding="utf-8")
+        # Finish a line cut short by an interrupted run, so the next record starts cleanly
+        if self._file.tell():
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+
+    def load(self) -> Dict[str, dict]:
+        records = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by an interrupted run
+                records[record["image_hash"]] = record
+        return records
+
+    def write(self, record: dict) -> None:
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SqliteCheckpoint:
+    """The same records in a SQLite table, keyed by image hash"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (image_hash TEXT PRIMARY KEY, record TEXT NOT NULL)"
+        )
+
+    def load(self) -> Dict[str, dict]:
+        rows = self._conn.execute("SELECT record FROM results").fetchall()
+        return {record["image_hash"]: record for record in (json.loads(row[0]) for row in rows)}
+
+    def write(self, record: dict) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (image_hash, record) VALUES (?, ?)",
+                (record["image_hash"], json.dumps(record)),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def open_checkpoint(path: str):
+    if os.path.splitext(path)[1].lower() in (".db", ".sqlite", ".sqlite3"):
+        return SqliteCheckpoint(path)
+    return JsonlCheckpoint(path)
+
+
+class Progress:
+    """Single status line on stderr (a line every 100 cards when not a terminal)"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.counts = {"scored": 0, "resumed": 0, "duplicate": 0, "failed": 0}
+        self.started_at = time.perf_counter()
+        self._tty = sys.stderr.isatty()
+        self._shown_at = 0.0
+
+    @property
+    def done(self) -> int:
+        return sum(self.counts.values())
+
+    def update(self, outcome: str) -> None:
+        self.counts[outcome] += 1
+        now = time.perf_counter()
+        if self._tty and now - self._shown_at < 0.2 and self.done < self.total:
+            return
+        if not self._tty and self.done % 100 and self.done < self.total:
+            return
+        self._shown_at = now
+        self.show()
+        if self._tty and self.done == self.total:
+            sys.stderr.write("\n")
+
+    def show(self) -> None:
+        elapsed = time.perf_counter() - self.started_at
+        rate = self.counts["scored"] / elapsed if elapsed else 0.0
+        remaining = self.total - self.done
+        eta = f"{remaining / rate / 60:.1f} min" if rate else "?"
+        line = (
+            f"🃏 {self.done}/{self.total}  scored {self.counts['scored']}  "
+            f"resumed {self.counts['resumed']}  duplicate {self.counts['duplicate']}  "
+            f"failed {self.counts['failed']}  {rate:.1f} cards/s  ETA {eta}"
+        )
+        if self._tty:
+            sys.stderr.write(f"\r{line}\033[K")
+        else:
+            sys.stderr.write(line + "\n")
+        sys.stderr.flush()
+
+
+async def score_card(card: CardFile, image_data: bytes, image_hash: str) -> dict:
+    """Run one card through the pipeline and build its checkpoint record"""
+    upload = UploadFile(
+        io.BytesIO(image_data),
+        size=len(image_data),
+        filename=card.name,
+        headers=Headers({"content-type": card.content_type}),
+    )
+    record = {"image_hash": image_hash, "file": card.name, "scored_at": time.time()}
+    try:
+        context = await analysis_pipeline.run(upload, BATCH_SCORE)
+        record.update(psycho_score=context.response["psycho_score"], result=context.response)
+    except HTTPException as e:
+        record["error"] = f"{e.status_code}: {e.detail}"
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+async def score_all(cards: List[CardFile], checkpoint, concurrency: int) -> None:
+    done = {
+        image_hash: record
+        for image_hash, record in checkpoint.load().items()
+        if not record.get("error")  # Failures are retried
+    }
+    progress = Progress(len(cards))
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def produce() -> None:
+        """Read and hash cards one at a time, so at most the queue is held in memory"""
+        seen = set()
+        for card in cards:
+            try:
+                image_data = await asyncio.to_thread(card.read)
+            except (OSError, KeyError, tarfile.TarError, zipfile.BadZipFile) as e:
+                # Without its bytes there is no hash to checkpoint it under
+                print(f"\n⚠️  Could not read {card.name}: {e}", file=sys.stderr)
+                progress.update("failed")
+                continue
+
+            image_hash = compute_image_hash(image_data)
+            if image_hash in done:
+                progress.update("resumed")
+            elif image_hash in seen:
+                progress.update("duplicate")
+            else:
+                seen.add(image_hash)
+                await queue.put((card, image_data, image_hash))
+
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work() -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            record = await score_card(*item)
+            checkpoint.write(record)
+            progress.update("failed" if record.get("error") else "scored")
+
+    await asyncio.gather(produce(), *(work() for _ in range(concurrency)))
+
+
+def leaderboard(records: Dict[str, dict]) -> List[dict]:
+    """Scored cards, best first"""
+    scored = [record for record in records.values() if not record.get("error")]
+    return sorted(scored, key=lambda record: record["psycho_score"], reverse=True)
+
+
+def write_leaderboard(path: str, rows: List[dict]) -> None:
+    if path.lower().endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        return
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "psycho_score", "file", "image_hash", "patrick_critique"])
+        for rank, row in enumerate(rows, 1):
+            writer.writerow(
+                [rank, row["psycho_score"], row["file"], row["image_hash"],
+                 row["result"].get("patrick_critique", "")]
+            )
+
+
+def print_leaderboard(rows: List[dict], top: int) -> None:
+    print(f"\n🏆 Leaderboard ({len(rows)} cards)")
+    print("=" * 72)
+    for rank, row in enumerate(rows[:top], 1):
+        print(f"{rank:>4}. {row['psycho_score']:>5.1f}  {row['file']}")
+
+
+async def run(args) -> None:
+    cards = find_cards(args.source)
+    print(f"🃏 {len(cards)} card images in {args.source}")
+
+    checkpoint = open_checkpoint(args.checkpoint)
+    history_store.start()
+    await card_index.start()
+    try:
+        await score_all(cards, checkpoint, args.concurrency)
+        rows = leaderboard(checkpoint.load())
+        print_leaderboard(rows, args.top)
+        if args.output:
+            write_leaderboard(args.output, rows)
+            print(f"\n💾 Leaderboard written to {args.output}")
+    finally:
+        checkpoint.close()
+        await card_index.stop()
+        await history_store.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("source", help="Directory, .zip or .tar(.gz) of card images")
+    parser.add_argument("--checkpoint", default="outputs/score_cards.jsonl")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--top", type=int, default=20, help="Leaderboard rows to print")
+    parser.add_argument("--output", help="Write the full leaderboard (.csv or .json)")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.checkpoint) or ".", exist_ok=True)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrupted - run the same command again to resume")
+
+
+if __name__ == "__main__":
+    main()
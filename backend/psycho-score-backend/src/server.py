@@ -0,0 +1,72 @@
+"""
+Multi-worker launcher for the Psycho Score API.
+
+Every worker process imports its own copy of the app, so analysis caches, TTS
+caches, single-flight locks and upstream rate limits only hold across workers
+when they live in a shared state backend. This launcher selects one (SQLite WAL
+by default) before any worker starts.
+
+Usage (from the src directory):
+
+    python server.py --workers 4
+    python server.py --workers 4 --state-backend redis --redis-url redis://localhost:6379/0
+    gunicorn -c server.py main:app
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger(__name__)
+
+# Workers inherit this, so they all open the same shared store
+os.environ.setdefault("STATE_BACKEND", "sqlite")
+
+# gunicorn configuration, read when this file is passed with `gunicorn -c server.py`
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Longer than SHUTDOWN_DRAIN_TIMEOUT, so draining workers can suspend what is left
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the Psycho Score API with state shared across workers"
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=workers)
+    parser.add_argument(
+        "--state-backend",
+        choices=["sqlite", "redis", "memory"],
+        default=os.environ["STATE_BACKEND"],
+    )
+    parser.add_argument("--state-db", default=None, help="SQLite state file path")
+    parser.add_argument("--redis-url", default=None, help="Redis-compatible server URL")
+    args = parser.parse_args()
+
+    os.environ["STATE_BACKEND"] = args.state_backend
+    if args.state_db:
+        os.environ["STATE_DB_PATH"] = args.state_db
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+
+    if args.workers > 1 and args.state_backend == "memory":
+        logger.warning("⚠️  memory state backend: caches and rate limits are per worker")
+
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=graceful_timeout,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+from config.settings import settings
+from utils.metrics import metrics
+
+# Highest priority first; cheap interactive calls jump ahead of battles and audio
+PRIORITY_CLASSES = ("interactive", "standard", "batch")
+
+
+class RequestShed(Exception):
+    """A request that cannot be served before its deadline and was not started"""
+
+    def __init__(self, priority: str, reason: str, retry_after: float):
+        super().__init__(f"{priority} request shed: {reason}")
+        self.priority = priority
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+@dataclass
+class Ticket:
+    """A slot held by an admitted request, released once its response is sent"""
+
+    priority: str
+    admitted_at: float
+    released: bool = False
+
+
+class AdmissionController:
+    """Priority queues with deadlines in front of the expensive routes
+
+    At most ADMISSION_MAX_CONCURRENT requests run at once per worker. The
+    rest wait in a bounded queue per priority class, and a freed slot always
+    goes to the highest class with a waiter. A request is shed with a 503
+    instead of being started when its queue is full, when the predicted wait
+    plus its usual service time would miss its deadline, or when it has
+    waited so long that it no longer could make it.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.closed = False  # Draining: everything is shed, see close()
+        self._queues: Dict[str, Deque[asyncio.Future]] = {
+            priority: deque() for priority in PRIORITY_CLASSES
+        }
+
+    def priority_for(self, path: str) -> Optional[str]:
+        """Priority class of a route, None for routes that are always admitted"""
+        return settings.ADMISSION_ROUTES.get(path.rstrip("/"))
+
+    def _service_time(self, priority: Optional[str] = None) -> float:
+        """Median seconds a request holds its slot (all classes if None)"""
+        name = f"admission.{priority}.service" if priority else "admission.service"
+        return metrics.histogram(name).percentile(50)
+
+    def _waiting_ahead(self, priority: str) -> int:
+        """Queued requests that will be served before a new one of this class"""
+        index = PRIORITY_CLASSES.index(priority)
+        return sum(
+            len(self._queues[ahead]) for ahead in PRIORITY_CLASSES[: index + 1]
+        )
+
+    def _publish_depth(self) -> None:
+        metrics.set_gauge("admission.in_flight", self.in_flight)
+        for priority, queue in self._queues.items():
+            metrics.set_gauge(f"admission.{priority}.queue_depth", len(queue))
+
+    def _shed(self, priority: str, reason: str, retry_after: float) -> RequestShed:
+        metrics.incr(f"admission.{priority}.shed.{reason}")
+        return RequestShed(priority, reason, retry_after)
+
+    async def acquire(self, priority: str, deadline: float) -> Ticket:
+        """Wait for a slot; raises RequestShed if the deadline cannot be met
+
+        `deadline` is in seconds from now and covers waiting and serving.
+        """
+        if self.closed:
+            raise self._shed(priority, "draining", settings.SHUTDOWN_RETRY_AFTER)
+
+        start = time.perf_counter()
+        ahead = self._waiting_ahead(priority)
+        if self.in_flight < settings.ADMISSION_MAX_CONCURRENT and ahead == 0:
+            self.in_flight += 1
+        else:
+            await self._wait_in_queue(priority, deadline, ahead)
+
+        self._publish_depth()
+        metrics.observe(f"admission.{priority}.wait", time.perf_counter() - start)
+        metrics.incr(f"admission.{priority}.admitted")
+        return Ticket(priority=priority, admitted_at=time.perf_counter())
+
+    async def _wait_in_queue(self, priority: str, deadline: float, ahead: int) -> None:
+        """Queue until _grant_next hands over a slot (and counts it in flight)"""
+        # Every slot turns over about once per median service time
+        predicted_wait = (
+            (ahead + 1) / settings.ADMISSION_MAX_CONCURRENT * self._service_time()
+        )
+        if len(self._queues[priority]) >= settings.ADMISSION_QUEUE_LIMITS[priority]:
+            raise self._shed(priority, "queue_full", predicted_wait)
+
+        # Latest moment the request can still start and finish in time
+        max_wait = deadline - self._service_time(priority)
+        if predicted_wait > max_wait:
+            raise self._shed(priority, "deadline", predicted_wait)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].append(waiter)
+        self._publish_depth()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=max(max_wait, 0))
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self._queues[priority].remove(waiter)
+                self._publish_depth()
+                raise self._shed(priority, "deadline", predicted_wait)
+        except asyncio.CancelledError:
+            # The client went away; pass the slot on if it was just granted
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.in_flight -= 1
+                self._grant_next()
+            elif not waiter.done():
+                waiter.cancel()
+                self._queues[priority].remove(waiter)
+            # Otherwise close() shed it: it holds no slot and left the queue
+            self._publish_depth()
+            raise
+
+    def _grant_next(self) -> None:
+        """Hand free slots to the oldest waiters of the highest classes"""
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            while queue and self.in_flight < settings.ADMISSION_MAX_CONCURRENT:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    self.in_flight += 1
+                    waiter.set_result(True)
+
+    def close(self) -> None:
+        """Shed every queued request and refuse new ones; running ones keep their slots"""
+        self.closed = True
+        for priority, queue in self._queues.items():
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_exception(
+                        self._shed(priority, "draining", settings.SHUTDOWN_RETRY_AFTER)
+                    )
+        self._publish_depth()
+
+    def release(self, ticket: Ticket) -> None:
+        """Free the ticket's slot (safe to call more than once)"""
+        if ticket.released:
+            return
+        ticket.released = True
+
+        service = time.perf_counter() - ticket.admitted_at
+        metrics.observe("admission.service", service)
+        metrics.observe(f"admission.{ticket.priority}.service", service)
+
+        self.in_flight -= 1
+        self._grant_next()
+        self._publish_depth()
+
+
+# Create global instance
+admission_controller = AdmissionController()
@@ -0,0 +1,344 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, List, Optional
+import numpy as np
+from config.settings import settings
+from services.history_store import history_store
+from utils.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker, nothing to coordinate
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CHUNKS = 4  # 64-bit hashes split into four 16-bit chunks
+CHUNK_BITS = 64 // CHUNKS
+ARRAYS = ("hashes", "history_ids", "scores", "chunk_keys", "chunk_rows")
+REFRESH_PAGE = 10000  # History rows fetched per query while catching up
+
+# Set bits per byte, for popcounts on NumPy versions without bitwise_count
+_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+def hamming_distances(hashes: np.ndarray, query: int) -> np.ndarray:
+    """Bit differences between every 64-bit hash and the query"""
+    diff = np.ascontiguousarray(hashes ^ np.uint64(query))
+    return _POPCOUNT[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius: int) -> np.ndarray:
+    """Every 16-bit mask with at most `radius` bits set"""
+    masks = [0]
+    for bits in range(1, radius + 1):
+        for chosen in combinations(range(CHUNK_BITS), bits):
+            masks.append(sum(1 << bit for bit in chosen))
+    return np.array(masks, dtype=np.uint16)
+
+
+def _chunks(hashes: np.ndarray) -> np.ndarray:
+    """(CHUNKS, n) array of 16-bit chunks, most significant first"""
+    shifts = np.arange(CHUNKS - 1, -1, -1, dtype=np.uint64) * np.uint64(CHUNK_BITS)
+    return ((hashes[None, :] >> shifts[:, None]) & np.uint64(0xFFFF)).astype(np.uint16)
+
+
+def same_content(content_hash: Optional[int], stored: Optional[int]) -> bool:
+    """Whether a card the layout hash matched also carries the same text and marks"""
+    if content_hash is None or stored is None:
+        return False
+    return bin(content_hash ^ stored).count("1") <= settings.NEAR_DUPLICATE_CONTENT_DISTANCE
+
+
+@dataclass
+class CardMatch:
+    """A previously scored card whose perceptual hash is close to the query"""
+
+    history_id: str  # Row of the stored analysis in the history store
+    distance: int  # Differing pHash bits, 0 for a practically identical card
+    psycho_score: float
+
+
+class CardIndex:
+    """Multi-index hash over the 64-bit perceptual hashes of every scored card
+
+    If two hashes differ in at most d bits, one of their four 16-bit chunks
+    differs in at most d // 4 bits. Each chunk therefore has a sorted table,
+    and a query looks up its chunk values (plus their few near variants) with
+    binary search, then checks the true distance of those candidates only.
+
+    The tables are rebuilt from the history store, saved as versioned .npy
+    files and memory-mapped, so a restart maps them instead of rescanning
+    months of history. History rows newer than the tables are searched
+    linearly until they reach a fraction of the table size, so rebuilds (and
+    their disk writes) get rarer as the index grows. Every worker reads the
+    same history database; a file lock lets only one of them move the saved
+    version forward.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.watermark = 0  # Last history rowid included in the mapped tables
+        self._arrays: Dict[str, np.ndarray] = {}
+        # History rows newer than the tables: (rowid, phash, history_id, score)
+        self._pending: List[tuple] = []
+        self._pending_hashes = np.zeros(0, dtype=np.uint64)
+        # Cards scored by this worker that history has not returned yet, searched linearly
+        self._recent: List[tuple] = []
+        self._refresher: Optional[asyncio.Task] = None
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._arrays.get("hashes", ())) + len(self._pending) + len(self._recent)
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    @contextmanager
+    def _locked(self):
+        """Hold the index directory's lock across workers"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self) -> None:
+        """Memory-map the newest saved tables, if any"""
+        try:
+            with open(self._manifest_path()) as f:
+                manifest = json.load(f)
+            arrays = {
+                name: np.load(
+                    os.path.join(self.path, f"{manifest['version']}.{name}.npy"),
+                    mmap_mode="r",
+                )
+                for name in ARRAYS
+            }
+        except (OSError, ValueError, KeyError):
+            return
+
+        if manifest["watermark"] < self.watermark:
+            return  # Never step back to an older version
+        self._arrays = arrays
+        self.watermark = manifest["watermark"]
+
+    # Searching
+
+    def search(self, phash: int, max_distance: int) -> List[CardMatch]:
+        """Every indexed card within max_distance bits of phash, closest first"""
+        if max_distance < 0:
+            return []
+
+        start = time.perf_counter()
+        matches: Dict[str, CardMatch] = {}
+
+        if self._arrays:
+            arrays = self._arrays
+            query_chunks = _chunks(np.array([phash], dtype=np.uint64))
+            variants = query_chunks ^ _flip_masks(max_distance // CHUNKS)[None, :]
+            candidates = []
+            for chunk in range(CHUNKS):
+                keys = arrays["chunk_keys"][chunk]
+                lows = np.searchsorted(keys, variants[chunk], side="left")
+                counts = np.searchsorted(keys, variants[chunk], side="right") - lows
+                # Expand every [low, high) range into positions in one step
+                total = int(counts.sum())
+                if total:
+                    positions = np.repeat(lows - np.cumsum(counts) + counts, counts)
+                    positions += np.arange(total)
+                    candidates.append(arrays["chunk_rows"][chunk][positions])
+
+            if candidates:
+                # A row found through several chunks is simply checked twice
+                rows = np.concatenate(candidates)
+                distances = hamming_distances(arrays["hashes"][rows], phash)
+                close = distances <= max_distance
+                for row, distance in zip(rows[close], distances[close]):
+                    history_id = arrays["history_ids"][row].decode()
+                    matches[history_id] = CardMatch(
+                        history_id, int(distance), float(arrays["scores"][row])
+                    )
+
+        if self._pending:
+            distances = hamming_distances(self._pending_hashes, phash)
+            for position in np.flatnonzero(distances <= max_distance):
+                _, _, history_id, score = self._pending[position]
+                if history_id not in matches:
+                    matches[history_id] = CardMatch(
+                        history_id, int(distances[position]), score
+                    )
+
+        for recent_hash, history_id, score in self._recent:
+            distance = bin(recent_hash ^ phash).count("1")
+            if distance <= max_distance and history_id not in matches:
+                matches[history_id] = CardMatch(history_id, distance, score)
+
+        metrics.observe("card_index.search", time.perf_counter() - start)
+        return sorted(matches.values(), key=lambda match: match.distance)
+
+    def nearest(
+        self, phash: Optional[int], max_distance: Optional[int] = None
+    ) -> Optional[CardMatch]:
+        """Closest previously scored card, if one is near enough to count as the same card"""
+        if phash is None:
+            return None
+        if max_distance is None:
+            max_distance = settings.NEAR_DUPLICATE_DISTANCE
+        matches = self.search(phash, max_distance)
+        return matches[0] if matches else None
+
+    def add(self, phash: int, history_id: str, psycho_score: float) -> None:
+        """Make a just-scored card searchable until the next rebuild picks it up"""
+        self._recent.append((phash, history_id, psycho_score))
+
+    # Rebuilding
+
+    def _rebuild(self, rows: List[tuple]) -> None:
+        """Merge new history rows into the tables, save them and map the result
+
+        Another worker may have saved a newer version while these rows were
+        fetched, so the manifest is read again under the lock: the merge
+        starts from it, and a version is only ever replaced by a newer one.
+        """
+        with self._locked():
+            self._load()
+            rows = [row for row in rows if row[0] > self.watermark]
+            if not rows:
+                return
+
+            old = self._arrays
+            new_hashes = np.array([row[1] for row in rows], dtype=np.uint64)
+            hashes = np.concatenate([old["hashes"], new_hashes]) if old else new_hashes
+            history_ids = np.array([row[2] for row in rows], dtype="S32")
+            if old:
+                history_ids = np.concatenate([old["history_ids"], history_ids])
+            scores = np.array([row[3] for row in rows], dtype=np.float32)
+            scores = np.concatenate([old["scores"], scores]) if old else scores
+
+            chunks = _chunks(hashes)
+            chunk_rows = np.argsort(chunks, axis=1, kind="stable").astype(np.int32)
+            arrays = {
+                "hashes": hashes,
+                "history_ids": history_ids,
+                "scores": scores,
+                "chunk_keys": np.take_along_axis(chunks, chunk_rows, axis=1),
+                "chunk_rows": chunk_rows,
+            }
+
+            # Write a new version, then switch the manifest atomically
+            watermark = rows[-1][0]
+            version = f"v{watermark}"
+            for name, array in arrays.items():
+                self._write_atomic(
+                    os.path.join(self.path, f"{version}.{name}.npy"),
+                    lambda f, array=array: np.save(f, array),
+                )
+            manifest = {"version": version, "watermark": watermark, "count": len(hashes)}
+            self._write_atomic(
+                self._manifest_path(), lambda f: f.write(json.dumps(manifest).encode())
+            )
+
+            # Older versions are no longer needed (open maps stay valid after unlink)
+            for stale in glob.glob(os.path.join(self.path, "v*.npy")):
+                stale_version = os.path.basename(stale).split(".", 1)[0]
+                try:
+                    if int(stale_version[1:]) < watermark:
+                        os.remove(stale)
+                except (ValueError, OSError):
+                    pass
+
+            self._load()
+
+    def _due(self) -> bool:
+        """Whether enough rows are pending to pay for rewriting the tables"""
+        size = len(self._arrays.get("hashes", ()))
+        threshold = max(
+            settings.CARD_INDEX_REBUILD_MIN_ROWS, settings.CARD_INDEX_REBUILD_RATIO * size
+        )
+        return len(self._pending) >= threshold
+
+    def _set_pending(self, rows: List[tuple]) -> None:
+        self._pending = rows
+        self._pending_hashes = np.array([row[1] for row in rows], dtype=np.uint64)
+
+    @staticmethod
+    def _write_atomic(path: str, write) -> None:
+        """Write to a temporary file and rename, so readers never map a partial file"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            write(f)
+        os.replace(temp_path, path)
+
+    async def refresh(self) -> int:
+        """Pull newly scored cards from the history store; returns how many were added"""
+        # Another worker may already have saved a newer version
+        watermark = self.watermark
+        await asyncio.to_thread(self._load)
+        if self.watermark > watermark:
+            metrics.incr("card_index.adopted")
+        pending = [row for row in self._pending if row[0] > self.watermark]
+
+        rows = []
+        while True:
+            after = rows[-1][0] if rows else (pending[-1][0] if pending else self.watermark)
+            page = await history_store.card_hashes_since(after, limit=REFRESH_PAGE)
+            rows += page
+            if len(page) < REFRESH_PAGE:
+                break
+
+        self._set_pending(pending + rows)
+        if self._pending and self._due():
+            await asyncio.to_thread(self._rebuild, self._pending)
+            self._set_pending([row for row in self._pending if row[0] > self.watermark])
+            metrics.incr("card_index.rebuilds")
+        metrics.set_gauge("card_index.size", len(self))
+
+        # Recent cards are now in the tables or pending rows
+        indexed = {row[2] for row in rows}
+        self._recent = [entry for entry in self._recent if entry[1] not in indexed]
+        return len(rows)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.CARD_INDEX_REFRESH_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception:
+                metrics.incr("card_index.refresh_errors")
+                logger.warning("⚠️  Card index refresh failed", exc_info=True)
+
+    async def start(self) -> None:
+        """Catch up with history and keep refreshing in the background"""
+        try:
+            added = await self.refresh()
+            logger.info(
+                f"🗂️  Card index: {len(self)} cards ({added} new from history)"
+            )
+        except Exception:
+            logger.warning("⚠️  Card index unavailable", exc_info=True)
+
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+
+# Create global instance
+card_index = CardIndex(settings.CARD_INDEX_PATH)
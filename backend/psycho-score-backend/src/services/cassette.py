@@ -0,0 +1,193 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List
+import httpx
+from PIL import Image
+from config.settings import settings
+from utils.metrics import metrics
+
+CASSETTE_MODES = ("off", "record", "replay")
+USAGE_FIELDS = (
+    "prompt_token_count",
+    "candidates_token_count",
+    "cached_content_token_count",
+    "total_token_count",
+)
+
+
+class CassetteMiss(RuntimeError):
+    """Replay mode met a request the cassette has no recording for"""
+
+
+def _fingerprint_part(part: Any) -> Any:
+    """JSON-friendly stand-in for one piece of a request"""
+    if isinstance(part, Image.Image):
+        # Pixels, not encoder bytes, so the same card always matches
+        digest = hashlib.sha256(part.tobytes()).hexdigest()[:16]
+        return {"image": digest, "size": list(part.size), "mode": part.mode}
+    if isinstance(part, (list, tuple)):
+        return [_fingerprint_part(item) for item in part]
+    if isinstance(part, dict):
+        return {str(key): _fingerprint_part(value) for key, value in part.items()}
+    if part is None or isinstance(part, (str, int, float, bool)):
+        return part
+    return repr(part)
+
+
+def fingerprint(service: str, *parts: Any) -> str:
+    """Stable key of an upstream request (never includes credentials)"""
+    payload = json.dumps(
+        [service, *(_fingerprint_part(part) for part in parts)], sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def encode_gemini_response(response) -> dict:
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "text": response.text,
+        "usage": {name: getattr(usage, name, 0) or 0 for name in USAGE_FIELDS},
+    }
+
+
+def decode_gemini_response(data: dict) -> SimpleNamespace:
+    """Just the parts of a GenerateContentResponse the services read"""
+    return SimpleNamespace(
+        text=data["text"], usage_metadata=SimpleNamespace(**data["usage"])
+    )
+
+
+def encode_http_response(response: httpx.Response) -> dict:
+    return {
+        "status_code": response.status_code,
+        "content_type": response.headers.get("content-type", ""),
+        "content": base64.b64encode(response.content).decode(),
+    }
+
+
+def decode_http_response(data: dict) -> httpx.Response:
+    return httpx.Response(
+        data["status_code"],
+        content=base64.b64decode(data["content"]),
+        headers={"content-type": data["content_type"]},
+    )
+
+
+class Cassette:
+    """Records upstream calls to a JSON file and plays them back offline
+
+    In record mode every Gemini and ElevenLabs call is made for real, and its
+    response and latency are stored under a fingerprint of the request. In
+    replay mode no network call is made: the recorded response is returned
+    after the recorded latency times CASSETTE_LATENCY_SCALE (0 for none), so
+    benchmarks measure our own code against a fixed upstream.
+    """
+
+    def __init__(self, path: str, mode: str = "off"):
+        self.use(path, mode)
+
+    def use(self, path: str, mode: str) -> None:
+        """Switch to another cassette file or mode"""
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self._interactions: Dict[str, List[dict]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._loaded = False
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path) as f:
+                self._interactions = json.load(f)["interactions"]
+        except FileNotFoundError:
+            if self.mode == "replay":
+                raise CassetteMiss(f"No cassette at {self.path}; record one first")
+
+    def _save(self, payload: str) -> None:
+        """Write to a temporary file and rename, so a crash never truncates the cassette"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(payload)
+        os.replace(temp_path, self.path)
+
+    async def call(
+        self,
+        key: str,
+        send: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], dict],
+        decode: Callable[[dict], Any],
+    ) -> Any:
+        """Make (record) or replay one upstream call identified by key"""
+        self._load()
+
+        if self.mode == "replay":
+            recordings = self._interactions.get(key)
+            if not recordings:
+                metrics.incr("cassette.misses")
+                raise CassetteMiss(f"No recording for request {key[:12]} in {self.path}")
+            # Repeated identical requests replay their recordings in turn
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            recording = recordings[cursor % len(recordings)]
+            await asyncio.sleep(recording["latency"] * settings.CASSETTE_LATENCY_SCALE)
+            metrics.incr("cassette.replayed")
+            return decode(recording["response"])
+
+        start = time.perf_counter()
+        result = await send()
+        latency = time.perf_counter() - start
+        self._interactions.setdefault(key, []).append(
+            {"latency": latency, "response": encode(result)}
+        )
+        metrics.incr("cassette.recorded")
+        # Serialize here, write in a thread: the dict keeps changing on the loop
+        payload = json.dumps({"version": 1, "interactions": self._interactions})
+        await asyncio.to_thread(self._save, payload)
+        return result
+
+    async def gemini(self, model, contents: list, generation_config=None):
+        """model.generate_content_async, through the cassette"""
+
+        def send():
+            return model.generate_content_async(
+                contents, generation_config=generation_config
+            )
+
+        if self.mode == "off":
+            return await send()
+        return await self.call(
+            fingerprint("gemini", model.model_name, contents, generation_config),
+            send,
+            encode_gemini_response,
+            decode_gemini_response,
+        )
+
+    async def http(self, service: str, request: Any, send) -> httpx.Response:
+        """An httpx request made by send(), through the cassette
+
+        `request` identifies the call; callers leave out credentials and
+        account-specific IDs so a cassette replays on any machine.
+        """
+        if self.mode == "off":
+            return await send()
+        return await self.call(
+            fingerprint(service, request),
+            send,
+            encode_http_response,
+            decode_http_response,
+        )
+
+
+# Create global instance
+cassette = Cassette(settings.CASSETTE_PATH, settings.CASSETTE_MODE)
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import signal
+import threading
+import time
+from typing import Optional
+from config.settings import settings
+from services.admission import admission_controller
+from services.pipeline import analysis_pipeline
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# The signals servers shut down gracefully on
+DRAIN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class DrainController:
+    """Graceful shutdown of one worker
+
+    Once draining, new work is refused with a 503 and Retry-After (and
+    /health says so, for the load balancer), running pipelines get
+    SHUTDOWN_DRAIN_TIMEOUT seconds to finish, and whatever is still running
+    then is suspended as a job for the next worker. Servers only run the
+    lifespan shutdown after every connection has closed, so draining starts
+    from the signal itself.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self._task: Optional[asyncio.Task] = None
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start draining as soon as the server is told to stop
+
+        Chained in front of the server's own handlers, which still run.
+        Handlers can only be set from the main thread (not under TestClient).
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        for sig in DRAIN_SIGNALS:
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue  # Nothing shuts down gracefully on this signal
+
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.begin)
+                previous(signum, frame)
+
+            signal.signal(sig, handler)
+
+    def begin(self) -> None:
+        """Stop admitting work and start draining (once)"""
+        if self._task is not None:
+            return
+        self.draining = True
+        metrics.set_gauge("drain.draining", 1)
+        admission_controller.close()
+        self._task = asyncio.create_task(self._drain())
+
+    async def _drain(self) -> None:
+        start = time.perf_counter()
+        logger.info("🛑 Draining...", extra={"timeout": settings.SHUTDOWN_DRAIN_TIMEOUT})
+        suspended = await analysis_pipeline.drain(settings.SHUTDOWN_DRAIN_TIMEOUT)
+        metrics.incr("drain.suspended", suspended)
+        logger.info(
+            "Drained",
+            extra={
+                "suspended": suspended,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            },
+        )
+
+    async def wait(self) -> None:
+        """Drain, unless a signal already started it, and wait until it is done"""
+        self.begin()
+        await self._task
+
+
+# Create global instance
+drain_controller = DrainController()
@@ -1,11 +1,47 @@
+import asyncio
 import httpx
 import aiofiles
 import os
 import uuid
-from typing import Optional
+import hashlib
+import logging
+import time
+from typing import List, Optional
 from fastapi import HTTPException
 from config.settings import settings
 from models.schemas import AudioResponse
+from services.cassette import cassette
+from services.hedging import hedger
+from services.prompts import (
+    ALPHA_ANNOUNCEMENT,
+    BETA_ANNOUNCEMENT,
+    CRITIQUE_PREFIX,
+    FALLBACK_CRITIQUE,
+)
+from services.state_store import state_store
+from services.usage import record_tts_usage
+from utils.audio_duration import audio_duration, audio_file_duration, join_mp3
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TTS_MODEL_ID = "eleven_monolingual_v1"
+
+# ElevenLabs output_format -> file extension; files are named by content, see generate_audio
+AUDIO_FORMATS = {
+    "mp3_44100_128": ".mp3",
+    "mp3_44100_64": ".mp3",
+    "mp3_22050_32": ".mp3",  # Speech at a quarter of the default size
+    "opus_48000_32": ".opus",
+    "opus_48000_64": ".opus",
+}
+AUDIO_MEDIA_TYPES = {".mp3": "audio/mpeg", ".opus": "audio/ogg"}
+
+# Speech that is known before any request, synthesized at startup
+PREWARM_PHRASES = [ALPHA_ANNOUNCEMENT, BETA_ANNOUNCEMENT, CRITIQUE_PREFIX, FALLBACK_CRITIQUE]
+
+# Seconds after which a temporary audio file is left over, not still being written
+PARTIAL_FILE_MAX_AGE = 10 * 60
 
 
 class ElevenLabsService:
@@ -13,64 +49,125 @@ class ElevenLabsService:
         self.api_key = settings.ELEVENLABS_API_KEY
         self.base_url = settings.ELEVENLABS_BASE_URL
         self.voice_id = settings.PATRICK_VOICE_ID
+        self._prewarmer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Clear partial files of a worker that was killed, and pre-warm the audio cache"""
+        self._remove_partial_files()
+        if settings.TTS_PREWARM_ENABLED and (
+            self._prewarmer is None or self._prewarmer.done()
+        ):
+            self._prewarmer = asyncio.create_task(self.prewarm())
+
+    async def stop(self) -> None:
+        if self._prewarmer is not None:
+            self._prewarmer.cancel()
+            self._prewarmer = None
+
+    @staticmethod
+    def _remove_partial_files() -> None:
+        # Old enough that no running worker is still writing them
+        cutoff = time.time() - PARTIAL_FILE_MAX_AGE
+        for entry in os.scandir(settings.AUDIO_OUTPUT_PATH):
+            if entry.name.endswith(".tmp") and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+
+    async def prewarm(self, phrases: Optional[List[str]] = None) -> None:
+        """Synthesize fixed phrases ahead of the requests that need them
+
+        One at a time, so requests arriving during startup still get most of
+        the rate limit. Files left by an earlier run are reused, not paid for.
+        """
+        phrases = phrases or PREWARM_PHRASES + settings.TTS_PREWARM_PHRASES
+        formats = settings.TTS_PREWARM_FORMATS or [settings.TTS_OUTPUT_FORMAT]
+        warmed = 0
+        for output_format in formats:
+            for phrase in phrases:
+                try:
+                    await self.generate_audio(phrase, output_format=output_format)
+                    warmed += 1
+                except Exception:
+                    logger.warning(
+                        "⚠️  TTS pre-warm failed",
+                        exc_info=True,
+                        extra={"phrase": phrase, "output_format": output_format},
+                    )
+        logger.info("🎙️  TTS pre-warm done", extra={"phrases": warmed, "formats": formats})
+
+    def resolve_format(self, output_format: Optional[str] = None) -> str:
+        """The requested output format, or the default; 400 for an unknown one"""
+        output_format = output_format or settings.TTS_OUTPUT_FORMAT
+        if output_format not in AUDIO_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported output_format. Choose one of: {', '.join(AUDIO_FORMATS)}",
+            )
+        return output_format
 
     async def generate_audio(
-        self, text: str, voice_id: Optional[str] = None
+        self,
+        text: str,
+        voice_id: Optional[str] = None,
+        output_format: Optional[str] = None,
+        prefix: Optional[str] = None,
     ) -> AudioResponse:
-        """Generate audio from text using ElevenLabs API"""
+        """Generate audio from text using ElevenLabs API
+
+        When text starts with a fixed prefix (see PREWARM_PHRASES), only the
+        rest is synthesized and joined to the cached audio of the prefix.
+        """
         try:
             # Use provided voice_id or default Patrick voice
             selected_voice_id = voice_id or self.voice_id
+            output_format = self.resolve_format(output_format)
 
-            url = f"{self.base_url}/text-to-speech/{selected_voice_id}"
-            headers = {
-                "Accept": "audio/mpeg",
-                "Content-Type": "application/json",
-                "xi-api-key": self.api_key,
-            }
-
-            data = {
-                "text": text,
-                "model_id": "eleven_monolingual_v1",
-                "voice_settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.5,
-                    "style": 0.0,
-                    "use_speaker_boost": True,
-                },
-            }
+            # Same text, voice and format always produce the same file, shared by all workers
+            text_hash = hashlib.sha256(
+                f"{selected_voice_id}:{TTS_MODEL_ID}:{output_format}:{text}".encode()
+            ).hexdigest()
+            cache_key = f"tts:{text_hash}"
+            audio_filename = f"psycho_analysis_{text_hash[:32]}{AUDIO_FORMATS[output_format]}"
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url, json=data, headers=headers, timeout=60.0
-                )
+            audio_path = os.path.join(settings.AUDIO_OUTPUT_PATH, audio_filename)
+            suffix = self._composable_suffix(text, prefix, output_format)
 
-                if response.status_code != 200:
-                    raise HTTPException(
-                        status_code=response.status_code,
-                        detail=f"ElevenLabs API error: {response.text}",
+            async def synthesize() -> dict:
+                # Files are named by content, so one from an earlier run is this audio
+                if os.path.exists(audio_path):
+                    return await asyncio.to_thread(self._existing_file, audio_filename)
+                if suffix:
+                    return await self._compose(
+                        prefix, suffix, selected_voice_id, output_format, audio_filename
                     )
+                await state_store.wait_for_slot(
+                    "elevenlabs", settings.ELEVENLABS_RATE_LIMIT
+                )
+                return await self._synthesize(
+                    text, selected_voice_id, output_format, audio_filename
+                )
 
-                # Generate unique filename
-                audio_filename = f"psycho_analysis_{uuid.uuid4().hex}.mp3"
-                audio_path = os.path.join(settings.AUDIO_OUTPUT_PATH, audio_filename)
-
-                # Save audio file
-                async with aiofiles.open(audio_path, "wb") as f:
-                    await f.write(response.content)
+            result = await state_store.single_flight(
+                cache_key, synthesize, ttl=settings.TTS_CACHE_TTL
+            )
 
-                # Get file size
-                file_size = len(response.content)
+            # The cached entry outlived its file (e.g. outputs were cleaned up)
+            if not os.path.exists(audio_path):
+                await state_store.delete(cache_key)
+                result = await state_store.single_flight(
+                    cache_key, synthesize, ttl=settings.TTS_CACHE_TTL
+                )
 
-                # Create audio URL (this would be served by your static file server)
-                audio_url = f"/audio/{audio_filename}"
+            if result.get("audio_duration") is None:
+                # Entry cached before durations were recorded: read the file's first KB
+                duration = await asyncio.to_thread(audio_file_duration, audio_path)
+                if duration is not None:
+                    result = {**result, "audio_duration": duration}
+                    await state_store.set(cache_key, result, ttl=settings.TTS_CACHE_TTL)
 
-                return AudioResponse(
-                    audio_url=audio_url,
-                    audio_duration=None,  # Could be calculated if needed
-                    file_size=file_size,
-                )
+            return AudioResponse(**result)
 
+        except HTTPException:
+            raise
         except httpx.RequestError as e:
             raise HTTPException(
                 status_code=500, detail=f"Request to ElevenLabs failed: {str(e)}"
@@ -80,6 +177,137 @@ class ElevenLabsService:
                 status_code=500, detail=f"Error generating audio: {str(e)}"
             )
 
+    async def _synthesize(
+        self, text: str, voice_id: str, output_format: str, audio_filename: str
+    ) -> dict:
+        """Call ElevenLabs and write the audio file to the audio output directory"""
+        url = f"{self.base_url}/text-to-speech/{voice_id}"
+        headers = {
+            "Accept": AUDIO_MEDIA_TYPES[AUDIO_FORMATS[output_format]],
+            "Content-Type": "application/json",
+            "xi-api-key": self.api_key,
+        }
+
+        data = {
+            "text": text,
+            "model_id": TTS_MODEL_ID,
+            "voice_settings": {
+                "stability": 0.5,
+                "similarity_boost": 0.5,
+                "style": 0.0,
+                "use_speaker_boost": True,
+            },
+        }
+
+        async def post() -> httpx.Response:
+            async with httpx.AsyncClient() as client:
+                return await client.post(
+                    url,
+                    params={"output_format": output_format},
+                    json=data,
+                    headers=headers,
+                    timeout=60.0,
+                )
+
+        async def request() -> httpx.Response:
+            # Keyed without the voice ID, which differs per account
+            response = await cassette.http(
+                "elevenlabs", ["text-to-speech", output_format, data], post
+            )
+
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail=f"ElevenLabs API error: {response.text}",
+                )
+            return response
+
+        # Slow syntheses get a duplicate once they pass the usual latency
+        start = time.perf_counter()
+        response = await hedger.call(
+            "elevenlabs.tts",
+            request,
+            rate_limit=("elevenlabs", settings.ELEVENLABS_RATE_LIMIT),
+            on_discarded=lambda loser: record_tts_usage(text),
+        )
+        logger.info(
+            "elevenlabs tts",
+            extra={
+                "output_format": output_format,
+                "characters": len(text),
+                "bytes": len(response.content),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            },
+        )
+
+        record_tts_usage(text)
+        return await self._write_audio(audio_filename, response.content, output_format)
+
+    def _composable_suffix(
+        self, text: str, prefix: Optional[str], output_format: str
+    ) -> Optional[str]:
+        """The part of text after prefix, if the two can be synthesized apart and joined"""
+        if (
+            not settings.TTS_PREFIX_COMPOSITION
+            or not prefix
+            or not text.startswith(prefix)
+            # Ogg pages carry stream serials and granule positions; only MP3 joins cleanly
+            or AUDIO_FORMATS[output_format] != ".mp3"
+        ):
+            return None
+        return text[len(prefix):].strip() or None
+
+    async def _compose(
+        self,
+        prefix: str,
+        suffix: str,
+        voice_id: str,
+        output_format: str,
+        audio_filename: str,
+    ) -> dict:
+        """Join the (usually pre-warmed) prefix audio to a fresh synthesis of the suffix"""
+        parts = await asyncio.gather(
+            self.generate_audio(prefix, voice_id, output_format),
+            self.generate_audio(suffix, voice_id, output_format),
+        )
+        data = []
+        for part in parts:
+            path = os.path.join(settings.AUDIO_OUTPUT_PATH, os.path.basename(part.audio_url))
+            async with aiofiles.open(path, "rb") as f:
+                data.append(await f.read())
+        metrics.incr("tts.composed")
+        return await self._write_audio(audio_filename, join_mp3(data), output_format)
+
+    async def _write_audio(self, audio_filename: str, content: bytes, output_format: str) -> dict:
+        # Write to a temporary name first so other workers never see a partial file
+        audio_path = os.path.join(settings.AUDIO_OUTPUT_PATH, audio_filename)
+        temp_path = f"{audio_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with aiofiles.open(temp_path, "wb") as f:
+                await f.write(content)
+            os.replace(temp_path, audio_path)
+        except BaseException:
+            # Cancelled at shutdown, or the disk is full: leave no partial file behind
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        # Create audio URL (this would be served by your static file server)
+        return AudioResponse(
+            audio_url=f"/audio/{audio_filename}",
+            # From frame headers only, so clients can show progress before downloading
+            audio_duration=audio_duration(content, AUDIO_FORMATS[output_format]),
+            file_size=len(content),
+        ).model_dump()
+
+    def _existing_file(self, audio_filename: str) -> dict:
+        audio_path = os.path.join(settings.AUDIO_OUTPUT_PATH, audio_filename)
+        return AudioResponse(
+            audio_url=f"/audio/{audio_filename}",
+            audio_duration=audio_file_duration(audio_path),
+            file_size=os.path.getsize(audio_path),
+        ).model_dump()
+
     async def get_available_voices(self):
         """Get list of available voices from ElevenLabs"""
         try:
@@ -1,200 +1,452 @@
 import google.generativeai as genai
 from fastapi import UploadFile, HTTPException
 from PIL import Image
-import io
+import asyncio
+import datetime
+import hashlib
 import json
+import logging
+import time
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
 from config.settings import settings
 from models.schemas import BusinessCardAnalysis
+from services.card_index import card_index, same_content, CardMatch
+from services.cassette import cassette
+from services.hedging import hedger
+from services.history_store import history_store
+from services.model_router import model_router, ModelRoute, MODEL_TIERS
+from services.state_store import state_store
+from services.usage import record_gemini_usage
+from services.prompts import PROMPTS, MULTI_ANALYSIS_SCHEMA, FALLBACK_CRITIQUE
+from utils.image_processing import (
+    image_processor,
+    compute_image_hash,
+    content_hash,
+    perceptual_hash,
+)
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 
 class GeminiService:
     def __init__(self):
         genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel("gemini-2.5-flash")
+        # One model per routing tier, see services.model_router
+        self.models = {
+            tier: genai.GenerativeModel(name)
+            for tier, name in model_router.model_names.items()
+        }
+        # (task, variant, tier) -> (model bound to cached instructions or None, expiry)
+        self._context_models: Dict[Tuple[str, str, str], Tuple[Any, float]] = {}
 
-    def _process_image(self, image: UploadFile) -> Image.Image:
-        """Process uploaded image and return PIL Image object"""
-        try:
-            image_data = image.file.read()
-            pil_image = Image.open(io.BytesIO(image_data))
+    def _process_image(self, source: BinaryIO) -> Tuple[str, Image.Image]:
+        """Hash and decode an upload file without reading it into memory"""
+        return compute_image_hash(source), image_processor.prepare_cards(source)[0][0]
 
-            # Convert to RGB if necessary
-            if pil_image.mode != "RGB":
-                pil_image = pil_image.convert("RGB")
+    async def _context_model(self, task: str, variant: str, tier: str) -> Optional[Any]:
+        """Model bound to server-side cached instructions, if context caching is on
+
+        Gemini rejects caches below its minimum token count, in which case the
+        prompt is sent inline as a stable leading prefix (eligible for implicit
+        prefix caching) instead.
+        """
+        if not settings.GEMINI_CONTEXT_CACHE:
+            return None
 
-            # Resize if too large (max 4MB for Gemini)
-            max_size = (2048, 2048)
-            pil_image.thumbnail(max_size, Image.Resampling.LANCZOS)
+        key = (task, variant, tier)
+        model, expires_at = self._context_models.get(key, (None, 0.0))
+        if time.time() < expires_at:
+            return model
 
-            return pil_image
+        ttl = settings.GEMINI_CONTEXT_CACHE_TTL
+        try:
+            cached = await asyncio.to_thread(
+                genai.caching.CachedContent.create,
+                model=f"models/{model_router.model_names[tier]}",
+                system_instruction=PROMPTS[task][variant],
+                ttl=datetime.timedelta(seconds=ttl),
+            )
+            model = genai.GenerativeModel.from_cached_content(cached)
         except Exception as e:
-            raise HTTPException(
-                status_code=400, detail=f"Error processing image: {str(e)}"
+            logger.warning(
+                "⚠️  Context cache unavailable",
+                extra={"task": task, "variant": variant, "tier": tier, "error": str(e)},
+            )
+            model = None
+
+        # Refresh a minute before the server drops the cache
+        self._context_models[key] = (model, time.time() + max(ttl - 60, 60))
+        return model
+
+    async def _generate(
+        self,
+        task: str,
+        variant: str,
+        contents: list,
+        response_schema: Optional[dict] = None,
+        tier: str = "strong",
+    ):
+        """Send the static instructions for task/variant, then the per-request contents"""
+        # The compact prompt asks for bare JSON, so let the API enforce it
+        generation_config = (
+            {"response_mime_type": "application/json"} if variant == "compact" else None
+        )
+        if response_schema is not None:
+            generation_config = {
+                "response_mime_type": "application/json",
+                "response_schema": response_schema,
+            }
+
+        start = time.perf_counter()
+        with metrics.timer(f"gemini.{tier}.latency"):
+            model = await self._context_model(task, variant, tier)
+            if model is None:
+                model = self.models[tier]
+                contents = [PROMPTS[task][variant], *contents]
+
+            # Slow calls get a duplicate once they pass this task's usual latency
+            image_sizes = [part.size for part in contents if isinstance(part, Image.Image)]
+            response = await hedger.call(
+                f"gemini.{tier}.{task}",
+                lambda: cassette.gemini(model, contents, generation_config),
+                rate_limit=("gemini", settings.GEMINI_RATE_LIMIT),
+                on_discarded=lambda loser: record_gemini_usage(loser, image_sizes, tier=tier),
             )
 
-    def _create_patrick_bateman_prompt(self) -> str:
-        """Create the Patrick Bateman analysis prompt"""
-        return """
-        You are Patrick Bateman from American Psycho. A business card has been presented to you for analysis.
-
-        Analyze this business card image with Patrick Bateman's obsessive attention to detail and pretentious, competitive commentary. Focus on:
-
-        - Typography and font choices
-        - Color scheme and sophistication  
-        - Layout and design composition
-        - Paper quality and material impression
-        - Overall aesthetic and attention to detail
-
-        Write your response as Patrick Bateman would speak - sophisticated, obsessive, competitive, and slightly unhinged. 
-        Reference specific design elements like you're examining Paul Allen's card. Include comparisons to high-end materials and brands.
-
-        Start with something like "Look at that..." and build your critique in Patrick's voice.
-
-        Then provide your response in JSON format:
-        {
-            "card_quality": "Brief assessment",
-            "design_elements": {
-                "layout": "Layout analysis", 
-                "whitespace": "Whitespace usage",
-                "composition": "Overall composition"
-            },
-            "typography": {
-                "font_family": "Font analysis",
-                "hierarchy": "Typography hierarchy", 
-                "readability": "Readability assessment"
+        usage = getattr(response, "usage_metadata", None)
+        logger.info(
+            "gemini call",
+            extra={
+                "task": task,
+                "variant": variant,
+                "tier": tier,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "input_tokens": getattr(usage, "prompt_token_count", None),
+                "output_tokens": getattr(usage, "candidates_token_count", None),
             },
-            "color_scheme": {
-                "palette": "Color description",
-                "contrast": "Contrast analysis",
-                "sophistication": "Color sophistication"
-            },
-            "layout_quality": "Layout assessment",
-            "material_impression": "Material quality perception",
-            "patrick_critique": "Your full Patrick Bateman critique in his natural speaking voice, as if he's talking directly to someone. Write this as natural dialogue - conversational, dramatic, and unhinged. Avoid bullet points, lists, or overly structured text. Make it sound like Patrick is actually speaking. 2-3 sentences maximum for better audio flow.",
-            "psycho_score": 7.5
-        }
+        )
+        return response
 
-        The psycho_score should be 0-10, where 10 is impossible perfection by Patrick's standards.
-        IMPORTANT: For the patrick_critique field, write ONLY natural speech - no formatting, no bullet points, no special characters. Write as if Patrick is speaking directly to someone about the card DO NOT ADD ANY MARKDOWN OR FORMATTING SUCH AS BOLD TEXT.
-        """
+    def _parse_json_response(self, response_text: str) -> Optional[Any]:
+        """Extract the JSON payload from a model response, or None if it is not valid JSON"""
+        # Remove any markdown formatting
+        if "```json" in response_text:
+            response_text = response_text.split("```json")[1].split("```")[0]
+        elif "```" in response_text:
+            response_text = response_text.split("```")[1].split("```")[0]
 
-    async def analyze_business_card(self, image: UploadFile) -> BusinessCardAnalysis:
-        """Analyze business card using Gemini Vision API"""
         try:
-            # Process the image
-            pil_image = self._process_image(image)
-
-            # Create the prompt
-            prompt = self._create_patrick_bateman_prompt()
-
-            # Generate content with Gemini
-            response = self.model.generate_content([prompt, pil_image])
+            return json.loads(response_text.strip())
+        except json.JSONDecodeError:
+            return None
 
-            # Parse the JSON response
-            try:
-                # Extract JSON from response text
-                response_text = response.text
-                # Remove any markdown formatting
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0]
-                elif "```" in response_text:
-                    response_text = response_text.split("```")[1].split("```")[0]
+    async def analyze_business_card(self, image: UploadFile) -> BusinessCardAnalysis:
+        """Analyze business card using Gemini Vision API"""
+        image_hash, pil_image = await asyncio.to_thread(self._process_image, image.file)
+        phash, ink_hash = await asyncio.to_thread(
+            lambda: (perceptual_hash(pil_image), content_hash(pil_image))
+        )
+        return await self.analyze_image(
+            image_hash,
+            pil_image,
+            near_duplicate=card_index.nearest(phash),
+            content_hash=ink_hash,
+        )
 
-                analysis_data = json.loads(response_text.strip())
+    async def reuse_analysis(
+        self,
+        match: Optional[CardMatch],
+        content_hash: Optional[int] = None,
+        route: Optional[ModelRoute] = None,
+    ) -> Optional[Tuple[BusinessCardAnalysis, str]]:
+        """Stored analysis of a card already scored (possibly from another photo)
+
+        Only reused when the inked region matches too (plain cards share a
+        layout hash), and never from a weaker model tier than the request is
+        routed to (strong when the client asks for full detail). Returned
+        with the tier that produced it.
+        """
+        if match is None:
+            return None
+
+        row = await history_store.get_analysis(match.history_id)
+        if row is None:
+            return None  # Not flushed to history yet
+
+        if not same_content(content_hash, row["content_hash"]):
+            metrics.incr("card_index.rejected.content")
+            return None
+        # Rows stored before tiers were recorded may come from either
+        stored_tier = row["model_tier"] or MODEL_TIERS[0]
+        if route is not None and MODEL_TIERS.index(stored_tier) < MODEL_TIERS.index(route.tier):
+            metrics.incr("card_index.rejected.tier")
+            return None
+
+        metrics.incr("card_index.reused")
+        return BusinessCardAnalysis(**row["analysis"]), stored_tier
+
+    @staticmethod
+    def _prompt_cache_key(cache_key: str, prompt_variant: str, hints: Any = None) -> str:
+        """Other prompt variants and feature hints get other replies, cached apart"""
+        if prompt_variant != "full":
+            cache_key = f"{cache_key}:{prompt_variant}"
+        if hints and any(hints if isinstance(hints, list) else [hints]):
+            digest = hashlib.sha256(json.dumps(hints).encode()).hexdigest()[:16]
+            cache_key = f"{cache_key}:hints-{digest}"
+        return cache_key
+
+    @staticmethod
+    def _tier_cache_key(cache_key: str, route: Optional[ModelRoute]) -> str:
+        """Results from the fast tier are cached apart from strong-tier ones"""
+        if route is None or route.tier == "strong":
+            return cache_key
+        return f"{cache_key}:{route.tier}"
+
+    async def _cached_only(self, *cache_keys: str) -> Any:
+        """Return a cached result without calling Gemini (budget exhausted)"""
+        for cache_key in cache_keys:
+            cached = await state_store.get(cache_key)
+            if cached is not None:
+                return cached
+
+        raise HTTPException(
+            status_code=429,
+            detail="Analysis budget exhausted - only previously analyzed cards can be scored right now",
+            headers={"Retry-After": str(86400 - int(time.time()) % 86400)},
+        )
 
-                # Validate and create BusinessCardAnalysis object
-                return BusinessCardAnalysis(**analysis_data)
+    async def analyze_image(
+        self,
+        image_hash: str,
+        pil_image: Image.Image,
+        cache_only: bool = False,
+        prompt_variant: str = "full",
+        hints: Optional[str] = None,
+        near_duplicate: Optional[CardMatch] = None,
+        route: Optional[ModelRoute] = None,
+        content_hash: Optional[int] = None,
+    ) -> BusinessCardAnalysis:
+        """Analyze an already prepared business card image, cached by its content hash
+
+        A near-duplicate of a card scored before reuses that analysis instead
+        of calling Gemini, even for a different photo of the card (see
+        reuse_analysis). The route picks the model tier and is escalated if
+        the fast tier's reply is not valid JSON.
+        """
+        try:
+            reused = await self.reuse_analysis(near_duplicate, content_hash, route)
+            if reused is not None:
+                return reused[0]
+
+            tier = route.tier if route else "strong"
+            base_key = self._prompt_cache_key(f"analysis:{image_hash}", prompt_variant, hints)
+            cache_key = self._tier_cache_key(base_key, route)
+            if cache_only:
+                return BusinessCardAnalysis(**await self._cached_only(cache_key, base_key))
+
+            async def run_analysis() -> dict:
+                # Generate content with Gemini
+                await state_store.wait_for_slot("gemini", settings.GEMINI_RATE_LIMIT)
+                contents = [pil_image, hints] if hints else [pil_image]
+                response = await self._generate(
+                    "analysis", prompt_variant, contents, tier=tier
+                )
+                record_gemini_usage(response, [pil_image.size], tier=tier)
+
+                analysis_data = self._parse_json_response(response.text)
+                if analysis_data is None:
+                    return {"raw_response": response.text}
+
+                # Validate before the result is shared with other workers
+                return BusinessCardAnalysis(**analysis_data).model_dump()
+
+            # Identical uploads reuse one Gemini call across all workers
+            result = await state_store.single_flight(
+                cache_key,
+                run_analysis,
+                ttl=settings.ANALYSIS_CACHE_TTL,
+                should_cache=lambda data: "raw_response" not in data,
+            )
 
-            except json.JSONDecodeError:
+            if "raw_response" in result:
+                if route is not None and route.escalate("parse_failure"):
+                    return await self.analyze_image(
+                        image_hash,
+                        pil_image,
+                        prompt_variant=prompt_variant,
+                        hints=hints,
+                        route=route,
+                    )
                 # Fallback: create a basic analysis if JSON parsing fails
-                return self._create_fallback_analysis(response.text)
+                return self._create_fallback_analysis(result["raw_response"])
 
+            return BusinessCardAnalysis(**result)
+
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=500, detail=f"Error analyzing business card: {str(e)}"
             )
 
-    def _create_comparison_prompt(self) -> str:
-        """Create the Patrick Bateman comparison prompt for two business cards"""
-        return """
-        You are Patrick Bateman from American Psycho. Two business cards have been presented to you for a COMPETITIVE ANALYSIS.
-
-        You must analyze both cards with your obsessive attention to detail and determine which one is superior. This is a BATTLE of sophistication, taste, and professional excellence.
-
-        Analyze both cards focusing on:
-        - Typography and font sophistication 
-        - Color scheme elegance and restraint
-        - Layout composition and balance
-        - Paper quality perception
-        - Overall aesthetic superiority
-        - Attention to design details
-
-        Write your response as Patrick Bateman would speak during a heated business card comparison scene - competitive, obsessive, and increasingly unhinged as you dissect every detail.
+    async def analyze_images(
+        self,
+        image_hash: str,
+        pil_images: List[Image.Image],
+        cache_only: bool = False,
+        prompt_variant: str = "full",
+        hints: Optional[List[Optional[str]]] = None,
+        route: Optional[ModelRoute] = None,
+    ) -> List[BusinessCardAnalysis]:
+        """Analyze several cards cropped from one upload in a single Gemini call"""
+        try:
+            tier = route.tier if route else "strong"
+            base_key = self._prompt_cache_key(
+                f"analysis:{image_hash}:cards{len(pil_images)}", prompt_variant, hints
+            )
+            cache_key = self._tier_cache_key(base_key, route)
+            if cache_only:
+                cached = await self._cached_only(cache_key, base_key)
+                return [BusinessCardAnalysis(**data) for data in cached]
+
+            async def run_analysis() -> Any:
+                await state_store.wait_for_slot("gemini", settings.GEMINI_RATE_LIMIT)
+                contents = []
+                for index, pil_image in enumerate(pil_images):
+                    contents += [f"CARD {index + 1}:", pil_image]
+                    if hints and hints[index]:
+                        contents.append(hints[index])
+
+                response = await self._generate(
+                    "multi_analysis",
+                    prompt_variant,
+                    contents,
+                    response_schema=MULTI_ANALYSIS_SCHEMA,
+                    tier=tier,
+                )
+                record_gemini_usage(
+                    response, [image.size for image in pil_images], tier=tier
+                )
+
+                analyses = self._parse_json_response(response.text)
+                if not isinstance(analyses, list) or len(analyses) != len(pil_images):
+                    return {"raw_response": response.text}
+
+                return [BusinessCardAnalysis(**data).model_dump() for data in analyses]
+
+            result = await state_store.single_flight(
+                cache_key,
+                run_analysis,
+                ttl=settings.ANALYSIS_CACHE_TTL,
+                should_cache=lambda data: isinstance(data, list),
+            )
 
-        After your analysis, you MUST declare one card as "ALPHA" (superior) and the other as "BETA" (inferior).
+            if isinstance(result, dict):
+                if route is not None and route.escalate("parse_failure"):
+                    return await self.analyze_images(
+                        image_hash,
+                        pil_images,
+                        prompt_variant=prompt_variant,
+                        hints=hints,
+                        route=route,
+                    )
+                # Fallback: the same basic analysis for every card
+                return [
+                    self._create_fallback_analysis(result["raw_response"])
+                    for _ in pil_images
+                ]
 
-        Provide your response in JSON format:
-        {
-            "card1_analysis": {
-                "strengths": "What makes this card impressive",
-                "weaknesses": "What disappoints you about this card", 
-                "psycho_score": 7.2
-            },
-            "card2_analysis": {
-                "strengths": "What makes this card impressive",
-                "weaknesses": "What disappoints you about this card",
-                "psycho_score": 8.1
-            },
-            "comparison_critique": "Your full Patrick Bateman comparison in his voice - be dramatic, competitive, and unhinged (3-4 paragraphs)",
-            "winner": "ALPHA",
-            "winner_reasoning": "Why this card dominates the other",
-            "final_verdict": "ALPHA"
-        }
+            return [BusinessCardAnalysis(**data) for data in result]
 
-        The winner and final_verdict should be either "ALPHA" (for the first/original card) or "BETA" (for the second/contender card).
-        Psycho_scores should be 0-10, where 10 is impossible perfection.
-        DO NOT FORMAT YOUR RESPONSE, ONLY GENERATE PLAIN TEXT without bold or markdown.
-        """
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Error analyzing business cards: {str(e)}"
+            )
 
     async def compare_business_cards(
         self, original_image: UploadFile, contender_image: UploadFile
     ) -> dict:
         """Compare two business cards and determine ALPHA vs BETA"""
-        try:
-            # Process both images
-            original_pil = self._process_image(original_image)
-            contender_pil = self._process_image(contender_image)
-
-            # Create the comparison prompt
-            prompt = self._create_comparison_prompt()
-
-            # Generate content with Gemini using both images
-            response = self.model.generate_content(
-                [
-                    "ORIGINAL CARD (Judge this as Card 1):",
-                    original_pil,
-                    "CONTENDER CARD (Judge this as Card 2):",
-                    contender_pil,
-                    prompt,
-                ]
+        (original_hash, original_pil), (contender_hash, contender_pil) = (
+            await asyncio.gather(
+                asyncio.to_thread(self._process_image, original_image.file),
+                asyncio.to_thread(self._process_image, contender_image.file),
             )
+        )
+        return await self.compare_images(
+            original_hash, original_pil, contender_hash, contender_pil
+        )
 
-            # Parse the JSON response
-            try:
-                response_text = response.text
-                # Remove any markdown formatting
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0]
-                elif "```" in response_text:
-                    response_text = response_text.split("```")[1].split("```")[0]
-
-                comparison_data = json.loads(response_text.strip())
+    async def compare_images(
+        self,
+        original_hash: str,
+        original_pil: Image.Image,
+        contender_hash: str,
+        contender_pil: Image.Image,
+        cache_only: bool = False,
+        prompt_variant: str = "full",
+        route: Optional[ModelRoute] = None,
+    ) -> dict:
+        """Compare two prepared card images, cached by the pair of content hashes"""
+        try:
+            tier = route.tier if route else "strong"
+            base_key = self._prompt_cache_key(
+                f"comparison:{original_hash}:{contender_hash}", prompt_variant
+            )
+            cache_key = self._tier_cache_key(base_key, route)
+            if cache_only:
+                return await self._cached_only(cache_key, base_key)
+
+            async def run_comparison() -> dict:
+                # Generate content with Gemini using both images
+                await state_store.wait_for_slot("gemini", settings.GEMINI_RATE_LIMIT)
+                response = await self._generate(
+                    "comparison",
+                    prompt_variant,
+                    [
+                        "ORIGINAL CARD (Judge this as Card 1):",
+                        original_pil,
+                        "CONTENDER CARD (Judge this as Card 2):",
+                        contender_pil,
+                    ],
+                    tier=tier,
+                )
+                record_gemini_usage(
+                    response, [original_pil.size, contender_pil.size], tier=tier
+                )
+
+                comparison_data = self._parse_json_response(response.text)
+                if comparison_data is None:
+                    return {"raw_response": response.text}
                 return comparison_data
 
-            except json.JSONDecodeError:
+            result = await state_store.single_flight(
+                cache_key,
+                run_comparison,
+                ttl=settings.ANALYSIS_CACHE_TTL,
+                should_cache=lambda data: "raw_response" not in data,
+            )
+
+            if "raw_response" in result:
+                if route is not None and route.escalate("parse_failure"):
+                    return await self.compare_images(
+                        original_hash,
+                        original_pil,
+                        contender_hash,
+                        contender_pil,
+                        prompt_variant=prompt_variant,
+                        route=route,
+                    )
                 # Fallback comparison if JSON parsing fails
-                return self._create_fallback_comparison(response.text)
+                return self._create_fallback_comparison(result["raw_response"])
+
+            return result
 
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=500, detail=f"Error comparing business cards: {str(e)}"
@@ -244,7 +496,7 @@ class GeminiService:
             material_impression="Standard business card stock",
             patrick_critique=raw_response[:500]
             if raw_response
-            else "The subtlety of the design shows a certain... restraint. Though lacking the sophisticated edge I prefer in my own cards, it demonstrates a basic understanding of professional presentation.",
+            else FALLBACK_CRITIQUE,
             psycho_score=6.5,
         )
 
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from config.settings import settings
+from services.state_store import state_store
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class HedgeBudget:
+    """Token bucket capping hedges at a fraction of all calls to an endpoint"""
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def credit(self) -> None:
+        """Every call earns `ratio` of a hedge"""
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def refund(self) -> None:
+        """Return a token spent on a hedge that was not fired"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class Hedger:
+    """Duplicates upstream calls that run past the endpoint's usual latency
+
+    Each endpoint keeps a rolling histogram of attempt latencies. A call that
+    is still running at the HEDGE_PERCENTILE of that histogram gets a second,
+    identical attempt; the first to succeed wins and the other is cancelled.
+    Hedges are paid for from a per-endpoint budget so a slow upstream cannot
+    double our traffic, and each takes a slot of the upstream's shared rate
+    limit like any other call.
+    """
+
+    def __init__(self):
+        self._budgets: Dict[str, HedgeBudget] = {}
+
+    def threshold(self, endpoint: str) -> float:
+        """Seconds to wait before hedging, 0 while there are too few samples"""
+        histogram = metrics.histogram(f"hedge.{endpoint}.latency")
+        if len(histogram.values) < settings.HEDGE_MIN_SAMPLES:
+            return 0.0
+        return histogram.percentile(settings.HEDGE_PERCENTILE)
+
+    def _budget(self, endpoint: str) -> HedgeBudget:
+        if endpoint not in self._budgets:
+            self._budgets[endpoint] = HedgeBudget(
+                settings.HEDGE_BUDGET_RATIO, settings.HEDGE_BUDGET_BURST
+            )
+        return self._budgets[endpoint]
+
+    async def _attempt(self, endpoint: str, call: Callable[[], Awaitable[T]]) -> T:
+        """One attempt, timed into the endpoint's histogram
+
+        A cancelled attempt records how long it had run, a lower bound on its
+        latency, so losing hedges do not pull the threshold down.
+        """
+        start = time.perf_counter()
+        try:
+            return await call()
+        finally:
+            metrics.observe(f"hedge.{endpoint}.latency", time.perf_counter() - start)
+
+    async def call(
+        self,
+        endpoint: str,
+        call: Callable[[], Awaitable[T]],
+        rate_limit: Optional[Tuple[str, int]] = None,
+        on_discarded: Optional[Callable[[T], None]] = None,
+    ) -> T:
+        """Run call(), hedging it with a duplicate if it is slower than usual
+
+        rate_limit is the (key, limit) of the upstream's shared rate limit,
+        which the caller already waited on for the first attempt; a hedge
+        that finds no free slot is skipped rather than delayed. on_discarded
+        receives the result of an attempt that succeeded but lost, so usage
+        the upstream billed for it is still recorded.
+        """
+        if not settings.HEDGING_ENABLED:
+            return await call()
+
+        budget = self._budget(endpoint)
+        budget.credit()
+        delay = self.threshold(endpoint)
+
+        primary = asyncio.create_task(self._attempt(endpoint, call))
+        attempts = [primary]
+        try:
+            if delay > 0:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done and budget.spend():
+                    if rate_limit is None or await state_store.allow(*rate_limit):
+                        metrics.incr(f"hedge.{endpoint}.fired")
+                        logger.info(
+                            "hedge fired",
+                            extra={"endpoint": endpoint, "after_ms": round(delay * 1000, 1)},
+                        )
+                        attempts.append(
+                            asyncio.create_task(self._attempt(endpoint, call))
+                        )
+                    else:
+                        budget.refund()
+                        metrics.incr(f"hedge.{endpoint}.rate_limited")
+
+            # First success wins; a failure only counts once every attempt failed
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # Done is a set: when both finish together the primary wins
+                winners = sorted(
+                    (attempt for attempt in done if attempt.exception() is None),
+                    key=lambda attempt: attempt is not primary,
+                )
+                if winners:
+                    if winners[0] is not primary:
+                        metrics.incr(f"hedge.{endpoint}.won")
+                    # Both came back at once: the upstream billed the loser too
+                    for loser in winners[1:]:
+                        if on_discarded is not None:
+                            on_discarded(loser.result())
+                    return winners[0].result()
+
+            return primary.result()  # Every attempt failed: raise the primary's error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+
+# Create global instance
+hedger = Hedger()
@@ -0,0 +1,397 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from config.settings import settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id TEXT PRIMARY KEY,
+    image_hash TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    psycho_score REAL NOT NULL,
+    analysis TEXT NOT NULL,
+    stage_timings TEXT,
+    audio_url TEXT,
+    design_features TEXT,
+    provisional_score REAL,
+    phash INTEGER
+);
+CREATE INDEX IF NOT EXISTS analyses_image_hash ON analyses (image_hash);
+CREATE INDEX IF NOT EXISTS analyses_psycho_score ON analyses (psycho_score DESC);
+CREATE INDEX IF NOT EXISTS analyses_created_at ON analyses (created_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS comparisons (
+    id TEXT PRIMARY KEY,
+    original_hash TEXT NOT NULL,
+    contender_hash TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    original_score REAL,
+    contender_score REAL,
+    verdict TEXT,
+    comparison TEXT NOT NULL,
+    stage_timings TEXT,
+    audio_url TEXT
+);
+CREATE INDEX IF NOT EXISTS comparisons_original_hash ON comparisons (original_hash);
+CREATE INDEX IF NOT EXISTS comparisons_contender_hash ON comparisons (contender_hash);
+CREATE INDEX IF NOT EXISTS comparisons_created_at ON comparisons (created_at DESC, id DESC);
+"""
+
+# Columns added after a table was first released: (table, column, type)
+MIGRATIONS = [
+    ("analyses", "design_features", "TEXT"),
+    ("analyses", "provisional_score", "REAL"),
+    ("analyses", "phash", "INTEGER"),
+    ("analyses", "content_hash", "INTEGER"),
+    ("analyses", "model_tier", "TEXT"),
+    ("analyses", "card_hash", "TEXT"),
+]
+
+ANALYSIS_COLUMNS = (
+    "id, image_hash, endpoint, created_at, psycho_score, analysis, stage_timings, "
+    "audio_url, design_features, provisional_score, card_hash"
+)
+COMPARISON_COLUMNS = (
+    "id, original_hash, contender_hash, created_at, original_score, "
+    "contender_score, verdict, comparison, stage_timings, audio_url"
+)
+
+# One page of the leaderboard walk, served in order by analyses_psycho_score
+TOP_PAGE_SQL = (
+    f"SELECT rowid, {ANALYSIS_COLUMNS} FROM analyses "
+    "WHERE psycho_score <= ? AND (psycho_score < ? OR rowid > ?) "
+    "ORDER BY psycho_score DESC, rowid LIMIT ?"
+)
+
+
+def _signed(value: Optional[int]) -> Optional[int]:
+    """A 64-bit hash as SQLite stores integers (signed 64-bit)"""
+    return value - (1 << 64) if value and value >= 1 << 63 else value
+
+
+def _encode_cursor(row: dict) -> str:
+    return f"{row['created_at']!r}:{row['id']}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, str]:
+    created_at, _, row_id = cursor.partition(":")
+    return float(created_at), row_id
+
+
+class HistoryStore:
+    """Embedded SQLite log of every analysis and comparison
+
+    Writes are queued and flushed in batches by a background task so the
+    request path never waits on disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            for table, column, column_type in MIGRATIONS:
+                existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # Writing
+
+    def start(self) -> None:
+        """Start the background writer on the running event loop"""
+        if self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue(maxsize=settings.HISTORY_QUEUE_SIZE)
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def stop(self) -> None:
+        """Flush everything queued so far and stop the writer"""
+        if self._writer is None:
+            return
+
+        await self._queue.put(None)
+        await self._writer
+        self._writer = None
+
+    def _enqueue(self, table: str, row: Dict[str, Any]) -> None:
+        if not settings.HISTORY_ENABLED:
+            return
+
+        self.start()
+        try:
+            self._queue.put_nowait((table, row))
+        except asyncio.QueueFull:
+            # Losing a history row beats stalling a request on disk
+            metrics.incr("history.dropped")
+
+    def record_analysis(
+        self,
+        image_hash: str,
+        endpoint: str,
+        analysis: Dict[str, Any],
+        stage_timings: Optional[Dict[str, float]] = None,
+        audio_url: Optional[str] = None,
+        design_features: Optional[Dict[str, float]] = None,
+        provisional_score: Optional[float] = None,
+        phash: Optional[int] = None,
+        content_hash: Optional[int] = None,
+        model_tier: Optional[str] = None,
+        card_hash: Optional[str] = None,
+    ) -> str:
+        """Queue an analysis for storage and return its history ID
+
+        card_hash tells apart the cards cut from one multi-card upload, which
+        all share its image_hash.
+        """
+        row_id = uuid.uuid4().hex
+        self._enqueue(
+            "analyses",
+            {
+                "id": row_id,
+                "image_hash": image_hash,
+                "endpoint": endpoint,
+                "created_at": time.time(),
+                "psycho_score": analysis.get("psycho_score", 0),
+                "analysis": json.dumps(analysis),
+                "stage_timings": json.dumps(stage_timings or {}),
+                "audio_url": audio_url,
+                "design_features": json.dumps(design_features)
+                if design_features
+                else None,
+                "provisional_score": provisional_score,
+                # SQLite integers are signed 64-bit
+                "phash": _signed(phash),
+                "content_hash": _signed(content_hash),
+                "model_tier": model_tier,
+                "card_hash": card_hash,
+            },
+        )
+        return row_id
+
+    def record_comparison(
+        self,
+        original_hash: str,
+        contender_hash: str,
+        comparison: Dict[str, Any],
+        stage_timings: Optional[Dict[str, float]] = None,
+        audio_url: Optional[str] = None,
+    ) -> str:
+        """Queue an ALPHA vs BETA comparison for storage and return its history ID"""
+        row_id = uuid.uuid4().hex
+        self._enqueue(
+            "comparisons",
+            {
+                "id": row_id,
+                "original_hash": original_hash,
+                "contender_hash": contender_hash,
+                "created_at": time.time(),
+                "original_score": comparison.get("card1_analysis", {}).get(
+                    "psycho_score"
+                ),
+                "contender_score": comparison.get("card2_analysis", {}).get(
+                    "psycho_score"
+                ),
+                "verdict": comparison.get("final_verdict"),
+                "comparison": json.dumps(comparison),
+                "stage_timings": json.dumps(stage_timings or {}),
+                "audio_url": audio_url,
+            },
+        )
+        return row_id
+
+    async def _write_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+
+            # Gather whatever else arrives within the flush interval
+            deadline = time.monotonic() + settings.HISTORY_FLUSH_INTERVAL
+            while len(batch) < settings.HISTORY_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            if None in batch:
+                stopping = True
+                batch = [item for item in batch if item is not None]
+
+            if batch:
+                try:
+                    await asyncio.to_thread(self._write_batch, batch)
+                    metrics.incr("history.written", len(batch))
+                except Exception:
+                    metrics.incr("history.write_errors")
+                    logger.warning(
+                        "⚠️  History write failed", exc_info=True, extra={"rows": len(batch)}
+                    )
+
+    def _write_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        conn = self._connect()
+        with conn:
+            for table in ("analyses", "comparisons"):
+                rows = [row for name, row in batch if name == table]
+                if not rows:
+                    continue
+                columns = list(rows[0])
+                conn.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' for _ in columns)})",
+                    [tuple(row[c] for c in columns) for row in rows],
+                )
+
+    # Reading
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        data = dict(row)
+        for key in ("analysis", "comparison", "stage_timings", "design_features"):
+            if data.get(key):
+                data[key] = json.loads(data[key])
+        return data
+
+    async def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        def run():
+            rows = self._connect().execute(sql, params).fetchall()
+            return [self._row_to_dict(row) for row in rows]
+
+        return await asyncio.to_thread(run)
+
+    async def _page(
+        self, table: str, columns: str, limit: int, cursor: Optional[str]
+    ) -> Dict[str, Any]:
+        """Newest-first keyset pagination over (created_at, id)"""
+        if cursor:
+            created_at, row_id = _decode_cursor(cursor)
+            rows = await self._query(
+                f"SELECT {columns} FROM {table} WHERE (created_at, id) < (?, ?) "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (created_at, row_id, limit),
+            )
+        else:
+            rows = await self._query(
+                f"SELECT {columns} FROM {table} ORDER BY created_at DESC, id DESC LIMIT ?",
+                (limit,),
+            )
+
+        return {
+            "items": rows,
+            "next_cursor": _encode_cursor(rows[-1]) if len(rows) == limit else None,
+        }
+
+    async def list_analyses(self, limit: int = 20, cursor: Optional[str] = None) -> dict:
+        return await self._page("analyses", ANALYSIS_COLUMNS, limit, cursor)
+
+    async def list_comparisons(
+        self, limit: int = 20, cursor: Optional[str] = None
+    ) -> dict:
+        return await self._page("comparisons", COMPARISON_COLUMNS, limit, cursor)
+
+    async def top_analyses(self, n: int = 10, distinct: bool = True) -> List[dict]:
+        """Highest psycho_score analyses, one per card unless distinct is False"""
+        if not distinct:
+            return await self._query(
+                f"SELECT {ANALYSIS_COLUMNS} FROM analyses ORDER BY psycho_score DESC LIMIT ?",
+                (n,),
+            )
+
+        def run():
+            # Walk the psycho_score index (rowids ascend within a score) a page
+            # at a time: a card's first row is its best, and a short leaderboard
+            # stops after a page or two instead of grouping the whole table
+            conn = self._connect()
+            page = max(4 * n, 50)
+            top: List[Dict[str, Any]] = []
+            seen = set()
+            after = (float("inf"), 0)
+            while len(top) < n:
+                rows = conn.execute(TOP_PAGE_SQL, (after[0], *after, page)).fetchall()
+                for row in rows:
+                    card = row["card_hash"] or row["image_hash"]
+                    if card not in seen and len(top) < n:
+                        seen.add(card)
+                        top.append(self._row_to_dict(row))
+                if len(rows) < page:
+                    break
+                after = (rows[-1]["psycho_score"], rows[-1]["rowid"])
+
+            for row in top:
+                del row["rowid"]
+            return top
+
+        return await asyncio.to_thread(run)
+
+    async def card_hashes_since(
+        self, after_rowid: int, limit: int = 10000
+    ) -> List[Tuple[int, int, str, float]]:
+        """(rowid, unsigned phash, id, psycho_score) of analyses added after a rowid"""
+
+        def run():
+            rows = self._connect().execute(
+                "SELECT rowid, phash, id, psycho_score FROM analyses "
+                "WHERE rowid > ? AND phash IS NOT NULL ORDER BY rowid LIMIT ?",
+                (after_rowid, limit),
+            )
+            return [
+                (rowid, phash & ((1 << 64) - 1), row_id, score)
+                for rowid, phash, row_id, score in rows
+            ]
+
+        return await asyncio.to_thread(run)
+
+    async def get_analysis(self, row_id: str) -> Optional[dict]:
+        """A single stored analysis by its history ID, with what reusing it depends on"""
+        rows = await self._query(
+            f"SELECT {ANALYSIS_COLUMNS}, content_hash, model_tier FROM analyses WHERE id = ?",
+            (row_id,),
+        )
+        if not rows:
+            return None
+        row = rows[0]
+        if row["content_hash"] is not None:
+            row["content_hash"] &= (1 << 64) - 1
+        return row
+
+    async def find_by_hash(self, image_hash: str, limit: int = 20) -> List[dict]:
+        """Previous analyses of exactly this image, newest first"""
+        return await self._query(
+            f"SELECT {ANALYSIS_COLUMNS} FROM analyses WHERE image_hash = ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (image_hash, limit),
+        )
+
+
+# Create global instance
+history_store = HistoryStore(settings.HISTORY_DB_PATH)
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from PIL import Image
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    pipeline TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    checkpoint TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at);
+"""
+
+# A job left "resuming" this long belongs to a worker that died; claim it again
+RESUME_LEASE = 10 * 60
+
+
+@dataclass
+class Job:
+    """An analysis that outlived the worker that started it"""
+
+    id: str
+    pipeline: str
+    # suspended (stopped at a drain deadline) -> resuming (claimed by a worker)
+    # -> done (every paid stage completed), or failed after JOB_MAX_ATTEMPTS
+    status: str
+    attempts: int
+    checkpoint: Dict[str, Any]  # Completed stage outputs, see AnalysisPipeline.checkpoint
+
+
+class JobStore:
+    """Embedded SQLite store of analyses suspended at shutdown
+
+    Each job keeps the outputs of the stages it completed (Gemini analysis,
+    comparison, audio) and its decoded cards as lossless PNGs, so the next
+    worker to start can run only the stages that are missing, and a client
+    retrying the same upload gets the paid results without paying again.
+    """
+
+    def __init__(self, path: str, image_dir: str):
+        self.path = path
+        self.image_dir = image_dir
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Job:
+        return Job(
+            id=row["id"],
+            pipeline=row["pipeline"],
+            status=row["status"],
+            attempts=row["attempts"],
+            checkpoint=json.loads(row["checkpoint"]),
+        )
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.image_dir, job_id)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        def get():
+            row = self._connect().execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            return self._row_to_job(row) if row else None
+
+        return await asyncio.to_thread(get)
+
+    async def save(
+        self,
+        job_id: str,
+        pipeline: str,
+        status: str,
+        checkpoint: Dict[str, Any],
+        cards: Optional[List[List[Image.Image]]] = None,
+    ) -> None:
+        """Insert or update a job; cards (per upload) are written once, when it is suspended"""
+
+        def save():
+            if cards is not None:
+                job_dir = self._job_dir(job_id)
+                os.makedirs(job_dir, exist_ok=True)
+                for upload, images in enumerate(cards):
+                    for index, image in enumerate(images):
+                        path = os.path.join(job_dir, f"{upload}-{index}.png")
+                        if not os.path.exists(path):
+                            image.save(path, format="PNG")
+
+            now = time.time()
+            self._connect().execute(
+                "INSERT INTO jobs (id, pipeline, status, attempts, created_at, updated_at, checkpoint) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET status = excluded.status, "
+                "updated_at = excluded.updated_at, checkpoint = excluded.checkpoint",
+                (job_id, pipeline, status, now, now, json.dumps(checkpoint)),
+            )
+            if status == "done":
+                # Retries bring their own upload; the saved cards were only for resuming
+                shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+        await asyncio.to_thread(save)
+
+    def load_cards(self, job: Job) -> List[List[Image.Image]]:
+        """The job's decoded cards, per upload (blocking; run in a thread)"""
+        job_dir = self._job_dir(job.id)
+        cards = []
+        for upload, prepared in enumerate(job.checkpoint["prepared"]):
+            images = []
+            for index in range(prepared["cards"]):
+                with Image.open(os.path.join(job_dir, f"{upload}-{index}.png")) as image:
+                    images.append(image.convert("RGB"))
+            cards.append(images)
+        return cards
+
+    async def claim(self) -> List[Job]:
+        """Take every suspended job (and any abandoned mid-resume) for this worker
+
+        The status change is the claim, so when several workers start together
+        each job is resumed by exactly one of them.
+        """
+
+        def claim():
+            conn = self._connect()
+            stale = time.time() - RESUME_LEASE
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'suspended' "
+                "OR (status = 'resuming' AND updated_at < ?) ORDER BY created_at",
+                (stale,),
+            ).fetchall()
+
+            claimed = []
+            for row in rows:
+                failed = row["attempts"] >= settings.JOB_MAX_ATTEMPTS
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + ?, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND updated_at = ?",
+                    (
+                        "failed" if failed else "resuming",
+                        0 if failed else 1,
+                        time.time(),
+                        row["id"],
+                        row["status"],
+                        row["updated_at"],
+                    ),
+                )
+                if cursor.rowcount == 1 and not failed:
+                    claimed.append(self._row_to_job(row))
+                elif failed:
+                    logger.warning(
+                        "⚠️  Job given up", extra={"job_id": row["id"], "attempts": row["attempts"]}
+                    )
+            return claimed
+
+        return await asyncio.to_thread(claim)
+
+    async def release(self, job_id: str) -> None:
+        """Put a job that could not be resumed back in line for the next worker"""
+
+        def release():
+            self._connect().execute(
+                "UPDATE jobs SET status = 'suspended', updated_at = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+
+        await asyncio.to_thread(release)
+
+    async def purge(self) -> int:
+        """Delete finished and failed jobs older than JOB_RESULT_TTL"""
+
+        def purge():
+            conn = self._connect()
+            cutoff = time.time() - settings.JOB_RESULT_TTL
+            expired = [
+                row["id"]
+                for row in conn.execute(
+                    "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                    (cutoff,),
+                )
+            ]
+            for job_id in expired:
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+            return len(expired)
+
+        return await asyncio.to_thread(purge)
+
+
+# Create global instance
+job_store = JobStore(settings.JOBS_DB_PATH, settings.JOBS_IMAGE_PATH)
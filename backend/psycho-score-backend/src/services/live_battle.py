@@ -0,0 +1,297 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional, Set
+import aiofiles
+from fastapi import HTTPException, UploadFile, WebSocket, WebSocketDisconnect
+from starlette.datastructures import Headers
+from config.settings import settings
+from services.admission import admission_controller, RequestShed
+from services.elevenlabs_service import elevenlabs_service, AUDIO_FORMATS, AUDIO_MEDIA_TYPES
+from services.pipeline import analysis_pipeline, ALPHA_VS_BETA, LIVE_CARD, PreparedImage
+from services.usage import UsageRecord, client_id_for, current_usage, usage_tracker
+from utils.logs import request_id
+from utils.metrics import metrics
+from utils.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of the image types in ALLOWED_IMAGE_TYPES
+IMAGE_SIGNATURES = {b"\x89PNG\r\n\x1a\n": "image/png", b"\xff\xd8\xff": "image/jpeg"}
+
+
+def sniff_content_type(data: bytes) -> str:
+    for signature, content_type in IMAGE_SIGNATURES.items():
+        if data.startswith(signature):
+            return content_type
+    return "application/octet-stream"
+
+
+@dataclass
+class LiveCard:
+    """A card uploaded once in a session, prepared and scored once, reused by every battle"""
+
+    card_id: int
+    role: str
+    prepared: asyncio.Future  # PreparedImage, set as soon as it is decoded
+    scored: asyncio.Future  # BusinessCardAnalysis, set once Gemini has scored it
+    analysis: Optional[dict] = None
+
+
+@dataclass
+class LiveBattleSession:
+    """ALPHA vs BETA over one WebSocket, pushing every result as it is produced
+
+    Binary messages are card images: the first is the original, every later
+    one a contender that immediately battles the original. A text message
+    {"type": "card", "role": ..., "filename": ..., "content_type": ...} may
+    describe the next image (role "original" replaces the original), and
+    {"type": "battle", "original": id, "contender": id} reruns any pair of
+    cards already in the session without sending them again.
+
+    Every card is prepared and scored on its own as it arrives, with one
+    Gemini call. Battles wait for both cards' scores and are judged from
+    them, so neither card is sent to Gemini again; they push the verdict, the
+    final result and the audio (as binary chunks between "audio" and
+    "audio_end").
+    """
+
+    websocket: WebSocket
+    detail: bool = False
+    output_format: Optional[str] = None
+    cards: List[LiveCard] = field(default_factory=list)
+    original: Optional[int] = None
+    battles: int = 0
+    _next_card: dict = field(default_factory=dict)
+    _tasks: Set[asyncio.Task] = field(default_factory=set)
+    _send_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    async def run(self) -> None:
+        try:
+            # Reject an unknown format before the session starts
+            self.output_format = elevenlabs_service.resolve_format(self.output_format)
+        except HTTPException as e:
+            await self.websocket.close(code=1008, reason=e.detail)
+            return
+
+        await self.websocket.accept()
+        metrics.incr("live_battle.sessions")
+        # The HTTP middlewares do not see WebSockets: budget and log the session here
+        headers = self.websocket.headers
+        record = UsageRecord(
+            client_id=client_id_for(
+                headers.get("X-Client-ID"),
+                self.websocket.client.host if self.websocket.client else None,
+            )
+        )
+        usage_token = current_usage.set(record)
+        id_token = request_id.set((headers.get("X-Request-ID") or uuid.uuid4().hex)[:64])
+        try:
+            while True:
+                message = await asyncio.wait_for(
+                    self.websocket.receive(), settings.LIVE_BATTLE_IDLE_TIMEOUT
+                )
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    await self.add_card(message["bytes"])
+                elif message.get("text") is not None:
+                    await self.handle_text(message["text"])
+        except asyncio.TimeoutError:
+            await self.websocket.close(code=1000, reason="Idle timeout")
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await usage_tracker.finish(record)
+            request_id.reset(id_token)
+            current_usage.reset(usage_token)
+
+    async def handle_text(self, text: str) -> None:
+        try:
+            message = json.loads(text)
+            kind = message["type"]
+        except (ValueError, KeyError, TypeError):
+            await self.send_error(400, "Expected a JSON object with a type")
+            return
+
+        if kind == "card":
+            self._next_card = message
+        elif kind == "battle":
+            try:
+                original, contender = int(message["original"]), int(message["contender"])
+                self.cards[original], self.cards[contender]
+            except (KeyError, ValueError, TypeError, IndexError):
+                await self.send_error(400, "battle needs the card_id of two cards in this session")
+                return
+            self.start_battle(original, contender)
+        else:
+            await self.send_error(400, f"Unknown message type: {kind}")
+
+    async def add_card(self, data: bytes) -> None:
+        header, self._next_card = self._next_card, {}
+        if len(self.cards) >= settings.LIVE_BATTLE_MAX_CARDS:
+            await self.send_error(400, f"At most {settings.LIVE_BATTLE_MAX_CARDS} cards per session")
+            return
+
+        role = header.get("role") or ("original" if self.original is None else "contender")
+        if role not in ("original", "contender") or (
+            role == "contender" and self.original is None
+        ):
+            await self.send_error(400, "Send the original card before a contender")
+            return
+
+        loop = asyncio.get_running_loop()
+        card = LiveCard(
+            card_id=len(self.cards),
+            role=role,
+            prepared=loop.create_future(),
+            scored=loop.create_future(),
+        )
+        # A card that fails is reported once, whether or not a battle awaits it
+        for future in (card.prepared, card.scored):
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.cards.append(card)
+        upload = UploadFile(
+            io.BytesIO(data),
+            size=len(data),
+            filename=header.get("filename") or f"card-{card.card_id}",
+            headers=Headers({"content-type": header.get("content_type") or sniff_content_type(data)}),
+        )
+        await self.send({"event": "card_received", "card_id": card.card_id, "role": role})
+        self._spawn(self.score_card(card, upload), card_id=card.card_id)
+
+        if role == "original":
+            self.original = card.card_id
+        else:
+            self.start_battle(self.original, card.card_id)
+
+    async def score_card(self, card: LiveCard, upload: UploadFile) -> None:
+        try:
+            async with self._admitted():
+                async for checkpoint, context in analysis_pipeline.checkpoints(
+                    upload, LIVE_CARD, self.detail
+                ):
+                    if checkpoint == "provisional":
+                        card.prepared.set_result(context.prepared[0])
+                        await self.send(
+                            {
+                                "event": "card_prepared",
+                                "card_id": card.card_id,
+                                "provisional_score": context.provisional_score,
+                                "design_features": context.features,
+                            }
+                        )
+                    else:
+                        card.analysis = context.response
+                        card.scored.set_result(context.analysis)
+                        await self.send(
+                            {"event": "card_scored", "card_id": card.card_id, **context.response}
+                        )
+        except Exception as e:
+            # Battles waiting for this card fail with the same error
+            for future in (card.prepared, card.scored):
+                if not future.done():
+                    future.set_exception(e)
+            raise
+
+    def start_battle(self, original: int, contender: int) -> None:
+        battle_id = self.battles
+        self.battles += 1
+        self._spawn(self.battle(battle_id, original, contender), battle_id=battle_id)
+
+    async def battle(self, battle_id: int, original: int, contender: int) -> None:
+        ids = {"battle_id": battle_id, "original": original, "contender": contender}
+        cards = (self.cards[original], self.cards[contender])
+        prepared: List[PreparedImage] = await asyncio.gather(*(card.prepared for card in cards))
+        analyses = await asyncio.gather(*(card.scored for card in cards))
+        async with self._admitted():
+            async for event in analysis_pipeline.stream_battle(
+                *prepared,
+                ALPHA_VS_BETA,
+                self.detail,
+                self.output_format,
+                analyses=tuple(analyses),
+            ):
+                await self.send({**event, **ids})
+                audio_url = event["battle_result"]["audio_url"]
+                if event["event"] == "result" and audio_url:
+                    await self.send_audio(battle_id, event["battle_result"])
+        metrics.incr("live_battle.battles")
+
+    async def send_audio(self, battle_id: int, battle_result: dict) -> None:
+        """Push the audio file in binary chunks, framed by audio and audio_end events"""
+        filename = os.path.basename(battle_result["audio_url"])
+        path = os.path.join(settings.AUDIO_OUTPUT_PATH, filename)
+        start = {
+            "event": "audio",
+            "battle_id": battle_id,
+            "media_type": AUDIO_MEDIA_TYPES[AUDIO_FORMATS[self.output_format]],
+            "size": os.path.getsize(path),
+            "audio_duration": battle_result["audio_duration"],
+        }
+        # Held throughout, so no other message lands between the chunks
+        async with self._send_lock:
+            await self.websocket.send_text(dumps(start).decode())
+            async with aiofiles.open(path, "rb") as f:
+                while chunk := await f.read(settings.LIVE_BATTLE_AUDIO_CHUNK):
+                    await self.websocket.send_bytes(chunk)
+            await self.websocket.send_text(
+                dumps({"event": "audio_end", "battle_id": battle_id}).decode()
+            )
+
+    async def send(self, event: dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(dumps(event).decode())
+
+    async def send_error(self, status_code: int, detail, **ids) -> None:
+        await self.send({"event": "error", "status_code": status_code, "detail": detail, **ids})
+
+    @asynccontextmanager
+    async def _admitted(self):
+        """Hold an admission slot for one card or battle, like an HTTP request would"""
+        priority = admission_controller.priority_for(self.websocket.url.path)
+        if not settings.ADMISSION_ENABLED or priority is None:
+            yield
+            return
+        ticket = await admission_controller.acquire(
+            priority, settings.ADMISSION_DEADLINES[priority]
+        )
+        try:
+            yield
+        finally:
+            admission_controller.release(ticket)
+
+    def _spawn(self, coro, **ids) -> None:
+        task = asyncio.create_task(self._reporting(coro, ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _reporting(self, coro, ids: dict) -> None:
+        """Turn a failed card or battle into an error event; the session goes on"""
+        try:
+            await coro
+        except HTTPException as e:
+            await self._try_send_error(e.status_code, e.detail, ids)
+        except RequestShed as e:
+            await self._try_send_error(
+                503, "Patrick is busy. Try again shortly.", {**ids, "retry_after": e.retry_after}
+            )
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.warning("live battle step failed", exc_info=True, extra=ids)
+            await self._try_send_error(500, f"Error: {str(e)}", ids)
+
+    async def _try_send_error(self, status_code: int, detail, ids: dict) -> None:
+        try:
+            await self.send_error(status_code, detail, **ids)
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # The client has gone
@@ -0,0 +1,67 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from config.settings import settings
+from utils.metrics import metrics
+
+# Cheapest first; escalation always moves to the last tier
+MODEL_TIERS = ("fast", "strong")
+
+
+@dataclass
+class ModelRoute:
+    """The model tier serving one request, and why it was escalated"""
+
+    tier: str = "strong"
+    escalations: List[str] = field(default_factory=list)
+
+    def escalate(self, reason: str) -> bool:
+        """Move to the strong tier; returns False if already there"""
+        if self.tier == MODEL_TIERS[-1]:
+            return False
+        self.tier = MODEL_TIERS[-1]
+        self.escalations.append(reason)
+        metrics.incr(f"model_router.escalations.{reason}")
+        return True
+
+    def to_dict(self) -> dict:
+        return {"tier": self.tier, "escalations": self.escalations}
+
+
+class ModelRouter:
+    """Chooses the Gemini model tier per request and when to escalate"""
+
+    def __init__(self):
+        self.model_names: Dict[str, str] = {
+            "fast": settings.GEMINI_FAST_MODEL,
+            "strong": settings.GEMINI_STRONG_MODEL,
+        }
+
+    def route(self, tier: str, detail: bool = False) -> ModelRoute:
+        """Start a request on the endpoint's tier (strong if the client wants full detail)"""
+        if tier not in MODEL_TIERS:
+            raise ValueError(f"Unknown model tier: {tier}")
+
+        route = ModelRoute(tier=tier)
+        if detail:
+            route.escalate("detail")
+        return route
+
+    def battle_is_close(self, comparison: dict) -> bool:
+        """Scores too close for the fast tier's verdict to be trusted"""
+        original = comparison.get("card1_analysis", {}).get("psycho_score")
+        contender = comparison.get("card2_analysis", {}).get("psycho_score")
+        if original is None or contender is None:
+            return True
+        try:
+            return abs(float(original) - float(contender)) < settings.BATTLE_ESCALATION_MARGIN
+        except (TypeError, ValueError):
+            return True
+
+    def served(self, route: Optional[ModelRoute]) -> None:
+        """Count a finished request against the tier that served it"""
+        if route is not None:
+            metrics.incr(f"model_router.served.{route.tier}")
+
+
+# Create global instance
+model_router = ModelRouter()
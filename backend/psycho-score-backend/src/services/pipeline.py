@@ -0,0 +1,1023 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from fastapi import UploadFile, HTTPException
+from PIL import Image
+from config.settings import settings
+from models.schemas import BusinessCardAnalysis, AudioResponse
+from services.gemini_service import gemini_service
+from services.elevenlabs_service import elevenlabs_service
+from services.card_index import card_index, CardMatch
+from services.history_store import history_store
+from services.job_store import job_store, Job
+from services.model_router import model_router, ModelRoute
+from services.usage import UsageRecord, usage_tracker, current_usage, BUDGET_MODES
+from services.prompts import ALPHA_ANNOUNCEMENT, BETA_ANNOUNCEMENT
+from utils.card_detection import CardRegion
+from utils.image_processing import (
+    image_processor,
+    compute_image_hash,
+    content_hash,
+    encode_data_url,
+    extract_design_features,
+    perceptual_hash,
+    provisional_psycho_score,
+    describe_design_features,
+    upload_size,
+)
+from utils.metrics import metrics
+from utils.serialization import select_fields, wants_field
+
+logger = logging.getLogger(__name__)
+
+# Seconds suspended pipelines get to save their jobs at the drain deadline
+SUSPEND_TIMEOUT = 5.0
+DRAINING_DETAIL = "Patrick has to return some videotapes. Try again shortly."
+
+
+class PipelineSuspended(Exception):
+    """A stage stopped at the drain deadline; its job is resumed by the next worker"""
+
+
+@dataclass
+class PipelineConfig:
+    """Per-endpoint choice of stages and response shape"""
+
+    name: str
+    include_audio: bool = True
+    include_card_image: bool = False
+    prompt_variant: str = "full"  # See services.prompts.PROMPT_VARIANTS
+    multi_card: bool = False  # Score every card found in one photo in a single call
+    model_tier: str = "strong"  # See services.model_router.MODEL_TIERS
+    # Keep only these top-level keys in the response (None keeps everything)
+    response_fields: Optional[Tuple[str, ...]] = None
+    # Saved as a job when suspended at shutdown, and resumed by the next worker
+    durable: bool = False
+
+
+@dataclass
+class PreparedImage:
+    """An upload that has been hashed and decoded exactly once
+
+    The upload itself stays in the file Starlette spooled it to (on disk above
+    1 MB); only the decoded, downscaled cards are kept in memory.
+    """
+
+    filename: Optional[str]
+    size: int
+    image_hash: str
+    image: Image.Image  # The first (or only) card
+    cards: List[Image.Image] = field(default_factory=list)  # Every card, in reading order
+    card_regions: List[CardRegion] = field(default_factory=list)  # Empty if not cropped
+
+
+@dataclass
+class ScoredCard:
+    """One of several cards found in a single upload"""
+
+    image: Image.Image
+    region: CardRegion
+    features: Dict[str, float]
+    provisional_score: float
+    phash: int
+    content_hash: Optional[int] = None  # Of the inked region, see utils.image_processing
+    near_duplicate: Optional[CardMatch] = None
+    analysis: Optional[BusinessCardAnalysis] = None
+    model_tier: Optional[str] = None  # Tier that produced the analysis, if known
+
+    def to_dict(self) -> dict:
+        return {
+            **self.analysis.model_dump(),
+            "provisional_score": self.provisional_score,
+            "design_features": self.features,
+            "card_region": asdict(self.region),
+            "near_duplicate": near_duplicate_info(self.near_duplicate),
+        }
+
+
+def near_duplicate_info(match: Optional[CardMatch]) -> Optional[dict]:
+    """Response form of a near-duplicate match"""
+    if match is None:
+        return None
+    return {
+        **asdict(match),
+        "message": "Paul Allen already has this card."
+        if match.distance == 0
+        else "Paul Allen has a card just like this one.",
+    }
+
+
+@dataclass
+class PipelineContext:
+    """State carried from one stage to the next for a single request"""
+
+    config: PipelineConfig
+    uploads: List[UploadFile]
+    mode: str = "full"  # Budget mode, see services.usage.BUDGET_MODES
+    route: ModelRoute = field(default_factory=ModelRoute)
+    output_format: Optional[str] = None  # ElevenLabs output_format of the audio
+    fields: Optional[Tuple[str, ...]] = None  # Sparse response, see utils.serialization
+    prepared: List[PreparedImage] = field(default_factory=list)
+    cards: List[ScoredCard] = field(default_factory=list)  # Only for multi-card photos
+    best_card: int = 0  # Index into cards of the top scorer, reported at the top level
+    features: Optional[Dict[str, float]] = None
+    provisional_score: Optional[float] = None
+    phash: Optional[int] = None  # Perceptual hash of the card, see services.card_index
+    content_hash: Optional[int] = None  # Perceptual hash of its inked region
+    near_duplicate: Optional[CardMatch] = None
+    analysis: Optional[BusinessCardAnalysis] = None
+    comparison: Optional[dict] = None
+    speech_text: Optional[str] = None
+    speech_prefix: Optional[str] = None  # Fixed opening of speech_text, pre-synthesized
+    audio: Optional[AudioResponse] = None
+    response: Optional[dict] = None
+    job_id: Optional[str] = None  # Set once the uploads are hashed, see AnalysisPipeline.restore
+    job_status: Optional[str] = None  # Of the earlier job this request picked up, if any
+    timings: Dict[str, float] = field(default_factory=dict)
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def wants_audio(self) -> bool:
+        return self.config.include_audio and BUDGET_MODES.index(
+            self.mode
+        ) < BUDGET_MODES.index("no_audio")
+
+    @property
+    def cache_only(self) -> bool:
+        return self.mode == "cache_only"
+
+    @property
+    def max_cards(self) -> int:
+        return settings.MAX_CARDS_PER_PHOTO if self.config.multi_card else 1
+
+    @property
+    def card_image(self) -> Image.Image:
+        """The image the top-level result describes"""
+        if self.cards:
+            return self.cards[self.best_card].image
+        return self.prepared[0].image
+
+    @property
+    def image_max_size(self) -> Tuple[int, int]:
+        if self.mode == "full":
+            return (2048, 2048)
+        side = settings.REDUCED_IMAGE_MAX_SIZE
+        return (side, side)
+
+    def server_timing(self) -> str:
+        """Stage timings formatted for the Server-Timing response header"""
+        return ", ".join(
+            f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.timings.items()
+        )
+
+
+PSYCHO_SCORE = PipelineConfig(
+    name="psycho_score",
+    include_card_image=True,
+    prompt_variant=settings.PROMPT_VARIANT_PSYCHO_SCORE,
+    multi_card=True,
+    model_tier=settings.MODEL_TIER_PSYCHO_SCORE,
+    durable=True,
+)
+QUICK_ANALYSIS = PipelineConfig(
+    name="quick_analysis",
+    include_audio=False,
+    prompt_variant=settings.PROMPT_VARIANT_QUICK_ANALYSIS,
+    model_tier=settings.MODEL_TIER_QUICK_ANALYSIS,
+    response_fields=("psycho_score", "patrick_critique", "model_tier"),
+    durable=True,
+)
+ALPHA_VS_BETA = PipelineConfig(
+    name="alpha_vs_beta",
+    prompt_variant=settings.PROMPT_VARIANT_ALPHA_VS_BETA,
+    model_tier=settings.MODEL_TIER_ALPHA_VS_BETA,
+    durable=True,
+)
+# Each card of a live battle session, scored as soon as it is uploaded
+LIVE_CARD = PipelineConfig(
+    name="live_card",
+    include_audio=False,
+    prompt_variant=settings.PROMPT_VARIANT_ALPHA_VS_BETA,
+    model_tier=settings.MODEL_TIER_ALPHA_VS_BETA,
+    response_fields=(
+        "psycho_score", "patrick_critique", "provisional_score", "near_duplicate", "model_tier",
+    ),
+)
+# Offline scoring of scanned cards (score_cards.py): one card per file, no audio
+BATCH_SCORE = PipelineConfig(
+    name="batch_score",
+    include_audio=False,
+    prompt_variant=settings.PROMPT_VARIANT_PSYCHO_SCORE,
+    model_tier=settings.MODEL_TIER_PSYCHO_SCORE,
+)
+DURABLE_PIPELINES = {
+    config.name: config for config in (PSYCHO_SCORE, QUICK_ANALYSIS, ALPHA_VS_BETA)
+}
+
+
+def clean_speech_text(text: str) -> str:
+    """Remove JSON artifacts and formatting so the critique reads naturally"""
+    return text.replace('"', "").replace("\\n", " ").strip()
+
+
+def comparison_from_analyses(
+    original: BusinessCardAnalysis, contender: BusinessCardAnalysis
+) -> dict:
+    """A battle judged from two cards already scored on their own, with no model call
+
+    Same shape as a Gemini comparison; the original keeps its place on a tie.
+    """
+    verdict = "ALPHA" if original.psycho_score >= contender.psycho_score else "BETA"
+    winner = original if verdict == "ALPHA" else contender
+
+    def card(analysis: BusinessCardAnalysis) -> dict:
+        return {
+            "psycho_score": analysis.psycho_score,
+            "card_quality": analysis.card_quality,
+            "patrick_critique": analysis.patrick_critique,
+        }
+
+    return {
+        "card1_analysis": card(original),
+        "card2_analysis": card(contender),
+        "comparison_critique": f"{original.patrick_critique}\n\n{contender.patrick_critique}",
+        "winner": verdict,
+        "winner_reasoning": winner.patrick_critique,
+        "final_verdict": verdict,
+    }
+
+
+class AnalysisPipeline:
+    """validate → prepare → features → analyze → speak → respond, shared by every analysis route"""
+
+    def __init__(self):
+        # Decoding and resizing are CPU bound, so cap how many run in threads at once
+        self._prepare_slots = asyncio.Semaphore(settings.IMAGE_PREPARE_CONCURRENCY)
+        self.draining = False  # No new pipelines once set, see drain()
+        self._suspending = False
+        self._running = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._stage_tasks: Set[asyncio.Task] = set()
+        self._resumer: Optional[asyncio.Task] = None
+
+    async def _stage(self, context: PipelineContext, stage: str, coro) -> None:
+        if self._suspending:
+            coro.close()
+            raise PipelineSuspended(stage)
+
+        start = time.perf_counter()
+        # A task of its own, so that drain() can stop the stage but not the request
+        task = asyncio.ensure_future(coro)
+        self._stage_tasks.add(task)
+        try:
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            self._stage_tasks.discard(task)
+            elapsed = time.perf_counter() - start
+            context.timings[stage] = elapsed
+            metrics.observe(f"pipeline.{context.config.name}.{stage}", elapsed)
+
+        if task.cancelled():
+            raise PipelineSuspended(stage)
+        task.result()
+
+    async def _start(
+        self,
+        config: PipelineConfig,
+        uploads: List[UploadFile],
+        detail: bool = False,
+        output_format: Optional[str] = None,
+        fields: Optional[Tuple[str, ...]] = None,
+    ) -> PipelineContext:
+        if self.draining:
+            raise HTTPException(
+                status_code=503,
+                detail=DRAINING_DETAIL,
+                headers={"Retry-After": str(settings.SHUTDOWN_RETRY_AFTER)},
+            )
+        context = PipelineContext(config=config, uploads=uploads, fields=fields)
+        if config.include_audio:
+            # Reject an unknown format before any upstream work is done
+            context.output_format = elevenlabs_service.resolve_format(output_format)
+        context.mode = await usage_tracker.current_mode()
+        context.route = model_router.route(config.model_tier, detail)
+        metrics.incr(f"pipeline.{config.name}.requests")
+        return context
+
+    async def _instrumented(
+        self, context: PipelineContext, stages: AsyncIterator[str]
+    ) -> AsyncIterator[str]:
+        """Count errors and total latency around a sequence of stages, and log the trace"""
+        name = context.config.name
+        self._running += 1
+        try:
+            async for checkpoint in stages:
+                yield checkpoint
+            if context.job_status in ("suspended", "resuming"):
+                await job_store.save(context.job_id, name, "done", self.checkpoint(context))
+        except PipelineSuspended:
+            metrics.incr(f"pipeline.{name}.suspended")
+            if context.job_id is not None and context.job_status != "done":
+                await job_store.save(
+                    context.job_id,
+                    name,
+                    "suspended",
+                    self.checkpoint(context),
+                    cards=[prepared.cards for prepared in context.prepared],
+                )
+            logger.warning("pipeline suspended", extra=self._log_fields(context))
+            raise HTTPException(
+                status_code=503,
+                detail=DRAINING_DETAIL,
+                headers={"Retry-After": str(settings.SHUTDOWN_RETRY_AFTER)},
+            )
+        except Exception as e:
+            metrics.incr(f"pipeline.{name}.errors")
+            # Bad uploads and budget refusals are the client's problem, not ours
+            if not isinstance(e, HTTPException) or e.status_code >= 500:
+                logger.warning(
+                    "pipeline failed", exc_info=True, extra=self._log_fields(context)
+                )
+            raise
+        finally:
+            self._running -= 1
+            if not self._running and self._idle is not None:
+                self._idle.set()
+
+        metrics.observe(f"pipeline.{name}.total", time.perf_counter() - context.started_at)
+        model_router.served(context.route)
+        logger.info("pipeline", extra=self._log_fields(context))
+
+    def _log_fields(self, context: PipelineContext) -> dict:
+        return {
+            "pipeline": context.config.name,
+            "mode": context.mode,
+            "tier": context.route.tier,
+            "escalations": context.route.escalations,
+            "stages_ms": {
+                stage: round(elapsed * 1000, 1)
+                for stage, elapsed in context.timings.items()
+            },
+            "total_ms": round((time.perf_counter() - context.started_at) * 1000, 1),
+            "job_id": context.job_id,
+        }
+
+    async def _card_stages(self, context: PipelineContext) -> AsyncIterator[str]:
+        """Single-card stages, yielding each checkpoint a client can be sent"""
+        await self._stage(context, "validate", self.validate(context))
+        await self._stage(context, "prepare", self.prepare(context))
+        if settings.ENHANCE_ENABLED:
+            await self._stage(context, "enhance", self.enhance(context))
+        await self._stage(context, "features", self.features(context))
+        if context.config.durable and settings.JOBS_ENABLED:
+            await self._stage(context, "restore", self.restore(context))
+        yield "provisional"
+
+        await self._stage(context, "analyze", self.analyze(context))
+        if context.wants_audio:
+            await self._stage(context, "speak", self.speak(context))
+        await self._stage(context, "respond", self.respond(context))
+        self.record_history(context)
+        yield "result"
+
+    async def _battle_stages(self, context: PipelineContext) -> AsyncIterator[str]:
+        await self._stage(context, "validate", self.validate(context))
+        await self._stage(context, "prepare", self.prepare(context))
+        if settings.ENHANCE_ENABLED:
+            await self._stage(context, "enhance", self.enhance(context))
+        if context.config.durable and settings.JOBS_ENABLED:
+            await self._stage(context, "restore", self.restore(context))
+        async for checkpoint in self._judge_stages(context):
+            yield checkpoint
+
+    async def _judge_stages(self, context: PipelineContext) -> AsyncIterator[str]:
+        """Battle stages once both cards are prepared"""
+        await self._stage(context, "analyze", self.compare(context))
+        yield "verdict"
+
+        if context.wants_audio:
+            await self._stage(context, "speak", self.speak(context))
+        await self._stage(context, "respond", self.respond_battle(context))
+        self.record_history(context)
+        yield "result"
+
+    async def run(
+        self,
+        file: UploadFile,
+        config: PipelineConfig,
+        detail: bool = False,
+        output_format: Optional[str] = None,
+        fields: Optional[Tuple[str, ...]] = None,
+    ) -> PipelineContext:
+        """Score a single business card (detail forces the strong model tier)"""
+        context = await self._start(config, [file], detail, output_format, fields)
+        async for _ in self._instrumented(context, self._card_stages(context)):
+            pass
+        return context
+
+    async def stream(
+        self,
+        file: UploadFile,
+        config: PipelineConfig,
+        detail: bool = False,
+        output_format: Optional[str] = None,
+        fields: Optional[Tuple[str, ...]] = None,
+    ) -> AsyncIterator[dict]:
+        """Score a single card, yielding the provisional score before the Gemini result"""
+        async for checkpoint, context in self.checkpoints(
+            file, config, detail, output_format, fields
+        ):
+            if checkpoint == "provisional":
+                event = {
+                    "event": "provisional",
+                    "provisional_score": context.provisional_score,
+                    "design_features": context.features,
+                }
+                if context.cards:
+                    event["cards"] = [
+                        {
+                            "provisional_score": card.provisional_score,
+                            "design_features": card.features,
+                        }
+                        for card in context.cards
+                    ]
+                yield event
+            else:
+                yield {"event": "result", **context.response}
+
+    async def checkpoints(
+        self,
+        file: UploadFile,
+        config: PipelineConfig,
+        detail: bool = False,
+        output_format: Optional[str] = None,
+        fields: Optional[Tuple[str, ...]] = None,
+    ) -> AsyncIterator[Tuple[str, PipelineContext]]:
+        """Score a single card, yielding each checkpoint with the context so far"""
+        context = await self._start(config, [file], detail, output_format, fields)
+        async for checkpoint in self._instrumented(context, self._card_stages(context)):
+            yield checkpoint, context
+
+    async def stream_battle(
+        self,
+        original: PreparedImage,
+        contender: PreparedImage,
+        config: PipelineConfig,
+        detail: bool = False,
+        output_format: Optional[str] = None,
+        analyses: Optional[Tuple[BusinessCardAnalysis, BusinessCardAnalysis]] = None,
+    ) -> AsyncIterator[dict]:
+        """Decide a battle between two prepared cards, yielding the verdict before the audio
+
+        With the cards' own analyses the verdict is taken from their scores
+        instead of a Gemini comparison.
+        """
+        context = await self._start(config, [], detail, output_format)
+        context.prepared = [original, contender]
+        if analyses is not None:
+            context.comparison = comparison_from_analyses(*analyses)
+        async for checkpoint in self._instrumented(context, self._judge_stages(context)):
+            if checkpoint == "verdict":
+                await self.respond_battle(context)
+            yield {"event": checkpoint, **context.response}
+
+    async def run_battle(
+        self,
+        original: UploadFile,
+        contender: UploadFile,
+        config: PipelineConfig,
+        detail: bool = False,
+        output_format: Optional[str] = None,
+        fields: Optional[Tuple[str, ...]] = None,
+    ) -> PipelineContext:
+        """Decide ALPHA vs BETA between two business cards"""
+        context = await self._start(
+            config, [original, contender], detail, output_format, fields
+        )
+        async for _ in self._instrumented(context, self._battle_stages(context)):
+            pass
+        return context
+
+    def start(self) -> None:
+        """Resume the jobs suspended by workers that shut down, in the background"""
+        if settings.JOBS_ENABLED and (self._resumer is None or self._resumer.done()):
+            self._resumer = asyncio.create_task(self.resume_jobs())
+
+    async def drain(self, timeout: float) -> int:
+        """Refuse new pipelines, give running ones `timeout` seconds, then suspend the rest
+
+        A suspended pipeline saves its job (durable pipelines only) and answers
+        503 with Retry-After. Returns how many pipelines were suspended.
+        """
+        self.draining = True
+        self._idle = asyncio.Event()
+        if self._running:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        suspended = self._running
+        if suspended:
+            self._suspending = True
+            for task in list(self._stage_tasks):
+                task.cancel()
+            try:
+                await asyncio.wait_for(self._idle.wait(), SUSPEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "⚠️  Pipelines still running after suspension",
+                    extra={"running": self._running},
+                )
+
+        if self._resumer is not None:
+            self._resumer.cancel()
+        return suspended
+
+    def job_id(self, context: PipelineContext) -> str:
+        """Same endpoint, uploads, starting tier and audio format: same job"""
+        key = ":".join(
+            [
+                context.config.name,
+                context.route.tier,
+                context.output_format or "",
+                *(prepared.image_hash for prepared in context.prepared),
+            ]
+        )
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def checkpoint(self, context: PipelineContext) -> dict:
+        """Everything a job needs to run its remaining stages without the uploads"""
+        record = current_usage.get()
+        return {
+            "client_id": record.client_id if record is not None else None,
+            "mode": context.mode,
+            "route": context.route.to_dict(),
+            "output_format": context.output_format,
+            "prepared": [
+                {
+                    "filename": prepared.filename,
+                    "size": prepared.size,
+                    "image_hash": prepared.image_hash,
+                    "cards": len(prepared.cards),
+                    "card_regions": [asdict(region) for region in prepared.card_regions],
+                }
+                for prepared in context.prepared
+            ],
+            "analysis": context.analysis.model_dump() if context.analysis else None,
+            "card_analyses": [
+                card.analysis.model_dump() if card.analysis else None
+                for card in context.cards
+            ],
+            "comparison": context.comparison,
+            "audio": context.audio.model_dump() if context.audio else None,
+        }
+
+    def apply_checkpoint(self, context: PipelineContext, checkpoint: dict) -> None:
+        """Take over the stage outputs of a job, so those stages are skipped"""
+        context.route = ModelRoute(**checkpoint["route"])
+        if checkpoint["analysis"]:
+            context.analysis = BusinessCardAnalysis(**checkpoint["analysis"])
+        for card, analysis in zip(context.cards, checkpoint["card_analyses"]):
+            if analysis:
+                card.analysis = BusinessCardAnalysis(**analysis)
+        context.comparison = checkpoint["comparison"]
+
+        audio = checkpoint["audio"]
+        # Audio is on this host's disk only; a retry on another host synthesizes it again
+        if audio and os.path.exists(
+            os.path.join(settings.AUDIO_OUTPUT_PATH, os.path.basename(audio["audio_url"]))
+        ):
+            context.audio = AudioResponse(**audio)
+
+    async def restore(self, context: PipelineContext) -> None:
+        """Pick up whatever an earlier, suspended request for the same uploads completed"""
+        context.job_id = self.job_id(context)
+        job = await job_store.get(context.job_id)
+        if job is None:
+            return
+
+        context.job_status = job.status
+        self.apply_checkpoint(context, job.checkpoint)
+        metrics.incr(f"pipeline.{context.config.name}.jobs_restored")
+
+    async def resume_jobs(self) -> None:
+        """Finish, one at a time, every job this worker can claim"""
+        await job_store.purge()
+        for job in await job_store.claim():
+            if self.draining:
+                break
+            try:
+                await self.resume(job)
+                metrics.incr("pipeline.jobs_resumed")
+            except Exception:
+                if not self.draining:
+                    logger.warning(
+                        "⚠️  Job resume failed", exc_info=True, extra={"job_id": job.id}
+                    )
+                await job_store.release(job.id)
+
+    async def resume(self, job: Job) -> None:
+        """Run the paid stages a suspended job is missing, from its saved cards
+
+        Nobody is waiting for the response: the results are saved on the job,
+        where the client's retry of the same upload finds them.
+        """
+        checkpoint = job.checkpoint
+        context = PipelineContext(
+            config=DURABLE_PIPELINES[job.pipeline],
+            uploads=[],
+            mode=checkpoint["mode"],
+            output_format=checkpoint["output_format"],
+            job_id=job.id,
+            job_status="resuming",
+        )
+        cards = await asyncio.to_thread(job_store.load_cards, job)
+        context.prepared = [
+            PreparedImage(
+                filename=prepared["filename"],
+                size=prepared["size"],
+                image_hash=prepared["image_hash"],
+                image=images[0],
+                cards=images,
+                card_regions=[CardRegion(**region) for region in prepared["card_regions"]],
+            )
+            for prepared, images in zip(checkpoint["prepared"], cards)
+        ]
+
+        # Charged to the client that sent the uploads
+        record = UsageRecord(client_id=checkpoint["client_id"] or "anonymous")
+        token = current_usage.set(record)
+        try:
+            async for _ in self._instrumented(
+                context, self._resumed_stages(context, checkpoint)
+            ):
+                pass
+        finally:
+            current_usage.reset(token)
+            await usage_tracker.finish(record)
+
+    async def _resumed_stages(
+        self, context: PipelineContext, checkpoint: dict
+    ) -> AsyncIterator[str]:
+        # Battles are the pipelines with two uploads
+        if len(context.prepared) == 2:
+            self.apply_checkpoint(context, checkpoint)
+            await self._stage(context, "analyze", self.compare(context))
+        else:
+            await self._stage(context, "features", self.features(context))
+            self.apply_checkpoint(context, checkpoint)
+            await self._stage(context, "analyze", self.analyze(context))
+        if context.wants_audio:
+            await self._stage(context, "speak", self.speak(context))
+        yield "result"
+
+    async def validate(self, context: PipelineContext) -> None:
+        for upload in context.uploads:
+            image_processor.validate_image(upload)
+
+    async def prepare_upload(
+        self,
+        upload: UploadFile,
+        max_size: Tuple[int, int] = (2048, 2048),
+        max_cards: int = 1,
+    ) -> PreparedImage:
+        """Hash and decode an upload once for every later stage, streaming from its file"""
+        size = upload.size if upload.size is not None else upload_size(upload.file)
+        if size > settings.MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE / (1024 * 1024):.1f}MB",
+            )
+
+        def hash_and_decode():
+            # Both passes read the same file handle, so they run one after the other
+            image_hash = compute_image_hash(upload.file)
+            return image_hash, image_processor.prepare_cards(
+                upload.file, max_size, max_cards
+            )
+
+        async with self._prepare_slots:
+            image_hash, (cards, card_regions) = await asyncio.to_thread(hash_and_decode)
+
+        for card_region in card_regions:
+            metrics.incr("pipeline.card_crops")
+            metrics.observe("pipeline.card_crop.area_ratio", card_region.area_ratio)
+
+        return PreparedImage(
+            filename=upload.filename,
+            size=size,
+            image_hash=image_hash,
+            image=cards[0],
+            cards=cards,
+            card_regions=card_regions,
+        )
+
+    async def prepare(self, context: PipelineContext) -> None:
+        context.prepared = list(
+            await asyncio.gather(
+                *(
+                    self.prepare_upload(
+                        upload, context.image_max_size, context.max_cards
+                    )
+                    for upload in context.uploads
+                )
+            )
+        )
+
+        record = current_usage.get()
+        if record is not None:
+            record.image_max_side = context.image_max_size[0]
+
+    async def enhance(self, context: PipelineContext) -> None:
+        """Enhance the cards that are dim or noisy; most are left untouched"""
+
+        def enhance_all():
+            for prepared in context.prepared:
+                enhanced = []
+                for card in prepared.cards:
+                    quality = image_processor.assess_image_quality(card)
+                    metrics.incr(
+                        "pipeline.enhance.applied"
+                        if quality.needs_enhancement
+                        else "pipeline.enhance.skipped"
+                    )
+                    enhanced.append(image_processor.enhance_image_for_analysis(card, quality))
+                prepared.cards = enhanced
+                prepared.image = enhanced[0]
+
+        async with self._prepare_slots:
+            await asyncio.to_thread(enhance_all)
+
+    async def features(self, context: PipelineContext) -> None:
+        prepared = context.prepared[0]
+        features, phashes, content_hashes = await asyncio.to_thread(
+            lambda: (
+                [extract_design_features(image) for image in prepared.cards],
+                [perceptual_hash(image) for image in prepared.cards],
+                [content_hash(image) for image in prepared.cards],
+            )
+        )
+        context.features = features[0]
+        context.provisional_score = provisional_psycho_score(context.features)
+        context.phash = phashes[0]
+        context.content_hash = content_hashes[0]
+        context.near_duplicate = card_index.nearest(context.phash)
+
+        if len(prepared.cards) > 1:
+            context.cards = [
+                ScoredCard(
+                    image=image,
+                    region=region,
+                    features=card_features,
+                    provisional_score=provisional_psycho_score(card_features),
+                    phash=phash,
+                    content_hash=ink_hash,
+                    near_duplicate=card_index.nearest(phash),
+                )
+                for image, region, card_features, phash, ink_hash in zip(
+                    prepared.cards, prepared.card_regions, features, phashes, content_hashes
+                )
+            ]
+
+    async def analyze(self, context: PipelineContext) -> None:
+        if context.cards:
+            await self.analyze_cards(context)
+            return
+
+        if context.analysis is None:
+            card = context.prepared[0]
+            hints = None
+            if settings.DESIGN_FEATURES_IN_PROMPT and context.features:
+                hints = describe_design_features(context.features)
+
+            context.analysis = await gemini_service.analyze_image(
+                card.image_hash,
+                card.image,
+                hints=hints,
+                cache_only=context.cache_only,
+                prompt_variant=context.config.prompt_variant,
+                near_duplicate=context.near_duplicate,
+                route=context.route,
+                content_hash=context.content_hash,
+            )
+        context.speech_text = clean_speech_text(context.analysis.patrick_critique)
+
+    async def analyze_cards(self, context: PipelineContext) -> None:
+        """Score every card of a multi-card photo in one Gemini call"""
+        for card in context.cards:
+            if card.analysis is None:
+                reused = await gemini_service.reuse_analysis(
+                    card.near_duplicate, card.content_hash, context.route
+                )
+                if reused is not None:
+                    # The tier of the stored row, not the one asked for
+                    card.analysis, card.model_tier = reused
+
+        # Only cards nobody has scored before go to Gemini
+        fresh = [
+            index for index, card in enumerate(context.cards) if card.analysis is None
+        ]
+        if fresh:
+            hints = [
+                describe_design_features(context.cards[index].features)
+                if settings.DESIGN_FEATURES_IN_PROMPT
+                else None
+                for index in fresh
+            ]
+            analyses = await gemini_service.analyze_images(
+                # The cache key names the subset of cards that was sent
+                f"{context.prepared[0].image_hash}:{'.'.join(map(str, fresh))}",
+                [context.cards[index].image for index in fresh],
+                hints=hints,
+                cache_only=context.cache_only,
+                prompt_variant=context.config.prompt_variant,
+                route=context.route,
+            )
+            for index, analysis in zip(fresh, analyses):
+                context.cards[index].analysis = analysis
+                context.cards[index].model_tier = context.route.tier
+        metrics.observe("pipeline.cards_per_photo", len(context.cards))
+
+        analyses = [card.analysis for card in context.cards]
+
+        # The top-level result (and Patrick's voice) goes to the best card on the table
+        context.best_card = max(
+            range(len(analyses)), key=lambda index: analyses[index].psycho_score
+        )
+        best = context.cards[context.best_card]
+        context.analysis = best.analysis
+        context.features = best.features
+        context.provisional_score = best.provisional_score
+        context.phash = best.phash
+        context.content_hash = best.content_hash
+        context.near_duplicate = best.near_duplicate
+        context.speech_text = clean_speech_text(best.analysis.patrick_critique)
+
+    async def compare(self, context: PipelineContext) -> None:
+        original, contender = context.prepared
+        while context.comparison is None:
+            context.comparison = await gemini_service.compare_images(
+                original.image_hash,
+                original.image,
+                contender.image_hash,
+                contender.image,
+                cache_only=context.cache_only,
+                prompt_variant=context.config.prompt_variant,
+                route=context.route,
+            )
+            # A near tie on the fast tier is settled again by the strong one
+            # (escalate() is False once the route is already strong)
+            if model_router.battle_is_close(
+                context.comparison
+            ) and context.route.escalate("close_battle"):
+                context.comparison = None
+
+        # Create dramatic announcement text
+        verdict = context.comparison.get("final_verdict", "BETA")
+        winner_reasoning = context.comparison.get(
+            "winner_reasoning", "Superior design execution"
+        )
+        context.speech_prefix = ALPHA_ANNOUNCEMENT if verdict == "ALPHA" else BETA_ANNOUNCEMENT
+        context.speech_text = f"{context.speech_prefix} {winner_reasoning}"
+
+    async def speak(self, context: PipelineContext) -> None:
+        if context.audio is not None:
+            return
+        context.audio = await elevenlabs_service.generate_audio(
+            text=context.speech_text,
+            voice_id=None,  # Use default Patrick voice
+            output_format=context.output_format,
+            prefix=context.speech_prefix,
+        )
+
+    async def respond(self, context: PipelineContext) -> None:
+        analysis = context.analysis
+        response = analysis.model_dump()
+        response["audio_url"] = context.audio.audio_url if context.audio else None
+        response["audio_duration"] = context.audio.audio_duration if context.audio else None
+        response["provisional_score"] = context.provisional_score
+        response["design_features"] = context.features
+        response["near_duplicate"] = near_duplicate_info(context.near_duplicate)
+        response["model_tier"] = context.route.to_dict()
+        response["analysis_details"] = {
+            "typography": analysis.typography,
+            "color_scheme": analysis.color_scheme,
+            "design_elements": analysis.design_elements,
+            "material_impression": analysis.material_impression,
+        }
+
+        # The JPEG re-encode is skipped entirely when the client leaves it out
+        if context.config.include_card_image and wants_field(context.fields, "cardImage"):
+            async with self._prepare_slots:
+                response["cardImage"] = await asyncio.to_thread(
+                    encode_data_url, context.card_image
+                )
+
+        if context.cards:
+            response["cards"] = [card.to_dict() for card in context.cards]
+            response["best_card"] = context.best_card
+
+        if context.config.response_fields is not None:
+            response = {
+                key: response[key]
+                for key in context.config.response_fields
+                if key in response
+            }
+        if context.fields is not None:
+            response = select_fields(response, context.fields)
+
+        context.response = response
+
+    async def respond_battle(self, context: PipelineContext) -> None:
+        comparison = context.comparison
+        verdict = comparison.get("final_verdict", "BETA")
+
+        context.response = {
+            "battle_result": {
+                "verdict": verdict,
+                "winner": "original" if verdict == "ALPHA" else "contender",
+                "announcement": context.speech_text,
+                "audio_url": context.audio.audio_url if context.audio else None,
+                "audio_duration": (
+                    context.audio.audio_duration if context.audio else None
+                ),
+            },
+            "detailed_analysis": {
+                "original_card": comparison.get("card1_analysis", {}),
+                "contender_card": comparison.get("card2_analysis", {}),
+                "patrick_comparison": comparison.get("comparison_critique", ""),
+                "winner_reasoning": comparison.get(
+                    "winner_reasoning", "Superior design execution"
+                ),
+            },
+            "scores": {
+                "original_score": comparison.get("card1_analysis", {}).get(
+                    "psycho_score", 0
+                ),
+                "contender_score": comparison.get("card2_analysis", {}).get(
+                    "psycho_score", 0
+                ),
+            },
+            "model_tier": context.route.to_dict(),
+        }
+        if context.fields is not None:
+            context.response = select_fields(context.response, context.fields)
+
+    def record_history(self, context: PipelineContext) -> None:
+        """Queue the result for the history store (never blocks on disk)"""
+        audio_url = context.audio.audio_url if context.audio else None
+
+        if context.comparison is not None:
+            original, contender = context.prepared
+            history_store.record_comparison(
+                original_hash=original.image_hash,
+                contender_hash=contender.image_hash,
+                comparison=context.comparison,
+                stage_timings=context.timings,
+                audio_url=audio_url,
+            )
+        elif context.cards:
+            # One row per card on the table, all under the upload's hash
+            image_hash = context.prepared[0].image_hash
+            for index, card in enumerate(context.cards):
+                row_id = history_store.record_analysis(
+                    image_hash=image_hash,
+                    endpoint=context.config.name,
+                    analysis=card.analysis.model_dump(),
+                    stage_timings=context.timings,
+                    audio_url=audio_url if card.analysis is context.analysis else None,
+                    design_features=card.features,
+                    provisional_score=card.provisional_score,
+                    phash=card.phash,
+                    content_hash=card.content_hash,
+                    model_tier=card.model_tier,
+                    card_hash=f"{image_hash}:{index}",
+                )
+                card_index.add(card.phash, row_id, card.analysis.psycho_score)
+        elif context.analysis is not None:
+            row_id = history_store.record_analysis(
+                image_hash=context.prepared[0].image_hash,
+                endpoint=context.config.name,
+                analysis=context.analysis.model_dump(),
+                stage_timings=context.timings,
+                audio_url=audio_url,
+                design_features=context.features,
+                provisional_score=context.provisional_score,
+                phash=context.phash,
+                content_hash=context.content_hash,
+                model_tier=context.route.tier,
+            )
+            if context.phash is not None:
+                card_index.add(context.phash, row_id, context.analysis.psycho_score)
+
+
+# Create global instance
+analysis_pipeline = AnalysisPipeline()
@@ -0,0 +1,406 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException
+from config.settings import settings
+
+
+class LeaderCancelled(Exception):
+    """The caller computing a single_flight value was cancelled before it finished"""
+
+
+class StateStore(ABC):
+    """Key/value state shared by every worker process (caches, locks, counters)"""
+
+    def __init__(self):
+        # Calls currently running in this worker, so local callers share them
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        ...
+
+    @abstractmethod
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        """Take the lock for ttl seconds; return its owner token, or None if held"""
+
+    @abstractmethod
+    async def release_lock(self, key: str, token: str) -> None:
+        """Release the lock, unless it expired and someone else now holds it"""
+
+    async def close(self) -> None:
+        pass
+
+    async def single_flight(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        lock_ttl: float = 120.0,
+        should_cache: Optional[Callable[[Any], bool]] = None,
+        poll_interval: float = 0.1,
+    ) -> Any:
+        """Return the cached value for key, computing it at most once across all workers"""
+        while True:
+            cached = await self.get(key)
+            if cached is not None:
+                return cached
+
+            # Join a call that is already running in this worker
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            try:
+                return await asyncio.shield(inflight)
+            except LeaderCancelled:
+                # Its caller went away; the first joiner back takes over
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._compute_once(
+                key, factory, ttl, lock_ttl, should_cache, poll_interval
+            )
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # Joiners were not cancelled: let them retry instead
+            future.set_exception(LeaderCancelled(key))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _compute_once(
+        self, key, factory, ttl, lock_ttl, should_cache, poll_interval
+    ) -> Any:
+        lock_key = f"lock:{key}"
+        # Results that are not cached are still handed to the workers waiting on them
+        handoff_key = f"handoff:{key}"
+
+        while True:
+            token = await self.acquire_lock(lock_key, lock_ttl)
+            if token is not None:
+                try:
+                    value = await factory()
+                    if value is not None and (
+                        should_cache is None or should_cache(value)
+                    ):
+                        await self.set(key, value, ttl)
+                    elif value is not None:
+                        await self.set(handoff_key, value, max(poll_interval * 10, 1.0))
+                    return value
+                finally:
+                    await self.release_lock(lock_key, token)
+
+            # Another worker is computing the same value: wait for its result. If it
+            # dies, its lock expires after lock_ttl and one waiter takes over.
+            await asyncio.sleep(poll_interval)
+            for result_key in (key, handoff_key):
+                cached = await self.get(result_key)
+                if cached is not None:
+                    return cached
+
+    async def allow(self, key: str, limit: int, window: float = 60.0) -> bool:
+        """Fixed-window rate limit check shared by all workers"""
+        if limit <= 0:
+            return True
+
+        bucket = int(time.time() // window)
+        count = await self.incr(f"ratelimit:{key}:{bucket}", ttl=window * 2)
+        return count <= limit
+
+    async def wait_for_slot(
+        self, key: str, limit: int, window: float = 60.0, max_wait: float = 30.0
+    ) -> None:
+        """Wait until the shared rate limit allows another upstream call"""
+        deadline = time.monotonic() + max_wait
+
+        while not await self.allow(key, limit, window):
+            retry_in = window - (time.time() % window)
+            if time.monotonic() + retry_in > deadline:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Upstream rate limit reached for {key}, retry in {retry_in:.0f}s",
+                    headers={"Retry-After": str(int(retry_in) + 1)},
+                )
+            await asyncio.sleep(min(retry_in, 1.0))
+
+
+class MemoryStateStore(StateStore):
+    """Process-local store, suitable for a single worker"""
+
+    def __init__(self, max_entries: int = 10000):
+        super().__init__()
+        self.max_entries = max_entries
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        if item[1] is not None and item[1] <= time.time():
+            del self._data[key]
+            return None
+
+        return item
+
+    def _evict(self) -> None:
+        now = time.time()
+        for key in [k for k, (_, exp) in self._data.items() if exp and exp <= now]:
+            del self._data[key]
+
+        # Still full: drop the oldest entries (dicts keep insertion order)
+        while len(self._data) >= self.max_entries:
+            del self._data[next(iter(self._data))]
+
+    async def get(self, key: str) -> Optional[Any]:
+        item = self._live(key)
+        return item[0] if item else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if len(self._data) >= self.max_entries:
+            self._evict()
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        item = self._live(key)
+        if item is None:
+            await self.set(key, amount, ttl)
+            return amount
+
+        value = item[0] + amount
+        self._data[key] = (value, item[1])
+        return value
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        if self._live(key) is not None:
+            return None
+
+        token = uuid.uuid4().hex
+        await self.set(key, token, ttl)
+        return token
+
+    async def release_lock(self, key: str, token: str) -> None:
+        item = self._live(key)
+        if item is not None and item[0] == token:
+            del self._data[key]
+
+
+class SQLiteStateStore(StateStore):
+    """SQLite (WAL mode) store shared by all worker processes on one host"""
+
+    PURGE_EVERY = 500  # Writes between sweeps of expired rows
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        # Create the schema on a short-lived connection so nothing leaks into forks
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        return await asyncio.to_thread(lambda: fn(self._connect(), *args))
+
+    @staticmethod
+    def _transaction(conn: sqlite3.Connection, fn: Callable) -> Any:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn()
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _get(self, conn: sqlite3.Connection, key: str) -> Optional[Any]:
+        row = conn.execute(
+            "SELECT value, expires_at FROM kv WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def _set(self, conn: sqlite3.Connection, key: str, value: Any, ttl) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires_at),
+        )
+
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+
+    def _incr(self, conn: sqlite3.Connection, key: str, amount: int, ttl) -> int:
+        def update():
+            row = conn.execute(
+                "SELECT value, expires_at FROM kv WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                value, expires_at = amount, time.time() + ttl if ttl else None
+            else:
+                value, expires_at = json.loads(row[0]) + amount, row[1]
+
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            return value
+
+        return self._transaction(conn, update)
+
+    def _acquire_lock(self, conn: sqlite3.Connection, key: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+
+        def acquire():
+            now = time.time()
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(token), now + ttl),
+            )
+            return token if cursor.rowcount == 1 else None
+
+        return self._transaction(conn, acquire)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._run(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._run(lambda conn: conn.execute("DELETE FROM kv WHERE key = ?", (key,)))
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        return await self._run(self._incr, key, amount, ttl)
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        return await self._run(self._acquire_lock, key, ttl)
+
+    async def release_lock(self, key: str, token: str) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "DELETE FROM kv WHERE key = ? AND value = ?", (key, json.dumps(token))
+            )
+        )
+
+
+class RedisStateStore(StateStore):
+    """Store backed by any server speaking the Redis protocol
+
+    Pass ``client`` to swap in a local stand-in (e.g. ``fakeredis.aioredis.FakeRedis``)
+    instead of connecting to ``url``.
+    """
+
+    RELEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, url: Optional[str] = None, client: Any = None):
+        super().__init__()
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise RuntimeError(
+                    "STATE_BACKEND=redis requires the 'redis' package (pip install redis)"
+                ) from e
+            client = redis.from_url(url)
+        self.client = client
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self.client.set(key, json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(key)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = await self.client.incrby(key, amount)
+        if value == amount and ttl:
+            await self.client.pexpire(key, int(ttl * 1000))
+        return value
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if await self.client.set(key, token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    async def release_lock(self, key: str, token: str) -> None:
+        # Compare and delete in one step on the server
+        await self.client.eval(self.RELEASE_SCRIPT, 1, key, token)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_state_store() -> StateStore:
+    """Build the store selected by settings.STATE_BACKEND"""
+    backend = settings.STATE_BACKEND.lower()
+    if backend == "sqlite":
+        return SQLiteStateStore(settings.STATE_DB_PATH)
+    if backend == "redis":
+        return RedisStateStore(settings.REDIS_URL)
+    return MemoryStateStore()
+
+
+# Create global instance
+state_store = create_state_store()
@@ -0,0 +1,214 @@
+import hashlib
+import hmac
+import math
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+from config.settings import settings
+from services.state_store import state_store
+from utils.metrics import metrics
+
+# Cheapest last: each mode also applies the savings of the ones before it
+BUDGET_MODES = ("full", "reduced_image", "no_audio", "cache_only")
+
+
+@dataclass
+class UsageRecord:
+    """Upstream usage attributed to a single request"""
+
+    client_id: str = "anonymous"
+    mode: str = "full"
+    input_tokens: int = 0  # Everything sent to Gemini, images included
+    image_tokens: int = 0
+    cached_tokens: int = 0  # Input tokens served from Gemini's prefix cache
+    output_tokens: int = 0
+    tts_characters: int = 0
+    gemini_calls: int = 0
+    tts_calls: int = 0
+    image_max_side: Optional[int] = None
+    gemini_cost: float = 0.0  # USD, priced per model tier as calls are recorded
+
+    @property
+    def cost(self) -> float:
+        """Estimated cost of this request in USD"""
+        return (
+            self.gemini_cost
+            + self.tts_characters * settings.ELEVENLABS_COST_PER_1K_CHARS / 1000
+        )
+
+    def summary(self) -> dict:
+        """What the client is told it used, in a header or the last streamed event"""
+        return {
+            "input_tokens": self.input_tokens,
+            "image_tokens": self.image_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "tts_chars": self.tts_characters,
+            "cost_usd": round(self.cost, 6),
+            "mode": self.mode,
+        }
+
+    def header_value(self) -> str:
+        """Compact form for the X-Usage response header"""
+        summary = self.summary()
+        summary["cost_usd"] = f"{self.cost:.6f}"
+        return ", ".join(f"{name}={value}" for name, value in summary.items())
+
+
+def sign_client_id(client_id: str) -> str:
+    """X-Client-ID value a trusted front end hands out for client_id"""
+    signature = hmac.new(
+        settings.CLIENT_ID_SECRET.encode(), client_id.encode(), hashlib.sha256
+    ).hexdigest()
+    return f"{client_id}.{signature}"
+
+
+def client_id_for(header: Optional[str], host: Optional[str]) -> str:
+    """Who a request is budgeted as: a signed X-Client-ID, else the client's IP
+
+    An unsigned header would let anyone start a fresh budget by changing it.
+    """
+    if header and settings.CLIENT_ID_SECRET:
+        client_id, _, signature = header.rpartition(".")
+        if client_id and hmac.compare_digest(sign_client_id(client_id), header):
+            return client_id
+        metrics.incr("usage.unsigned_client_id")
+    return host or "anonymous"
+
+
+current_usage: ContextVar[Optional[UsageRecord]] = ContextVar(
+    "current_usage", default=None
+)
+
+
+def estimate_image_tokens(size: Tuple[int, int]) -> int:
+    """Gemini bills 258 tokens per image up to 384px, else per 768px tile"""
+    width, height = size
+    if width <= 384 and height <= 384:
+        return 258
+    return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+
+def gemini_cost(input_tokens: int, output_tokens: int, tier: str = "strong") -> float:
+    """USD cost of one Gemini call on a model tier"""
+    if tier == "fast":
+        input_rate = settings.GEMINI_FAST_INPUT_COST_PER_MTOK
+        output_rate = settings.GEMINI_FAST_OUTPUT_COST_PER_MTOK
+    else:
+        input_rate = settings.GEMINI_INPUT_COST_PER_MTOK
+        output_rate = settings.GEMINI_OUTPUT_COST_PER_MTOK
+    return (input_tokens * input_rate + output_tokens * output_rate) / 1_000_000
+
+
+def record_gemini_usage(
+    response, image_sizes: Iterable[Tuple[int, int]] = (), tier: str = "strong"
+) -> None:
+    """Attribute a Gemini response's token usage to the current request"""
+    usage = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+
+    # Prefer the per-modality breakdown when the API returns one
+    image_tokens = sum(
+        getattr(detail, "token_count", 0)
+        for detail in getattr(usage, "prompt_tokens_details", None) or []
+        if "IMAGE" in str(getattr(detail, "modality", "")).upper()
+    )
+    if not image_tokens:
+        image_tokens = sum(estimate_image_tokens(size) for size in image_sizes)
+
+    metrics.incr("usage.gemini.calls")
+    metrics.incr("usage.gemini.input_tokens", input_tokens)
+    metrics.incr("usage.gemini.image_tokens", image_tokens)
+    metrics.incr("usage.gemini.cached_tokens", cached_tokens)
+    metrics.incr("usage.gemini.output_tokens", output_tokens)
+    metrics.incr(f"usage.gemini.{tier}.calls")
+
+    record = current_usage.get()
+    if record is not None:
+        record.gemini_calls += 1
+        record.input_tokens += input_tokens
+        record.image_tokens += image_tokens
+        record.cached_tokens += cached_tokens
+        record.output_tokens += output_tokens
+        record.gemini_cost += gemini_cost(input_tokens, output_tokens, tier)
+
+
+def record_tts_usage(text: str) -> None:
+    """Attribute synthesized characters to the current request"""
+    metrics.incr("usage.elevenlabs.calls")
+    metrics.incr("usage.elevenlabs.characters", len(text))
+
+    record = current_usage.get()
+    if record is not None:
+        record.tts_calls += 1
+        record.tts_characters += len(text)
+
+
+class UsageTracker:
+    """Daily spend per client and overall, shared by all workers through the state store"""
+
+    def _budget_key(self, scope: str) -> str:
+        return f"budget:{scope}:{time.strftime('%Y%m%d', time.gmtime())}"
+
+    async def spent(self, scope: str) -> float:
+        micro_usd = await state_store.get(self._budget_key(scope))
+        return (micro_usd or 0) / 1_000_000
+
+    def _mode_for(self, spent: float, budget: float) -> str:
+        if budget <= 0:
+            return "full"
+
+        fraction = spent / budget
+        if fraction >= 1.0:
+            return "cache_only"
+        if fraction >= settings.BUDGET_NO_AUDIO_AT:
+            return "no_audio"
+        if fraction >= settings.BUDGET_REDUCED_IMAGE_AT:
+            return "reduced_image"
+        return "full"
+
+    async def mode_for(self, client_id: str) -> str:
+        """Cheapest mode demanded by either the client's or the global budget"""
+        client_mode = self._mode_for(
+            await self.spent(f"client:{client_id}"), settings.CLIENT_DAILY_BUDGET
+        )
+        global_mode = self._mode_for(
+            await self.spent("global"), settings.GLOBAL_DAILY_BUDGET
+        )
+        return max(client_mode, global_mode, key=BUDGET_MODES.index)
+
+    async def current_mode(self) -> str:
+        """Budget mode for the request being handled (full outside a request)"""
+        record = current_usage.get()
+        if record is None:
+            return "full"
+
+        record.mode = await self.mode_for(record.client_id)
+        return record.mode
+
+    async def finish(self, record: UsageRecord) -> None:
+        """Charge a finished request against the budgets and export its usage"""
+        cost = record.cost
+        metrics.observe("usage.cost_usd", cost)
+        if record.image_max_side:
+            metrics.observe(
+                f"usage.input_tokens.max_side_{record.image_max_side}",
+                record.input_tokens,
+            )
+
+        micro_usd = int(round(cost * 1_000_000))
+        if micro_usd <= 0:
+            return
+
+        ttl = 2 * 24 * 60 * 60
+        await state_store.incr(
+            self._budget_key(f"client:{record.client_id}"), micro_usd, ttl=ttl
+        )
+        await state_store.incr(self._budget_key("global"), micro_usd, ttl=ttl)
+
+
+# Create global instance
+usage_tracker = UsageTracker()
@@ -0,0 +1,236 @@
+import os
+import struct
+from typing import List, Optional, Tuple
+
+# Enough of a file to reach the first MP3 frame and its Xing/VBRI header
+HEAD_BYTES = 8 * 1024
+# Ogg pages are at most ~64 KB, so the last page header is always in the tail
+OGG_TAIL_BYTES = 64 * 1024 + 512
+
+_MPEG1, _MPEG2, _MPEG25 = 3, 2, 0  # Version bits of the frame header
+_BITRATES_KBPS = {
+    (_MPEG1, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (_MPEG1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (_MPEG1, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (_MPEG2, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (_MPEG2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (_MPEG2, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {
+    _MPEG1: (44100, 48000, 32000),
+    _MPEG2: (22050, 24000, 16000),
+    _MPEG25: (11025, 12000, 8000),
+}
+
+
+class FrameHeader:
+    """The fields of a 4-byte MPEG audio frame header that timing depends on"""
+
+    __slots__ = ("version", "layer", "bitrate", "sample_rate", "length", "samples", "mono")
+
+    def __init__(self, version, layer, bitrate, sample_rate, length, samples, mono):
+        self.version = version
+        self.layer = layer
+        self.bitrate = bitrate  # bits per second
+        self.sample_rate = sample_rate
+        self.length = length  # bytes, including the header
+        self.samples = samples
+        self.mono = mono
+
+    @property
+    def xing_offset(self) -> int:
+        """Where a Xing/Info header would start, after the side information"""
+        if self.version == _MPEG1:
+            return 4 + (17 if self.mono else 32)
+        return 4 + (9 if self.mono else 17)
+
+
+def parse_frame_header(data: bytes, offset: int) -> Optional[FrameHeader]:
+    """The frame header at offset, or None if there is no valid one there"""
+    if offset + 4 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    version = (b1 >> 3) & 0x3
+    layer = (b1 >> 1) & 0x3  # 3 = Layer I, 2 = Layer II, 1 = Layer III
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x3
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None  # Reserved values, or free format (which has no fixed length)
+
+    bitrate = _BITRATES_KBPS[(_MPEG1 if version == _MPEG1 else _MPEG2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x1
+    if layer == 3:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if layer == 2 or version == _MPEG1 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return FrameHeader(version, layer, bitrate, sample_rate, length, samples, b3 >> 6 == 3)
+
+
+def _skip_id3(data: bytes) -> int:
+    """Length of a leading ID3v2 tag (syncsafe size plus the 10-byte header)"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | data[9] & 0x7F
+    return 10 + size + (10 if data[5] & 0x10 else 0)  # Footer flag
+
+
+def _first_frame(data: bytes, offset: int) -> Tuple[int, Optional[FrameHeader]]:
+    """The first offset from which two consecutive valid frames follow"""
+    while True:
+        offset = data.find(b"\xff", offset)
+        if offset < 0:
+            return -1, None
+        header = parse_frame_header(data, offset)
+        if header:
+            following = offset + header.length
+            # A lone match may be sync bits inside other data; a next frame (or the end) confirms it
+            if following >= len(data) or parse_frame_header(data, following):
+                return offset, header
+        offset += 1
+
+
+def _vbr_frame_count(data: bytes, offset: int, header: FrameHeader) -> Optional[int]:
+    """Frame count from a Xing/Info or VBRI header in the first frame, if it has one"""
+    xing = offset + header.xing_offset
+    if data[xing: xing + 4] in (b"Xing", b"Info") and len(data) >= xing + 12:
+        flags = struct.unpack(">I", data[xing + 4: xing + 8])[0]
+        if flags & 0x1:
+            return struct.unpack(">I", data[xing + 8: xing + 12])[0]
+    vbri = offset + 36
+    if data[vbri: vbri + 4] == b"VBRI" and len(data) >= vbri + 18:
+        return struct.unpack(">I", data[vbri + 14: vbri + 18])[0]
+    return None
+
+
+def _is_info_frame(data: bytes, offset: int, header: FrameHeader) -> bool:
+    """Whether the first frame is a silent Xing/Info/VBRI header frame"""
+    xing = offset + header.xing_offset
+    return data[xing: xing + 4] in (b"Xing", b"Info") or data[offset + 36: offset + 40] == b"VBRI"
+
+
+def mp3_audio_frames(data: bytes) -> bytes:
+    """The audio frames of an MP3, without ID3 tags or the Xing/VBRI frame
+
+    That frame describes only its own file (frame count, seek table), so it
+    has to go before files are joined.
+    """
+    offset, header = _first_frame(data, _skip_id3(data))
+    if header is None:
+        raise ValueError("No MP3 frames found")
+    if _is_info_frame(data, offset, header):
+        offset += header.length
+    end = offset
+    header = parse_frame_header(data, end)
+    while header is not None and end + header.length <= len(data):
+        end += header.length
+        header = parse_frame_header(data, end)
+    return data[offset:end]
+
+
+def join_mp3(parts: List[bytes]) -> bytes:
+    """Play MP3 files of the same format back to back, as one file
+
+    Frames are self-contained, so this is a plain concatenation of the audio
+    frames; each part starts with an empty bit reservoir, as encoders write it.
+    """
+    return b"".join(mp3_audio_frames(part) for part in parts)
+
+
+def mp3_duration(data: bytes) -> Optional[float]:
+    """Exact duration of an MP3 held in memory, from frame headers alone
+
+    Uses the Xing/VBRI frame count when the encoder wrote one, otherwise walks
+    the frame headers (a few thousand per minute of audio), so it is right for
+    both constant and variable bitrate files. None if no frames are found.
+    """
+    offset, header = _first_frame(data, _skip_id3(data))
+    if header is None:
+        return None
+    frames = _vbr_frame_count(data, offset, header)
+    if frames is not None:
+        return frames * header.samples / header.sample_rate
+
+    sample_rate = header.sample_rate
+    samples = 0
+    while header is not None:
+        samples += header.samples
+        offset += header.length
+        header = parse_frame_header(data, offset)
+    return samples / sample_rate
+
+
+def mp3_file_duration(path: str) -> Optional[float]:
+    """Duration of an MP3 on disk from its first few KB and its size
+
+    Exact for files with a Xing/VBRI header; otherwise the bitrate of the
+    first frame is taken as constant, which holds for the CBR audio that
+    ElevenLabs returns.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = _skip_id3(f.read(10))
+        f.seek(start)
+        head = f.read(HEAD_BYTES)
+        f.seek(max(size - 128, 0))
+        has_id3v1 = f.read(3) == b"TAG"
+
+    offset, header = _first_frame(head, 0)
+    if header is None:
+        return None
+    frames = _vbr_frame_count(head, offset, header)
+    if frames is not None:
+        return frames * header.samples / header.sample_rate
+    # Encoders pad some frames so the average length matches the bitrate exactly
+    average_frame = header.samples / 8 * header.bitrate / header.sample_rate
+    audio_bytes = size - start - offset - (128 if has_id3v1 else 0)
+    return round(audio_bytes / average_frame) * header.samples / header.sample_rate
+
+
+def _opus_pre_skip(head: bytes) -> Optional[int]:
+    """Samples the decoder drops at the start, from the OpusHead packet"""
+    at = head.find(b"OpusHead")
+    if at < 0 or len(head) < at + 12:
+        return None
+    return struct.unpack("<H", head[at + 10: at + 12])[0]
+
+
+def _last_granule(tail: bytes) -> Optional[int]:
+    """Granule position (48 kHz samples) of the last Ogg page"""
+    at = tail.rfind(b"OggS")
+    while at >= 0:
+        if len(tail) >= at + 14 and tail[at + 4] == 0:  # Stream structure version
+            granule = struct.unpack("<q", tail[at + 6: at + 14])[0]
+            if granule >= 0:
+                return granule
+        at = tail.rfind(b"OggS", 0, at)
+    return None
+
+
+def _opus_duration(head: bytes, tail: bytes) -> Optional[float]:
+    pre_skip, granule = _opus_pre_skip(head), _last_granule(tail)
+    if pre_skip is None or granule is None:
+        return None
+    return max(granule - pre_skip, 0) / 48000
+
+
+def audio_duration(data: bytes, extension: str) -> Optional[float]:
+    """Duration in seconds of generated audio held in memory, None if unknown"""
+    if extension == ".opus":
+        return _opus_duration(data[:HEAD_BYTES], data[-OGG_TAIL_BYTES:])
+    return mp3_duration(data)
+
+
+def audio_file_duration(path: str) -> Optional[float]:
+    """Duration in seconds of an audio file, reading only its head and tail"""
+    try:
+        if os.path.splitext(path)[1].lower() != ".opus":
+            return mp3_file_duration(path)
+        with open(path, "rb") as f:
+            head = f.read(HEAD_BYTES)
+            f.seek(max(os.path.getsize(path) - OGG_TAIL_BYTES, 0))
+            return _opus_duration(head, f.read())
+    except OSError:
+        return None
@@ -0,0 +1,250 @@
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+# Detection runs on a copy whose longest side is about this many pixels
+DETECTION_SIDE = 192
+
+# A candidate region must look like a card to be cropped to
+MIN_AREA_RATIO = 0.05  # Smaller regions are more likely logos or photos on the card
+MAX_AREA_RATIO = 0.90  # Larger regions mean the card already fills the frame
+MIN_FILL_RATIO = 0.85  # Region pixels / quadrilateral area (rectangular, not ragged)
+ASPECT_RANGE = (1.2, 2.3)  # Long side / short side (a standard card is ~1.75)
+CROP_PADDING = 0.015  # Grow the quadrilateral so the card edge is not clipped
+MAX_PLAIN_SKEW = 0.005  # Corner misalignment (share of the side) cropped without warping
+
+
+@dataclass
+class CardRegion:
+    """A card found in a photo, in full-resolution pixel coordinates"""
+
+    # Corners as (x, y): top-left, top-right, bottom-right, bottom-left
+    corners: List[Tuple[float, float]]
+    area_ratio: float  # Share of the frame covered by the card
+    fill_ratio: float  # How completely the detected pixels fill the quadrilateral
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Output size of the deskewed crop (longest opposite edges)"""
+        tl, tr, br, bl = (np.array(corner) for corner in self.corners)
+        width = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))
+        height = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))
+        return max(1, int(round(width))), max(1, int(round(height)))
+
+
+def _downscale(image: Image.Image) -> Tuple[np.ndarray, float]:
+    """Float RGB array for detection and the factor mapping it back to full size"""
+    small = image if image.mode == "RGB" else image.convert("RGB")
+    factor = max(small.size) // DETECTION_SIDE
+    if factor > 1:
+        small = small.reduce(factor)
+    return np.asarray(small, dtype=np.float32) / 255.0, image.size[0] / small.size[0]
+
+
+def _box_count(mask: np.ndarray) -> np.ndarray:
+    """Number of set pixels in each 3x3 neighbourhood"""
+    padded = np.pad(mask.astype(np.uint8), 1)
+    height, width = mask.shape
+    return sum(
+        padded[dy : dy + height, dx : dx + width] for dy in range(3) for dx in range(3)
+    )
+
+
+def _foreground_mask(rgb: np.ndarray) -> np.ndarray:
+    """Pixels that differ from the surroundings in color or sit on a strong edge"""
+    # The border of a phone photo is desk: its median color is the background
+    border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+    background = np.median(border, axis=0)
+    distance = np.linalg.norm(rgb - background, axis=-1)
+
+    # Textured desks need a higher threshold than plain ones
+    border_distance = np.linalg.norm(border - background, axis=-1)
+    threshold = max(0.12, float(np.percentile(border_distance, 95)) * 1.5)
+    mask = distance > threshold
+
+    # Strong edges outline cards that are close to the desk color
+    gray = rgb.mean(axis=-1)
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    gy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    mask |= np.hypot(gx, gy) > max(0.25, threshold)
+
+    # 3x3 majority vote drops speckle and closes one-pixel gaps
+    return _box_count(mask) >= 5
+
+
+def label_components(mask: np.ndarray) -> np.ndarray:
+    """4-connected component labels (-1 for background), fully vectorized
+
+    Every pixel starts labelled with its own index; labels then spread to
+    neighbours by max and jump along label chains until nothing changes.
+    """
+    height, width = mask.shape
+    labels = np.where(mask, np.arange(height * width).reshape(height, width), -1)
+
+    while True:
+        spread = labels.copy()
+        np.maximum(spread[1:], labels[:-1], out=spread[1:])
+        np.maximum(spread[:-1], labels[1:], out=spread[:-1])
+        np.maximum(spread[:, 1:], labels[:, :-1], out=spread[:, 1:])
+        np.maximum(spread[:, :-1], labels[:, 1:], out=spread[:, :-1])
+        spread[~mask] = -1
+
+        # Pointer jumping: a label is a pixel index whose own label is at least as large
+        flat = spread.ravel()
+        inside = flat >= 0
+        flat[inside] = flat[flat[inside]]
+
+        if np.array_equal(spread, labels):
+            return labels
+        labels = spread
+
+
+def _fill_spans(component: np.ndarray) -> np.ndarray:
+    """Fill holes (text, logos) by spanning each row and column of a convex region"""
+    rows = np.arange(component.shape[1])
+    cols = np.arange(component.shape[0])
+
+    has_row = component.any(axis=1)
+    first = np.argmax(component, axis=1)
+    last = component.shape[1] - 1 - np.argmax(component[:, ::-1], axis=1)
+    row_fill = has_row[:, None] & (rows >= first[:, None]) & (rows <= last[:, None])
+
+    has_col = component.any(axis=0)
+    top = np.argmax(component, axis=0)
+    bottom = component.shape[0] - 1 - np.argmax(component[::-1], axis=0)
+    col_fill = has_col[None, :] & (cols[:, None] >= top) & (cols[:, None] <= bottom)
+
+    return row_fill & col_fill
+
+
+def _quad_area(corners: np.ndarray) -> float:
+    """Shoelace area of a polygon given as an (n, 2) array"""
+    x, y = corners[:, 0], corners[:, 1]
+    return float(abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2)
+
+
+def _region_from_component(
+    component: np.ndarray, scale: float, frame_area: float
+) -> Optional[CardRegion]:
+    solid = _fill_spans(component)
+    ys, xs = np.nonzero(solid)
+
+    # Extreme points along the diagonals are the corners of a convex quadrilateral
+    total, diff = xs + ys, xs - ys
+    corners = np.array(
+        [
+            (xs[np.argmin(total)], ys[np.argmin(total)]),  # top-left
+            (xs[np.argmax(diff)], ys[np.argmax(diff)]),  # top-right
+            (xs[np.argmax(total)], ys[np.argmax(total)]),  # bottom-right
+            (xs[np.argmin(diff)], ys[np.argmin(diff)]),  # bottom-left
+        ],
+        dtype=np.float64,
+    ) + 0.5  # Pixel centers to pixel edges
+
+    quad_area = _quad_area(corners)
+    if quad_area <= 0:
+        return None
+
+    area_ratio = quad_area / frame_area
+    fill_ratio = min(1.0, solid.sum() / quad_area)
+    edges = np.linalg.norm(corners - np.roll(corners, -1, axis=0), axis=1)
+    long_side = max(edges[0], edges[2])
+    short_side = max(min(edges[1], edges[3]), 1e-6)
+    aspect = max(long_side, short_side) / min(long_side, short_side)
+
+    if not MIN_AREA_RATIO <= area_ratio <= MAX_AREA_RATIO:
+        return None
+    if fill_ratio < MIN_FILL_RATIO:
+        return None
+    if not ASPECT_RANGE[0] <= aspect <= ASPECT_RANGE[1]:
+        return None
+
+    # Grow slightly about the center, then map back to full resolution
+    center = corners.mean(axis=0)
+    corners = (center + (corners - center) * (1 + 2 * CROP_PADDING)) * scale
+    return CardRegion(
+        corners=[(float(x), float(y)) for x, y in corners],
+        area_ratio=round(area_ratio, 4),
+        fill_ratio=round(float(fill_ratio), 4),
+    )
+
+
+def detect_card_regions(image: Image.Image, max_regions: int = 1) -> List[CardRegion]:
+    """Find up to max_regions card-shaped regions, largest first
+
+    Returns an empty list when the card already fills the frame or nothing
+    card-shaped stands out from the background.
+    """
+    rgb, scale = _downscale(image)
+    mask = _foreground_mask(rgb)
+    if not mask.any():
+        return []
+
+    labels = label_components(mask)
+    ids, sizes = np.unique(labels[labels >= 0], return_counts=True)
+    frame_area = float(mask.size)
+
+    regions = []
+    for label in ids[np.argsort(sizes)[::-1]]:
+        if sizes[ids == label][0] < MIN_AREA_RATIO * MIN_FILL_RATIO * frame_area:
+            break  # Sorted by size, so nothing smaller can qualify
+        region = _region_from_component(labels == label, scale, frame_area)
+        if region is not None:
+            regions.append(region)
+            if len(regions) >= max_regions:
+                break
+    return regions
+
+
+def crop_to_region(image: Image.Image, region: CardRegion) -> Image.Image:
+    """Crop and deskew the region to an upright rectangle"""
+    tl, tr, br, bl = region.corners
+    width, height = region.size
+
+    # Straight cards only need a crop, which is far cheaper than a perspective warp
+    skew = max(
+        max(abs(tl[1] - tr[1]), abs(bl[1] - br[1])) / width,  # Slope of top/bottom
+        max(abs(tl[0] - bl[0]), abs(tr[0] - br[0])) / height,  # Slope of left/right
+    )
+    if skew <= MAX_PLAIN_SKEW:
+        left, top = max(0, min(tl[0], bl[0])), max(0, min(tl[1], tr[1]))
+        right = min(image.width, max(tr[0], br[0]))
+        bottom = min(image.height, max(bl[1], br[1]))
+        return image.crop(tuple(int(round(v)) for v in (left, top, right, bottom)))
+
+    return image.transform(
+        (width, height),
+        Image.Transform.QUAD,
+        # PIL wants upper-left, lower-left, lower-right, upper-right
+        data=(*tl, *bl, *br, *tr),
+        resample=Image.Resampling.BILINEAR,
+    )
+
+
+def reading_order(regions: List[CardRegion]) -> List[CardRegion]:
+    """Sort regions row by row, left to right, as someone would number a spread"""
+    centers = [np.mean(region.corners, axis=0) for region in regions]
+    row_height = float(np.median([region.size[1] for region in regions]))
+    order = sorted(
+        range(len(regions)),
+        key=lambda i: (int(centers[i][1] // row_height), centers[i][0]),
+    )
+    return [regions[i] for i in order]
+
+
+def crop_to_cards(
+    image: Image.Image, max_cards: int = 1
+) -> Tuple[List[Image.Image], List[CardRegion]]:
+    """Crop a photo to each business card in it, in reading order
+
+    Returns the unchanged image (and no regions) when no card is detected.
+    """
+    regions = detect_card_regions(image, max_regions=max_cards)
+    if not regions:
+        return [image], []
+
+    regions = reading_order(regions)
+    return [crop_to_region(image, region) for region in regions], regions
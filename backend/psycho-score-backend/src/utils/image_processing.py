@@ -1,8 +1,63 @@
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image, ImageFilter
 from fastapi import UploadFile, HTTPException
 import io
 import os
+import base64
+import hashlib
+import shutil
+import numpy as np
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
 from config.settings import settings
+from utils.card_detection import CardRegion, crop_to_cards
+
+# Uploads are handled as the (disk-spooled) file Starlette already wrote them to
+ImageSource = Union[bytes, BinaryIO]
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# ITU-R BT.601 luma weights
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Orthonormal DCT-II basis for the 32x32 perceptual hash
+_DCT_SIZE = 32
+_DCT_BASIS = np.sqrt(2 / _DCT_SIZE) * np.cos(
+    np.pi
+    * np.arange(_DCT_SIZE)[:, None]
+    * (2 * np.arange(_DCT_SIZE)[None, :] + 1)
+    / (2 * _DCT_SIZE)
+).astype(np.float32)
+_DCT_BASIS[0] /= np.sqrt(2)
+
+# Luma difference from the card's background above which a pixel counts as ink
+INK_CONTRAST = 48
+
+# Square at the image center whose noise is estimated, at full resolution
+NOISE_SAMPLE_SIDE = 512
+
+
+@dataclass
+class ImageQuality:
+    """Cheap signals deciding whether a card is enhanced before analysis"""
+
+    low: float  # 1st percentile of luma, 0-1
+    high: float  # 99th percentile of luma
+    noise: float  # Estimated standard deviation of luma noise
+
+    @property
+    def dynamic_range(self) -> float:
+        return self.high - self.low
+
+    @property
+    def low_contrast(self) -> bool:
+        return self.dynamic_range < settings.ENHANCE_MIN_DYNAMIC_RANGE
+
+    @property
+    def noisy(self) -> bool:
+        return self.noise > settings.ENHANCE_NOISE_LEVEL
+
+    @property
+    def needs_enhancement(self) -> bool:
+        return self.low_contrast or self.noisy
 
 
 class ImageProcessor:
@@ -26,21 +81,84 @@ class ImageProcessor:
         return True
 
     @staticmethod
-    def enhance_image_for_analysis(image: Image.Image) -> Image.Image:
-        """Enhance image quality for better OCR and analysis"""
-        # Convert to RGB if necessary
+    def prepare_for_analysis(
+        source: ImageSource, max_size: tuple = (2048, 2048)
+    ) -> Image.Image:
+        """Decode uploaded bytes or an upload file into an RGB image no larger than max_size"""
+        try:
+            if isinstance(source, bytes):
+                source = io.BytesIO(source)
+            else:
+                source.seek(0)
+            pil_image = Image.open(source)
+
+            # Let JPEG decode at reduced scale instead of decoding then shrinking
+            pil_image.draft("RGB", max_size)
+            pil_image.load()  # Decode now, while the upload file is still open
+
+            # Convert to RGB if necessary
+            if pil_image.mode != "RGB":
+                pil_image = pil_image.convert("RGB")
+
+            # Resize if too large (max 4MB for Gemini)
+            pil_image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+            return pil_image
+        except Exception as e:
+            raise HTTPException(
+                status_code=400, detail=f"Error processing image: {str(e)}"
+            )
+
+    @staticmethod
+    def prepare_cards(
+        source: ImageSource, max_size: tuple = (2048, 2048), max_cards: int = 1
+    ) -> Tuple[List[Image.Image], List[CardRegion]]:
+        """Decode an upload and crop it to each business card detected in it
+
+        Always returns at least one image: the whole frame if no card is found.
+        """
+        pil_image = ImageProcessor.prepare_for_analysis(source, max_size)
+        if not settings.CARD_CROP_ENABLED:
+            return [pil_image], []
+        return crop_to_cards(pil_image, max_cards)
+
+    @staticmethod
+    def assess_image_quality(image: Image.Image) -> ImageQuality:
+        """Luma histogram and noise estimate, a few ms at any size"""
+        gray = to_feature_array(image) @ LUMA_WEIGHTS
+        low, high = np.percentile(gray, [1, 99])
+        return ImageQuality(low=float(low), high=float(high), noise=estimate_noise(image))
+
+    @staticmethod
+    def enhance_image_for_analysis(
+        image: Image.Image, quality: Optional[ImageQuality] = None
+    ) -> Image.Image:
+        """Denoise and stretch contrast for better OCR and analysis, only if needed
+
+        A clean, well-exposed card is returned as is. Otherwise noise is
+        averaged away by a 2x box reduction (which also quarters the pixels
+        everything later touches) and contrast is stretched with a single
+        lookup table, instead of full-size contrast, sharpness and median passes.
+        """
+        quality = quality or ImageProcessor.assess_image_quality(image)
+        if not quality.needs_enhancement:
+            return image
         if image.mode != "RGB":
             image = image.convert("RGB")
 
-        # Enhance contrast and sharpness for better text recognition
-        enhancer = ImageEnhance.Contrast(image)
-        image = enhancer.enhance(1.2)
+        if quality.noisy:
+            if min(image.size) >= 2 * settings.ENHANCE_MIN_SIDE:
+                image = image.reduce(2)
+            else:
+                image = image.filter(ImageFilter.BoxBlur(1))
 
-        enhancer = ImageEnhance.Sharpness(image)
-        image = enhancer.enhance(1.1)
-
-        # Apply slight denoising
-        image = image.filter(ImageFilter.MedianFilter(size=3))
+        if quality.low_contrast:
+            # Map the 1st-99th percentile of luma towards the full range, capped in gain
+            gain = min(1 / max(quality.dynamic_range, 1e-3), settings.ENHANCE_MAX_GAIN)
+            middle = (quality.low + quality.high) / 2
+            levels = np.arange(256, dtype=np.float32) / 255
+            table = np.clip((levels - middle) * gain + 0.5, 0, 1) * 255
+            image = image.point(np.round(table).astype(np.uint8).tolist() * 3)
 
         return image
 
@@ -56,9 +174,10 @@ class ImageProcessor:
         file_path = os.path.join(settings.IMAGE_UPLOAD_PATH, filename)
 
         try:
-            content = await file.read()
+            # Copy in chunks rather than reading the whole upload into memory
+            file.file.seek(0)
             with open(file_path, "wb") as f:
-                f.write(content)
+                shutil.copyfileobj(file.file, f)
 
             # Reset file pointer for further processing
             file.file.seek(0)
@@ -79,6 +198,64 @@ def convert_image_to_bytes(image: Image.Image, format: str = "PNG") -> bytes:
     return img_byte_arr.getvalue()
 
 
+def compute_image_hash(source: ImageSource) -> str:
+    """Content hash used as the cache key for an uploaded image"""
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upload_size(file: BinaryIO) -> int:
+    """Size of an upload file without reading it"""
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    return size
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit DCT perceptual hash: survives rescaling, recompression and re-photographing"""
+    small = image.resize((_DCT_SIZE, _DCT_SIZE), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    pixels = np.asarray(small.convert("L"), dtype=np.float32)
+
+    # Keep the lowest 8x8 frequencies and compare each against their median
+    low = (_DCT_BASIS @ pixels @ _DCT_BASIS.T)[:8, :8].ravel()
+    bits = low > np.median(low[1:])  # The DC term would skew the median
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def content_hash(image: Image.Image) -> int:
+    """Perceptual hash of just the card's inked region (its text and marks)
+
+    Plain cards with the same layout share a perceptual hash whatever their
+    names say; cropped to the ink, the text fills the frame and tells them apart.
+    """
+    small = image.convert("L")
+    small.thumbnail((256, 256))
+    pixels = np.asarray(small, dtype=np.float32)
+    ink = np.abs(pixels - np.median(pixels)) > INK_CONTRAST
+
+    # Rows and columns with a single inked pixel are compression specks
+    rows = np.nonzero(ink.sum(axis=1) >= 2)[0]
+    columns = np.nonzero(ink.sum(axis=0) >= 2)[0]
+    if len(rows) and len(columns):
+        small = small.crop((columns[0], rows[0], columns[-1] + 1, rows[-1] + 1))
+    return perceptual_hash(small)
+
+
+def encode_data_url(image: Image.Image, format: str = "JPEG", quality: int = 85) -> str:
+    """Encode an image as a data URL for returning to the frontend"""
+    image_bytes = io.BytesIO()
+    image.save(image_bytes, format=format, quality=quality)
+    encoded = base64.b64encode(image_bytes.getbuffer()).decode()
+    return f"data:image/{format.lower()};base64,{encoded}"
+
+
 def preprocess_image(image_bytes: bytes) -> Image.Image:
     image = Image.open(io.BytesIO(image_bytes))
     # Example preprocessing: convert to RGB and resize
@@ -91,5 +268,138 @@ def save_image(image: Image.Image, path: str) -> None:
     image.save(path)
 
 
+def to_feature_array(image: Image.Image, max_side: int = 256) -> np.ndarray:
+    """Downscaled float RGB array in [0, 1] for cheap vectorized analysis"""
+    small = image if image.mode == "RGB" else image.convert("RGB")
+
+    # Integer box reduction is much cheaper than a resampling resize
+    factor = max(small.size) // max_side
+    if factor > 1:
+        small = small.reduce(factor)
+    return np.asarray(small, dtype=np.float32) / 255.0
+
+
+def estimate_noise(image: Image.Image, side: int = NOISE_SAMPLE_SIDE) -> float:
+    """Standard deviation of luma noise, from a full-resolution crop of the center
+
+    Immerkaer's Laplacian-difference estimator, with the median instead of the
+    mean so that the edges of text and logos do not count as noise.
+    """
+    width, height = image.size
+    left, top = max((width - side) // 2, 0), max((height - side) // 2, 0)
+    crop = image.crop((left, top, min(left + side, width), min(top + side, height)))
+    gray = to_feature_array(crop, max_side=side) @ LUMA_WEIGHTS
+    if min(gray.shape) < 3:
+        return 0.0
+    laplacian = (
+        gray[:-2, :-2] - 2 * gray[:-2, 1:-1] + gray[:-2, 2:]
+        - 2 * gray[1:-1, :-2] + 4 * gray[1:-1, 1:-1] - 2 * gray[1:-1, 2:]
+        + gray[2:, :-2] - 2 * gray[2:, 1:-1] + gray[2:, 2:]
+    )
+    # The kernel scales noise by 6; 1.4826 * median(|x|) estimates sigma
+    return 1.4826 * float(np.median(np.abs(laplacian))) / 6
+
+
+def extract_design_features(image: Image.Image) -> Dict[str, float]:
+    """Color, contrast, whitespace, edge density and symmetry signals (a few ms)"""
+    rgb = to_feature_array(image)
+    gray = rgb @ LUMA_WEIGHTS
+    height, width = gray.shape
+
+    # Palette: 3 bits per channel, count colors needed to cover 90% of pixels
+    quantized = (rgb * 7.999).astype(np.int32)
+    bins = quantized[..., 0] * 64 + quantized[..., 1] * 8 + quantized[..., 2]
+    counts = np.sort(np.bincount(bins.ravel(), minlength=512))[::-1]
+    coverage = np.cumsum(counts) / counts.sum()
+    palette_size = int(np.searchsorted(coverage, 0.9) + 1)
+
+    # Hasler & Suesstrunk colorfulness
+    rg = rgb[..., 0] - rgb[..., 1]
+    yb = 0.5 * (rgb[..., 0] + rgb[..., 1]) - rgb[..., 2]
+    colorfulness = float(
+        np.hypot(rg.std(), yb.std()) + 0.3 * np.hypot(rg.mean(), yb.mean())
+    )
+
+    # Contrast: RMS and robust dynamic range
+    low, high = np.percentile(gray, [2, 98])
+
+    # Whitespace: pixels close to the background tone (median of the border)
+    border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    ink = np.abs(gray - np.median(border)) > 0.12
+    whitespace_ratio = float(1.0 - ink.mean())
+
+    # Margins: share of the card outside the bounding box of all ink
+    rows, cols = np.flatnonzero(ink.any(axis=1)), np.flatnonzero(ink.any(axis=0))
+    if rows.size and cols.size:
+        margin_ratio = 1.0 - (
+            (rows[-1] - rows[0] + 1) * (cols[-1] - cols[0] + 1) / (height * width)
+        )
+    else:
+        margin_ratio = 1.0
+
+    # Edge density: share of pixels with a strong central-difference gradient
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    gy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    edge_density = float((np.hypot(gx, gy) > 0.2).mean())
+
+    # Symmetry: 1 - mean absolute difference to the mirrored image
+    symmetry_horizontal = float(1.0 - np.abs(gray - gray[:, ::-1]).mean())
+    symmetry_vertical = float(1.0 - np.abs(gray - gray[::-1, :]).mean())
+
+    return {
+        "palette_size": palette_size,
+        "colorfulness": round(colorfulness, 4),
+        "mean_brightness": round(float(gray.mean()), 4),
+        "rms_contrast": round(float(gray.std()), 4),
+        "dynamic_range": round(float(high - low), 4),
+        "whitespace_ratio": round(whitespace_ratio, 4),
+        "margin_ratio": round(float(margin_ratio), 4),
+        "edge_density": round(edge_density, 4),
+        "symmetry_horizontal": round(symmetry_horizontal, 4),
+        "symmetry_vertical": round(symmetry_vertical, 4),
+    }
+
+
+def provisional_psycho_score(features: Dict[str, float]) -> float:
+    """Instant 0-10 estimate from design features, shown while Gemini thinks
+
+    Rewards what Patrick rewards: restraint (few colors, calm edges), generous
+    whitespace, crisp contrast and balance.
+    """
+
+    def closeness(value: float, ideal: float, tolerance: float) -> float:
+        return max(0.0, 1.0 - abs(value - ideal) / tolerance)
+
+    restraint = closeness(features["palette_size"], 3, 10)
+    calm = closeness(features["colorfulness"], 0.05, 0.4)
+    whitespace = closeness(features["whitespace_ratio"], 0.8, 0.5)
+    margins = closeness(features["margin_ratio"], 0.35, 0.45)
+    contrast = min(1.0, features["dynamic_range"] / 0.8)
+    clean_edges = closeness(features["edge_density"], 0.04, 0.15)
+    balance = (features["symmetry_horizontal"] + features["symmetry_vertical"]) / 2
+
+    score = 10 * (
+        0.15 * restraint
+        + 0.10 * calm
+        + 0.20 * whitespace
+        + 0.10 * margins
+        + 0.20 * contrast
+        + 0.10 * clean_edges
+        + 0.15 * balance
+    )
+    return round(min(10.0, max(0.0, score)), 1)
+
+
+def describe_design_features(features: Dict[str, float]) -> str:
+    """Measured features as a short hint appended to the Gemini prompt"""
+    return (
+        "Measured design signals (0-1 unless noted): "
+        + ", ".join(f"{name}={value}" for name, value in features.items())
+        + ". Use them to ground your judgement, but trust what you see."
+    )
+
+
 # Create global instance
 image_processor = ImageProcessor()
@@ -0,0 +1,128 @@
+import copy
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional, TextIO
+import orjson
+from config.settings import settings
+from utils.metrics import metrics
+
+# Set per request by the middleware in main.py; copied into tasks and to_thread calls
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+log_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+# Attributes of every LogRecord; anything else was passed through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+    "request_id",
+}
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+
+def sample(path: str) -> bool:
+    """Whether a request to path logs below WARNING (see LOG_SAMPLE_RATES)"""
+    rate = settings.LOG_SAMPLE_RATES.get(path.rstrip("/") or "/", 1.0)
+    return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with extra= fields at the top level"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the current request ID and drops unsampled chatter
+
+    Runs in the logging caller's context, where the request's contextvars are.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return record.levelno >= logging.WARNING or log_sampled.get()
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread; never blocks the event loop"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve what depends on the caller now; formatting happens in the writer
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("logging.dropped")
+
+
+class LogWriter:
+    """Structured logging for the whole process, written by a background thread
+
+    Every logger propagates to the root handler, which only tags and queues
+    records; a QueueListener thread formats them (JSON by default) and does
+    the blocking write. When the queue is full records are dropped and
+    counted rather than stalling requests.
+    """
+
+    def __init__(self):
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._handler: Optional[BackgroundQueueHandler] = None
+
+    def start(self, stream: Optional[TextIO] = None, level: Optional[str] = None) -> None:
+        if self._listener is not None:
+            return
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        if settings.LOG_FORMAT == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        self._handler = BackgroundQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE))
+        self._handler.addFilter(RequestContextFilter())
+        root = logging.getLogger()
+        root.addHandler(self._handler)
+        root.setLevel(level or settings.LOG_LEVEL)
+
+        self._listener = logging.handlers.QueueListener(self._handler.queue, output)
+        self._listener.start()
+
+    def stop(self) -> None:
+        """Write out everything queued, then detach"""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        logging.getLogger().removeHandler(self._handler)
+        self._listener = self._handler = None
+
+
+# Create global instance
+log_writer = LogWriter()
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, List, Optional
+from config.settings import settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Blocked calls kept for inspection (benchmarks, debugging)
+RECENT_BLOCKS = 50
+
+
+class BlockedCall:
+    """One stretch of time in which the event loop ran no callbacks"""
+
+    __slots__ = ("duration", "stack")
+
+    def __init__(self, duration: float, stack: str):
+        self.duration = duration  # seconds
+        self.stack = stack  # of the loop thread, once the threshold had passed
+
+    def __repr__(self) -> str:
+        return f"BlockedCall({self.duration * 1000:.0f} ms)\n{self.stack}"
+
+
+class LoopMonitor:
+    """Event-loop lag percentiles, and optionally what blocked the loop
+
+    A task sleeps LOOP_LAG_INTERVAL at a time and records how late it wakes
+    up in the event_loop.lag histogram: time the loop spent running other
+    callbacks instead of this one. With LOOP_BLOCK_DEBUG a watchdog thread
+    also pings the loop; when a ping is not answered within
+    LOOP_BLOCK_THRESHOLD_MS it captures the stack of the loop thread, which
+    is then inside the synchronous call holding it up, and logs it once the
+    loop is free again.
+    """
+
+    def __init__(self):
+        self.blocked_count = 0
+        self.recent_blocks: Deque[BlockedCall] = deque(maxlen=RECENT_BLOCKS)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    async def start(self) -> None:
+        if self._task is not None or self._watchdog is not None:
+            return
+        loop = asyncio.get_running_loop()
+        if settings.LOOP_LAG_INTERVAL > 0:
+            self._task = asyncio.create_task(self._sample(settings.LOOP_LAG_INTERVAL))
+        if settings.LOOP_BLOCK_DEBUG:
+            self._stopping.clear()
+            self._watchdog = threading.Thread(
+                target=self._watch,
+                args=(loop, threading.get_ident(), settings.LOOP_BLOCK_THRESHOLD_MS / 1000),
+                name="loop-watchdog",
+                daemon=True,
+            )
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._stopping.set()
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    def blocks_since(self, count: int) -> List[BlockedCall]:
+        """Blocked calls recorded after blocked_count was `count` (newest last)"""
+        new = self.blocked_count - count
+        return list(self.recent_blocks)[-new:] if new > 0 else []
+
+    async def _sample(self, interval: float) -> None:
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            metrics.observe("event_loop.lag", max(time.perf_counter() - expected, 0.0))
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int, threshold: float) -> None:
+        """Watchdog thread: ping the loop and catch it when it does not answer"""
+        while not self._stopping.is_set():
+            answered = threading.Event()
+            sent = time.perf_counter()
+            try:
+                loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:  # Loop closed
+                return
+            if not answered.wait(threshold):
+                frame = sys._current_frames().get(loop_thread)
+                stack = "".join(traceback.format_stack(frame)) if frame else ""
+                # Wait out the block to know how long it was
+                while not answered.wait(threshold) and not self._stopping.is_set():
+                    pass
+                self._record(BlockedCall(time.perf_counter() - sent, stack))
+            self._stopping.wait(threshold / 2)
+
+    def _record(self, block: BlockedCall) -> None:
+        self.blocked_count += 1
+        self.recent_blocks.append(block)
+        metrics.incr("event_loop.blocked")
+        metrics.observe("event_loop.blocked_duration", block.duration)
+        logger.warning(
+            "event loop blocked",
+            extra={"blocked_ms": round(block.duration * 1000, 1), "stack": block.stack},
+        )
+
+
+# Create global instance
+loop_monitor = LoopMonitor()
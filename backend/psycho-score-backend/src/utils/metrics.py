@@ -0,0 +1,81 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator
+
+
+class Histogram:
+    """Rolling window of observations with percentile summaries"""
+
+    def __init__(self, window: int = 2048):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p: float) -> float:
+        """Return the p-th percentile (0-100) of the current window"""
+        if not self.values:
+            return 0.0
+        ordered = sorted(self.values)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self, percentiles: Iterable[float] = (50, 90, 99)) -> dict:
+        data = {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+        }
+        for p in percentiles:
+            data[f"p{p:g}"] = self.percentile(p)
+        return data
+
+
+class MetricsRegistry:
+    """In-process counters and latency histograms, exported on /metrics"""
+
+    def __init__(self):
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def histogram(self, name: str) -> Histogram:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+        return self.histograms[name]
+
+    def observe(self, name: str, value: float) -> None:
+        self.histogram(name).observe(value)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Record the duration of the block (in seconds) in histogram `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "histograms": {
+                name: histogram.summary()
+                for name, histogram in self.histograms.items()
+            },
+        }
+
+
+# Create global instance
+metrics = MetricsRegistry()
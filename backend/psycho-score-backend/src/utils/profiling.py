@@ -0,0 +1,180 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+from types import FrameType
+from typing import List, Optional
+
+# Frames are shown relative to this, so stacks from different pods merge
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    if path.startswith(SRC_DIR):
+        path = os.path.relpath(path, SRC_DIR)
+    else:
+        path = os.path.basename(path)
+    # co_qualname is new in Python 3.11
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({path}:{frame.f_lineno})"
+
+
+def _collapse(frame: Optional[FrameType]) -> List[str]:
+    """Frame labels from the outermost call to the innermost"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _awaiting(coro, depth: int) -> List[str]:
+    """Where a suspended coroutine is waiting, following its awaits inwards"""
+    labels = []
+    while coro is not None and len(labels) < depth:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return labels
+
+
+def sample_stacks(seconds: float, interval: float) -> str:
+    """Sample every thread's stack for `seconds`, in collapsed-stack format
+
+    One line per distinct stack, `thread;outer;...;inner count`, as read by
+    flamegraph.pl, speedscope and inferno. Blocks the calling thread, so run
+    it with asyncio.to_thread; its own thread is left out.
+    """
+    own = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != own:
+                stack = [names.get(ident, str(ident))] + _collapse(frame)
+                counts[";".join(stack)] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class MemoryTracer:
+    """tracemalloc snapshots, diffed against a baseline to find growth"""
+
+    # Allocations made by tracemalloc itself and by imports are noise here
+    IGNORE = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    )
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.baseline_at: Optional[float] = None
+
+    def start(self, frames: int) -> None:
+        """Start tracing (if not already) and take the baseline snapshot"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.reset()
+
+    def reset(self) -> None:
+        self.baseline = self._snapshot()
+        self.baseline_at = time.time()
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.baseline = self.baseline_at = None
+
+    def diff(self, key_type: str, limit: int, match: Optional[str] = None) -> List[dict]:
+        """Largest changes since the baseline, optionally only where a frame matches"""
+        snapshot = self._snapshot()
+        stats = snapshot.compare_to(self.baseline, key_type)
+        if match:
+            stats = [
+                stat for stat in stats
+                if any(match in frame.filename for frame in stat.traceback)
+            ]
+        return [
+            {
+                "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size_kb": round(stat.size / 1024, 1),
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "count": stat.count,
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[:limit]
+        ]
+
+    def status(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_mb": round(current / (1024 * 1024), 2),
+            "peak_traced_mb": round(peak / (1024 * 1024), 2),
+            "baseline_at": self.baseline_at,
+        }
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self.IGNORE)
+
+
+class TaskTracker:
+    """Remembers when each asyncio task was created, to report task ages
+
+    Installs a task factory on the loop; tasks created before that have no
+    known age.
+    """
+
+    def __init__(self):
+        self._created: "weakref.WeakKeyDictionary[asyncio.Task, float]" = weakref.WeakKeyDictionary()
+        self._installed = False
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._installed:
+            return
+        previous = loop.get_task_factory()
+
+        def factory(loop, coro, **kwargs):
+            if previous is None:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            else:
+                task = previous(loop, coro, **kwargs)
+            self._created[task] = time.monotonic()
+            return task
+
+        loop.set_task_factory(factory)
+        self._installed = True
+
+    def describe(self, stack_depth: int) -> List[dict]:
+        """Every pending task on the running loop, oldest first"""
+        now = time.monotonic()
+        tasks = []
+        for task in asyncio.all_tasks():
+            created = self._created.get(task)
+            coro = task.get_coro()
+            tasks.append({
+                "name": task.get_name(),
+                "coro": getattr(coro, "__qualname__", repr(coro)),
+                "age_s": round(now - created, 3) if created is not None else None,
+                "awaiting": _awaiting(coro, stack_depth),
+            })
+        # Unknown ages are tasks from before install(), so the oldest
+        tasks.sort(key=lambda task: float("inf") if task["age_s"] is None else task["age_s"], reverse=True)
+        return tasks
+
+
+# Create global instances
+memory_tracer = MemoryTracer()
+task_tracker = TaskTracker()
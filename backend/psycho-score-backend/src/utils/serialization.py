@@ -0,0 +1,60 @@
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+import orjson
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+# Same options as fastapi.responses.ORJSONResponse
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps(value) -> bytes:
+    """Serialize a response dict (or NDJSON event) with orjson"""
+    return orjson.dumps(value, option=ORJSON_OPTIONS)
+
+
+def parse_fields(
+    fields: Optional[str], model: Type[BaseModel]
+) -> Optional[Tuple[str, ...]]:
+    """Field paths from a ?fields=a,b.c list, checked against the response model
+
+    None means every field. Only the top-level name of a dotted path is
+    checked; nested dicts may hold whatever the model allows.
+    """
+    if fields is None:
+        return None
+    paths = tuple(path.strip() for path in fields.split(",") if path.strip())
+    unknown = sorted({path.split(".")[0] for path in paths} - set(model.model_fields))
+    if not paths or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown) or '(none given)'}. "
+            f"Available: {', '.join(model.model_fields)}",
+        )
+    return paths
+
+
+def wants_field(fields: Optional[Iterable[str]], name: str) -> bool:
+    """Whether a top-level field is part of the selection"""
+    return fields is None or any(path.split(".")[0] == name for path in fields)
+
+
+def select_fields(data: dict, fields: Iterable[str]) -> dict:
+    """The parts of data named by field paths, keeping data's key order"""
+    nested: Dict[str, List[str]] = {}
+    whole = set()
+    for path in fields:
+        head, _, rest = path.partition(".")
+        if rest:
+            nested.setdefault(head, []).append(rest)
+        else:
+            whole.add(head)
+
+    selected = {}
+    for key, value in data.items():
+        if key in whole:
+            selected[key] = value
+        elif key in nested:
+            selected[key] = (
+                select_fields(value, nested[key]) if isinstance(value, dict) else value
+            )
+    return selected